@@ -0,0 +1,242 @@
+"""按 国家×品类 的日销售额/订单数在线异常检测
+
+每个序列维护指数加权的水平、残差方差和按星期的季节偏移。新交易追加进来时
+按天增量处理：先用当前状态给当天打分（残差除以加权标准差得到 z 值），再用
+当天的数据更新状态，不需要在全部历史上重新拟合。最新的一天可能还没结束，
+先暂存，等更晚日期的数据到来（或调用 flush）后再处理。
+"""
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+METRICS = ['Revenue', 'Orders']
+SERIES_COLUMNS = ['Country', 'Product_Category']
+
+
+def _days(grouped):
+    """汇总表索引中的日期（datetime64[D] 数组）"""
+    return grouped.index.get_level_values('Day').to_numpy().astype('datetime64[D]')
+
+
+def _weekday(day):
+    """datetime64[D] 转为星期（周一为 0）；1970-01-01 是周四"""
+    return int((day.astype(np.int64) + 3) % 7)
+
+
+class AnomalyMonitor:
+    """增量更新的异常监控器
+
+    alpha 为水平和方差的平滑系数，season_alpha 为星期季节偏移的平滑系数；
+    序列观测满 warmup_days 天后才开始报警，|z| 超过 threshold 记为异常。
+    异常值只以 threshold 倍标准差为上限参与状态更新，避免一次异常拉偏基线。
+
+    稀疏序列（每天只有零星几单）的加权方差会被连续的 0 压得很小，因此方差
+    不低于复合泊松下限：订单数方差 >= 期望订单数，销售额方差 >= 期望订单数
+    × 客单价平方均值（客单价矩由已处理过的交易逐日累计）。
+    """
+
+    def __init__(self, alpha=0.1, season_alpha=0.2, threshold=3.5, warmup_days=28,
+                 history_days=180):
+        self.alpha = alpha
+        self.season_alpha = season_alpha
+        self.threshold = threshold
+        self.warmup_days = warmup_days
+
+        self.series = {}
+        self.keys = []
+        self._lookup = pd.MultiIndex.from_tuples([], names=SERIES_COLUMNS)
+        n_metrics = len(METRICS)
+        self.level = np.zeros((0, n_metrics))
+        self.var = np.zeros((0, n_metrics))
+        self.season = np.zeros((0, 7, n_metrics))
+        self.n_obs = np.zeros(0, dtype=np.int64)
+
+        self.last_day = None
+        self.pending = None
+        self.anomalies = []
+        # 最近 history_days 天每个序列的实际值、基线和标准差，用于画图
+        self.history = deque(maxlen=history_days)
+        self.days_processed = 0
+        self.rows_seen = 0
+        self.last_row_id = None
+        self.late_rows = 0
+        # 已处理交易的客单价一阶、二阶矩累计 (n, Σa, Σa²)
+        self.ticket_moments = np.zeros(3)
+        self._lock = threading.RLock()
+
+    def _register(self, keys):
+        """登记新出现的序列，状态数组随之扩展，返回各行对应的序列编号"""
+        keys = keys.droplevel('Day') if 'Day' in keys.names else keys
+        unique = keys.unique()
+        new_keys = [k for k in unique.tolist() if k not in self.series]
+        if new_keys:
+            self._grow(new_keys)
+        return self._lookup.get_indexer(keys)
+
+    def _grow(self, new_keys):
+        for key in new_keys:
+            self.series[key] = len(self.keys)
+            self.keys.append(key)
+        self._lookup = pd.MultiIndex.from_tuples(self.keys, names=SERIES_COLUMNS)
+        n_new = len(new_keys)
+        n_metrics = len(METRICS)
+        self.level = np.vstack([self.level, np.zeros((n_new, n_metrics))])
+        self.var = np.vstack([self.var, np.zeros((n_new, n_metrics))])
+        self.season = np.concatenate([self.season, np.zeros((n_new, 7, n_metrics))])
+        self.n_obs = np.concatenate([self.n_obs, np.zeros(n_new, dtype=np.int64)])
+
+    def _aggregate(self, df):
+        """交易按 (日期, 国家, 品类) 汇总为销售额和订单数"""
+        frame = pd.DataFrame({
+            'Day': df['Transaction_Date'].to_numpy().astype('datetime64[D]'),
+            'Country': df['Country'].to_numpy(),
+            'Product_Category': df['Product_Category'].to_numpy(),
+            'Revenue': df['Purchase_Amount'].to_numpy(np.float64),
+        })
+        frame['Revenue_Sq'] = frame['Revenue'] ** 2
+        if self.last_day is not None:
+            late = frame['Day'].to_numpy() <= self.last_day
+            self.late_rows += int(late.sum())
+            frame = frame[~late]
+        return frame.groupby(['Day'] + SERIES_COLUMNS, sort=False, observed=True).agg(
+            Revenue=('Revenue', 'sum'), Orders=('Revenue', 'size'), Revenue_Sq=('Revenue_Sq', 'sum')
+        ).astype(np.float64)
+
+    def update(self, df):
+        """处理一批新交易，返回本批新发现的异常记录"""
+        with self._lock:
+            n_before = len(self.anomalies)
+            if len(df):
+                self.rows_seen += len(df)
+                if 'Transaction_ID' in df.columns:
+                    self.last_row_id = df['Transaction_ID'].iloc[-1]
+                grouped = self._aggregate(df)
+                if self.pending is not None:
+                    grouped = pd.concat([self.pending, grouped]).groupby(level=[0, 1, 2], sort=False).sum()
+                if len(grouped):
+                    days = _days(grouped)
+                    open_day = days.max()
+                    self.pending = grouped[days == open_day]
+                    self._process(grouped[days < open_day], end_day=open_day)
+            return self.anomalies[n_before:]
+
+    def flush(self):
+        """把暂存的最新一天当作已结束的一天处理"""
+        with self._lock:
+            n_before = len(self.anomalies)
+            if self.pending is not None and len(self.pending):
+                open_day = _days(self.pending).max()
+                pending, self.pending = self.pending, None
+                self._process(pending, end_day=open_day + np.timedelta64(1, 'D'))
+            return self.anomalies[n_before:]
+
+    def catch_up(self, df):
+        """只处理 df 中追加在已处理行之后的新行；已处理部分被改动时返回 False"""
+        with self._lock:
+            if len(df) < self.rows_seen:
+                return False
+            if self.rows_seen and 'Transaction_ID' in df.columns:
+                if df['Transaction_ID'].iloc[self.rows_seen - 1] != self.last_row_id:
+                    return False
+            self.update(df.iloc[self.rows_seen:])
+            return True
+
+    def _process(self, grouped, end_day):
+        """逐日处理 (last_day, end_day) 之间的每一天，没有交易的序列按 0 计"""
+        if len(grouped):
+            first_day = _days(grouped).min()
+        else:
+            first_day = end_day
+        day = first_day if self.last_day is None else self.last_day + np.timedelta64(1, 'D')
+        if day >= end_day:
+            return
+
+        grouped = grouped.sort_index(level='Day')
+        days = _days(grouped)
+        series_idx = self._register(grouped.index)
+        values = grouped[METRICS].to_numpy()
+        squares = grouped['Revenue_Sq'].to_numpy()
+
+        while day < end_day:
+            lo, hi = np.searchsorted(days, [day, day + np.timedelta64(1, 'D')])
+            x = np.zeros((len(self.keys), len(METRICS)))
+            x[series_idx[lo:hi]] = values[lo:hi]
+            self._step(day, x, squares[lo:hi].sum())
+            day = day + np.timedelta64(1, 'D')
+
+    def _step(self, day, x, revenue_sq):
+        """先打分再更新状态（revenue_sq 为当天所有交易金额的平方和）"""
+        dow = _weekday(day)
+        season = self.season[:, dow]
+        expected = self.level + season
+        n, total, squares = self.ticket_moments
+        mean_ticket = total / n if n else 1.0
+        mean_square = squares / n if n else 1.0
+        # 复合泊松方差下限，期望订单数至少按 1 单计
+        orders = np.maximum(np.maximum(expected[:, 1], self.level[:, 0] / mean_ticket), 1.0)
+        floor = np.column_stack([orders * mean_square, orders])
+        std = np.sqrt(np.maximum(self.var, floor))
+        resid = x - expected
+        z = resid / std
+
+        ready = self.n_obs >= self.warmup_days
+        flagged = ready[:, None] & (np.abs(z) > self.threshold)
+        for s, m in zip(*np.nonzero(flagged)):
+            country, category = self.keys[s]
+            self.anomalies.append({
+                'Date': pd.Timestamp(day),
+                'Country': country,
+                'Product_Category': category,
+                'Metric': METRICS[m],
+                'Value': float(x[s, m]),
+                'Expected': float(expected[s, m]),
+                'Z': float(z[s, m]),
+                'Direction': 'spike' if z[s, m] > 0 else 'drop',
+            })
+        self.history.append((day, x, expected, std))
+
+        # 状态更新：新序列用首个观测初始化，之后做指数加权
+        new = self.n_obs == 0
+        limit = self.threshold * std
+        x_eff = np.where(ready[:, None], expected + np.clip(resid, -limit, limit), x)
+        dev = x_eff - self.level - season
+        self.level = np.where(new[:, None], x, self.level + self.alpha * dev)
+        self.var = np.where(new[:, None], 0.0, (1 - self.alpha) * (self.var + self.alpha * dev ** 2))
+        self.season[:, dow] = np.where(new[:, None], 0.0,
+                                       season + self.season_alpha * (x_eff - self.level - season))
+        self.n_obs += 1
+        self.days_processed += 1
+        self.ticket_moments += [x[:, 1].sum(), x[:, 0].sum(), revenue_sq]
+        self.last_day = day
+
+    def anomalies_frame(self, since=None):
+        """异常记录表，可只取 since 之后的记录"""
+        with self._lock:
+            frame = pd.DataFrame(self.anomalies, columns=[
+                'Date', 'Country', 'Product_Category', 'Metric', 'Value', 'Expected', 'Z', 'Direction'])
+        if since is not None:
+            frame = frame[frame['Date'] >= pd.Timestamp(since)]
+        return frame
+
+    def series_history(self, key, metric='Revenue'):
+        """单个序列最近 history_days 天的实际值、基线和标准差"""
+        s = self.series[key]
+        m = METRICS.index(metric)
+        with self._lock:
+            rows = [(pd.Timestamp(day), x[s, m], expected[s, m], std[s, m])
+                    for day, x, expected, std in self.history if s < len(x)]
+        return pd.DataFrame(rows, columns=['Date', 'Value', 'Expected', 'Std'])
+
+    def stats(self):
+        """监控状态概要"""
+        with self._lock:
+            return {
+                'series': len(self.keys),
+                'days_processed': self.days_processed,
+                'last_day': None if self.last_day is None else pd.Timestamp(self.last_day),
+                'anomalies': len(self.anomalies),
+                'rows_seen': self.rows_seen,
+                'late_rows': self.late_rows,
+            }
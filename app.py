@@ -7,6 +7,83 @@ from plotly.subplots import make_subplots
 import seaborn as sns
 import matplotlib.pyplot as plt
 from itertools import combinations
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from rfm import compute_rfm
+from customer_lookup import build_customer_index, prefix_search, customer_profile
+from figure_cache import FigureCache, make_key
+from binned_regression import RegressionAccumulator, binned_regression_figure
+from daily_index import build_daily_index, compare_periods, rolling, resample
+from anomaly import AnomalyMonitor
+from seq_kernels import sort_by_user, user_sequence_metrics
+from clv import HAS_SCIPY as HAS_CLV, fit_clv, score_clv
+from payment_transitions import payment_transitions, transition_matrix, first_latest_matrix, stickiness, user_counts
+from next_category import NextCategoryModel, encode_sequences, holdout_evaluation
+from similar_customers import SimilarCustomerIndex
+from export_stream import FILTER_COLUMNS, HAS_PYARROW, ExportServer, filtered_chunks, frame_chunks
+from clustering import HAS_SKLEARN as HAS_CLUSTERING, customer_features, describe_centroids, fit_customer_clusters, frame_batches
+from sampling import build_progressive_sample, estimate_kpis
+from ingest import get_dataset_version, load_transactions
+from data_profile import ensure_profile
+from datasets import DatasetCache, discover_datasets
+from shared_dataset import attach_rollup, attach_when_ready
+from metrics import MetricsRegistry, MetricsServer, process_metrics
+from disk_cache import DiskCache, content_hash, source_version
+from tiering import TIERS_FILE
+from country_value import DEFAULT_M_GRID, bootstrap_ranks, country_units, m_sweep, value_scores
+from concentration import DIMENSIONS, REACH_SHARES, TOP_PERCENTS, concentration, group_totals, summary_row
+
+logger = logging.getLogger(__name__)
+
+# 数据集缓存（含派生聚合）内存预算 (MB)，可通过环境变量 DATASET_CACHE_MB 调整
+DATASET_CACHE_MB = int(os.environ.get("DATASET_CACHE_MB", "2048"))
+
+# 多进程部署：设置 SHARED_DATASET_DIR 后从发布进程（python shared_dataset.py）的共享存储映射数据集，
+# 最多等待 SHARED_DATASET_WAIT 秒，仍未发布当前版本时自行读取 CSV
+SHARED_DATASET_DIR = os.environ.get("SHARED_DATASET_DIR")
+SHARED_DATASET_WAIT = float(os.environ.get("SHARED_DATASET_WAIT", "30"))
+
+# 磁盘结果缓存：数据集快照、派生结果和图表规格按数据内容哈希和代码版本保存，重启后直接命中；
+# DISK_CACHE_MB 为总大小预算，设为 0 关闭
+DISK_CACHE_DIR = os.environ.get("DISK_CACHE_DIR", os.path.join(".cache", "results"))
+DISK_CACHE_MB = int(os.environ.get("DISK_CACHE_MB", "4096"))
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 运行指标：Prometheus 文本格式的 /metrics 端点（端口为 0 时不启动）。同一台机器上的多个进程从
+# METRICS_PORT 起依次尝试 METRICS_PORT_SPAN 个端口，各自监听第一个空闲端口，并在 ecommerce_worker_info
+# 中报告 pid 和实际端口
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+METRICS_PORT_SPAN = int(os.environ.get("METRICS_PORT_SPAN", "16"))
+
+# 图表缓存内存预算 (MB)，可通过环境变量 FIGURE_CACHE_MB 调整
+FIGURE_CACHE_MB = int(os.environ.get("FIGURE_CACHE_MB", "64"))
+
+# 渐进式渲染：交易数不少于 PROGRESSIVE_MIN_ROWS 的数据集先用约 PROGRESSIVE_SAMPLE_ROWS 行的样本渲染，
+# 全量精确结果在后台计算完成后替换
+PROGRESSIVE_MIN_ROWS = int(os.environ.get("PROGRESSIVE_MIN_ROWS", "2000000"))
+PROGRESSIVE_SAMPLE_ROWS = int(os.environ.get("PROGRESSIVE_SAMPLE_ROWS", "200000"))
+
+# 流式导出服务：默认只监听本机（服务没有登录，只靠链接中的 token 保护），端口为 0 时不启动；
+# 多个进程从 EXPORT_PORT 起依次尝试 EXPORT_PORT_SPAN 个端口，下载链接指向本进程实际监听的端口。
+# 远程访问需显式开启：经反向代理转发时设置 EXPORT_BASE_URL（其中的 {port} 替换为该端口），
+# 或设置 EXPORT_HOST 监听其他网卡，此时链接默认取浏览器访问仪表板时的主机名
+EXPORT_HOST = os.environ.get("EXPORT_HOST", "127.0.0.1")
+EXPORT_PORT = int(os.environ.get("EXPORT_PORT", "8765"))
+EXPORT_PORT_SPAN = int(os.environ.get("EXPORT_PORT_SPAN", "16"))
+EXPORT_BASE_URL = os.environ.get("EXPORT_BASE_URL", "")
+
+# 国家价值评分的自助法重抽次数
+COUNTRY_BOOTSTRAP = int(os.environ.get("COUNTRY_BOOTSTRAP", "500"))
+
+# 按用户汇总的模块使用用户样本（保留被抽中用户的全部交易），其余模块使用 国家×品类 分层交易样本
+# 地区分析的国家价值评分、数据概览的客户集中度同样按用户汇总，需要完整的用户交易
+USER_SAMPLE_MODULES = {"👥 用户分析", "💳 支付分析", "🎯 用户行为画像", "🛒 用户购买偏好", "🌍 地区分析", "📈 数据概览"}
 
 # 设置页面配置
 st.set_page_config(
@@ -16,8 +93,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 自定义CSS样式
-st.markdown("""
+# 自定义CSS样式（离线报告 report.py 复用同一份样式）
+APP_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -55,35 +132,428 @@ st.markdown("""
         font-size: 0.9rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(APP_CSS, unsafe_allow_html=True)
+
+@st.cache_resource
+def get_dataset_cache():
+    """进程内共享的数据集缓存"""
+    return DatasetCache(DATASET_CACHE_MB * 1024 * 1024)
 
-@st.cache_data
-def load_data():
+@st.cache_resource
+def get_disk_cache():
+    """进程内共享的磁盘缓存；已关闭或目录不可写时返回 None"""
+    if DISK_CACHE_MB <= 0:
+        return None
+    try:
+        # 分层定义改变后预处理结果（年龄分组）随之失效
+        return DiskCache(DISK_CACHE_DIR, DISK_CACHE_MB * 1024 * 1024, source_version(APP_DIR, [TIERS_FILE]))
+    except OSError:
+        return None
+
+def _load_snapshot(path):
+    """读取并预处理 CSV；磁盘缓存中有同样内容的预处理快照时直接读取快照"""
+    disk = get_disk_cache()
+    if disk is None:
+        return load_transactions(path), 'csv'
+    key = ('dataset', content_hash(path))
+    df = disk.get(key)
+    if df is not None:
+        # 内容相同但文件可能被复制或 touch 过，版本以当前文件为准
+        df.attrs['dataset_version'] = get_dataset_version(path)
+        return df, 'disk'
+    df = load_transactions(path)
+    disk.put(key, df)
+    return df, 'csv'
+
+def _load_and_profile(path):
+    """读取并预处理数据（有共享存储时直接映射），同时生成数据画像边车文件"""
+    started = time.perf_counter()
+    df = None
+    if SHARED_DATASET_DIR:
+        df = attach_when_ready(SHARED_DATASET_DIR, path, SHARED_DATASET_WAIT)
+    source = 'shared'
+    if df is None:
+        df, source = _load_snapshot(path)
+    if get_disk_cache() is not None:
+        df.attrs['content_hash'] = content_hash(path)
+    ensure_profile(df, path)
+    get_metrics()['load_seconds'].observe(time.perf_counter() - started,
+                                          dataset=os.path.splitext(os.path.basename(path))[0], source=source)
+    return df
+
+def collect_cache_metrics():
+    """抓取时读取数据集缓存、图表缓存和各数据集的版本与新鲜度"""
+    dataset_stats = get_dataset_cache().stats()
+    figure_stats = get_figure_cache().stats()
+    datasets = get_dataset_cache().describe()
+    now = time.time()
+    families = []
+    for cache, stats in (('dataset', dataset_stats), ('figure', figure_stats)):
+        lookups = stats['hits'] + stats['misses']
+        families += [
+            (f'ecommerce_{cache}_cache_bytes', 'gauge', '缓存占用 (字节)', [({}, stats['bytes'])]),
+            (f'ecommerce_{cache}_cache_max_bytes', 'gauge', '缓存内存预算 (字节)', [({}, stats['max_bytes'])]),
+            (f'ecommerce_{cache}_cache_hits_total', 'counter', '缓存命中次数', [({}, stats['hits'])]),
+            (f'ecommerce_{cache}_cache_misses_total', 'counter', '缓存未命中次数', [({}, stats['misses'])]),
+            (f'ecommerce_{cache}_cache_evictions_total', 'counter', '缓存淘汰次数', [({}, stats['evictions'])]),
+            (f'ecommerce_{cache}_cache_hit_ratio', 'gauge', '进程启动以来的缓存命中率',
+             [({}, stats['hits'] / lookups if lookups else 0.0)]),
+        ]
+    disk = get_disk_cache()
+    if disk is not None:
+        disk_stats = disk.stats()
+        families += [
+            ('ecommerce_disk_cache_bytes', 'gauge', '磁盘缓存占用 (字节)', [({}, disk_stats['bytes'])]),
+            ('ecommerce_disk_cache_max_bytes', 'gauge', '磁盘缓存大小预算 (字节)', [({}, disk_stats['max_bytes'])]),
+            ('ecommerce_disk_cache_entries', 'gauge', '磁盘缓存文件数', [({}, disk_stats['entries'])]),
+            ('ecommerce_disk_cache_hits_total', 'counter', '磁盘缓存命中次数', [({}, disk_stats['hits'])]),
+            ('ecommerce_disk_cache_misses_total', 'counter', '磁盘缓存未命中次数', [({}, disk_stats['misses'])]),
+            ('ecommerce_disk_cache_evictions_total', 'counter', '磁盘缓存淘汰次数', [({}, disk_stats['evictions'])]),
+            ('ecommerce_disk_cache_hit_ratio', 'gauge', '进程启动以来的磁盘缓存命中率', [({}, disk_stats['hit_ratio'])]),
+        ]
+    derived_lookups = dataset_stats['derived_hits'] + dataset_stats['derived_misses']
+    families += [
+        ('ecommerce_figure_cache_entries', 'gauge', '已缓存的图表数', [({}, figure_stats['entries'])]),
+        ('ecommerce_derived_cache_hit_ratio', 'gauge', '派生结果（聚合、索引、模型）缓存命中率',
+         [({}, dataset_stats['derived_hits'] / derived_lookups if derived_lookups else 0.0)]),
+        ('ecommerce_dataset_info', 'gauge', '已加载数据集的版本（取值恒为 1）',
+         [({'dataset': name, 'version': info['version'], 'shared': str(info['shared']).lower()}, 1)
+          for name, info in datasets.items()]),
+        ('ecommerce_dataset_rows', 'gauge', '已加载数据集的交易行数',
+         [({'dataset': name}, info['rows']) for name, info in datasets.items()]),
+        ('ecommerce_dataset_bytes', 'gauge', '数据集及其派生结果占用的进程内存 (字节)',
+         [({'dataset': name}, info['bytes']) for name, info in datasets.items()]),
+        ('ecommerce_dataset_loaded_timestamp_seconds', 'gauge', '数据集加载时间 (Unix 时间戳)',
+         [({'dataset': name}, info['loaded_at']) for name, info in datasets.items()]),
+    ]
+    # 数据新鲜度：数据文件最后修改距今的秒数（文件已删除时不报告）
+    ages = []
+    for name, info in datasets.items():
+        try:
+            ages.append(({'dataset': name}, now - os.path.getmtime(info['path'])))
+        except OSError:
+            pass
+    families.append(('ecommerce_dataset_age_seconds', 'gauge', '数据文件最后修改距今 (秒)', ages))
+    return families
+
+@st.cache_resource
+def get_metrics():
+    """进程内的运行指标（直方图和抓取时读取的采集函数）"""
+    registry = MetricsRegistry()
+    metrics = {
+        'registry': registry,
+        'module_seconds': registry.histogram(
+            'ecommerce_module_render_seconds', '分析模块一次完整渲染的耗时 (秒)', ('module', 'view')),
+        'load_seconds': registry.histogram(
+            'ecommerce_load_data_seconds', '数据集加载（缓存未命中时）的耗时 (秒)', ('dataset', 'source')),
+    }
+    registry.add_collector(collect_cache_metrics)
+    registry.add_collector(process_metrics)
+    return metrics
+
+def start_on_free_port(name, start, host, port, span):
+    """从 port 起依次尝试 span 个端口，返回第一个绑定成功的服务；全部失败时记录警告并返回 None"""
+    last = port + max(span, 1) - 1
+    error = None
+    for candidate in range(port, last + 1):
+        try:
+            return start(host, candidate)
+        except OSError as e:
+            error = e
+    logger.warning("%s 未启动：%s 上的端口 %d-%d 均无法绑定 (%s)", name, host, port, last, error)
+    return None
+
+@st.cache_resource
+def get_metrics_server():
+    """进程内只启动一个 /metrics 服务；端口都被占用或 METRICS_PORT=0 时返回 None（指标照常记录）"""
+    if METRICS_PORT <= 0:
+        return None
+    registry = get_metrics()['registry']
+    server = start_on_free_port('/metrics 服务', lambda host, port: MetricsServer(registry, host, port),
+                                METRICS_HOST, METRICS_PORT, METRICS_PORT_SPAN)
+    if server is not None:
+        registry.add_collector(lambda: [('ecommerce_worker_info', 'gauge', '本进程的 pid 和 /metrics 端口（取值恒为 1）',
+                                         [({'pid': os.getpid(), 'port': server.port}, 1)])])
+    return server
+
+def load_data(dataset_name, path):
     """加载和预处理数据"""
     try:
-        # 读取CSV文件
-        df = pd.read_csv("ecommerce_transactions.csv")
-        
-        # 数据预处理
-        df['Transaction_Date'] = pd.to_datetime(df['Transaction_Date'])
-        df['YearMonth'] = df['Transaction_Date'].dt.to_period('M')
-        df['DayOfWeek'] = df['Transaction_Date'].dt.day_name()
-        df['DayOfMonth'] = df['Transaction_Date'].dt.day
-        
-        # 年龄分组
-        bins = [0, 25, 40, 60, 100]
-        labels = ["Youth (<=25)", "Young Adult (26-40)", "Middle-aged (41-60)", "Senior (60+)"]
-        df['Age_Group'] = pd.cut(df['Age'], bins=bins, labels=labels, right=False)
-        
+        df = get_dataset_cache().get(dataset_name, path, _load_and_profile)
+        # 导入时一并建立按天索引，时间分析页的区间查询直接使用
+        get_daily_index(df)
         return df
         
     except FileNotFoundError:
-        st.error("❌ 找不到数据文件 'ecommerce_transactions.csv'，请确保文件在正确位置")
+        st.error(f"❌ 找不到数据文件 '{path}'，请确保文件在正确位置")
         st.stop()
     except Exception as e:
         st.error(f"❌ 数据加载失败: {str(e)}")
         st.stop()
 
+def dataset_key(df):
+    """数据集名称加版本，用作各类缓存键"""
+    return f"{df.attrs.get('dataset_name')}@{df.attrs.get('dataset_version')}"
+
+def derived(df, key, builder):
+    """取当前数据集的派生结果，与数据集一起计入缓存预算
+
+    渐进式渲染的样本没有自己的缓存条目，其派生结果以 "样本名/键" 记在原数据集下。
+    """
+    name = df.attrs.get('sample_of') or df.attrs.get('dataset_name')
+    cache_key = f"{df.attrs['dataset_name']}/{key}" if df.attrs.get('sample_of') else key
+    return get_dataset_cache().derived(name, cache_key,
+                                      lambda: attach_rollup(df, key, lambda: persisted(df, key, builder)),
+                                      df.attrs.get('dataset_version'))
+
+def persisted(df, key, builder):
+    """按数据内容哈希取磁盘缓存中的派生结果，未命中时调用 builder() 计算并写入"""
+    disk = get_disk_cache()
+    content = df.attrs.get('content_hash')
+    if disk is None or content is None:
+        return builder()
+    return disk.get_or_compute(('derived', content, df.attrs.get('dataset_name'), key), builder)
+
+def load_profile(df):
+    """数据画像（读取边车文件，版本不一致时重新生成）"""
+    return derived(df, 'profile', lambda: ensure_profile(df, df.attrs['dataset_path']))
+
+def get_customer_index(df):
+    """客户姓名索引（每个数据集只构建一次）"""
+    return derived(df, 'customer_index', lambda: build_customer_index(df))
+
+def get_user_metrics(df):
+    """每个用户的订单数、消费额、首购/最近购买日期等顺序指标（RFM 和 CLV 共用）"""
+    return derived(df, 'user_metrics', lambda: user_sequence_metrics(df))
+
+def get_user_order(df):
+    """按 (用户, 日期) 排序的行顺序和用户编码（相邻订单类分析共用）"""
+    return derived(df, 'user_order', lambda: sort_by_user(df))
+
+def get_payment_transitions(df):
+    """各国家相邻订单之间的支付方式转移计数（每个数据版本只计算一次）"""
+    return derived(df, 'payment_transitions', lambda: payment_transitions(df, get_user_order(df)))
+
+def get_category_sequences(df):
+    """按 (用户, 日期) 排序的品类序列与 年龄段×国家 分段编码"""
+    return derived(df, 'category_sequences', lambda: encode_sequences(df, get_user_order(df)))
+
+def get_next_category_model(df):
+    """下一品类马尔可夫模型（每个数据版本只拟合一次）"""
+    return derived(df, 'next_category_model', lambda: NextCategoryModel().fit(get_category_sequences(df)))
+
+def get_next_category_holdout(df):
+    """下一品类预测的留出评估（按时间切分重新拟合一次，复购序列不足时为 None）"""
+    return derived(df, 'next_category_holdout', lambda: holdout_evaluation(get_category_sequences(df)))
+
+def get_product_summary(df):
+    """各产品类别的销量、收入、均价和市场份额，按收入降序"""
+    def build():
+        product_summary = df.groupby('Product_Category').agg({
+            'Transaction_ID': 'count',
+            'Purchase_Amount': ['sum', 'mean']
+        }).reset_index()
+
+        product_summary.columns = ['Product_Category', 'Total_Sales_Volume', 'Total_Revenue', 'Avg_Price']
+        product_summary = product_summary.sort_values('Total_Revenue', ascending=False)
+
+        # 计算市场份额
+        total_revenue = product_summary['Total_Revenue'].sum()
+        product_summary['Market_Share'] = (product_summary['Total_Revenue'] / total_revenue * 100)
+        return product_summary
+    return derived(df, 'product_summary', build)
+
+def get_rfm(df):
+    """RFM 指标、分数和用户细分（每个数据版本只计算一次）"""
+    return derived(df, 'rfm', lambda: compute_rfm(df, get_user_metrics(df)))
+
+def get_clv_params(df):
+    """BG/NBD + Gamma-Gamma 参数（每个数据版本只拟合一次）"""
+    return derived(df, 'clv_params', lambda: fit_clv(get_user_metrics(df)))
+
+def get_clv_scores(df, horizon):
+    """未来 horizon 天的 CLV 打分（参数复用，切换预测期只重新打分）"""
+    return derived(df, f'clv_scores_{horizon}', lambda: score_clv(get_clv_params(df), get_user_metrics(df), horizon))
+
+def get_daily_index(df):
+    """按天的销售额/订单数/新用户数前缀和索引（每个数据集只构建一次）"""
+    return derived(df, 'daily_index', lambda: build_daily_index(df))
+
+def get_country_units(df):
+    """国家价值评分的 (国家, 用户) 级订单数/消费额与各国复购人数（每个数据版本只构建一次）"""
+    return derived(df, 'country_units', lambda: country_units(df, get_user_order(df), get_user_metrics(df)))
+
+def get_country_value(df, m):
+    """平滑参数为 m 时的国家价值评分表"""
+    return derived(df, f'country_value_{m}', lambda: value_scores(get_country_units(df), m))
+
+def get_filter_values(df):
+    """导出筛选项：各分类列排序后的取值（每个数据版本只计算一次）"""
+    return derived(df, 'filter_values',
+                   lambda: {column: sorted(df[column].unique()) for column in FILTER_COLUMNS.values()})
+
+def get_concentration(df, dimension):
+    """某个维度的收入集中度（客户维度直接使用用户指标中的消费额，每个数据版本只计算一次）"""
+    def build():
+        if dimension == 'customers':
+            user_metrics = get_user_metrics(df)
+            return concentration(user_metrics['User_Name'].to_numpy(), user_metrics['Monetary'].to_numpy())
+        return concentration(*group_totals(df, DIMENSIONS[dimension][1]))
+    return derived(df, f'concentration_{dimension}', build)
+
+def get_concentration_summary(df):
+    """各维度的基尼系数、HHI 和 Top X% 贡献对比表"""
+    return pd.DataFrame([summary_row(name, get_concentration(df, dimension))
+                         for dimension, (name, _) in DIMENSIONS.items()])
+
+def get_country_bootstrap(df, m):
+    """平滑参数为 m 时稳健化排名的自助法置信区间（按国家重抽用户 COUNTRY_BOOTSTRAP 次）"""
+    return derived(df, f'country_bootstrap_{m}', lambda: bootstrap_ranks(get_country_units(df), m, COUNTRY_BOOTSTRAP))
+
+@st.cache_resource
+def get_anomaly_monitors():
+    """各数据集的异常监控器，按数据集名称保存，数据版本变化时不丢弃"""
+    return {'lock': threading.Lock(), 'monitors': {}}
+
+def get_anomaly_monitor(df):
+    """数据文件只是追加了新交易时增量处理新行，否则重新从头处理"""
+    registry = get_anomaly_monitors()
+    name = df.attrs.get('dataset_name')
+    with registry['lock']:
+        monitor = registry['monitors'].get(name)
+        if monitor is None or not monitor.catch_up(df):
+            monitor = AnomalyMonitor()
+            monitor.update(df)
+            registry['monitors'][name] = monitor
+    return monitor
+
+def get_progressive_sample(df):
+    """渐进式渲染用的分层交易样本和用户样本（每个数据版本只抽一次）"""
+    return derived(df, 'progressive_sample', lambda: build_progressive_sample(df, PROGRESSIVE_SAMPLE_ROWS))
+
+@st.cache_resource
+def get_exact_jobs():
+    """渐进式渲染中在后台计算全量精确结果的任务"""
+    return {'lock': threading.Lock(), 'pool': ThreadPoolExecutor(max_workers=1, thread_name_prefix='exact'), 'jobs': {}}
+
+def exact_warmups():
+    """各模块在默认控件状态下用到的派生结果（聚合、索引、模型），后台任务按顺序计算"""
+    warmups = {
+        "📈 数据概览": [load_profile, lambda df: get_concentration(df, 'categories')],
+        "👥 用户分析": [create_user_analysis],
+        "🌍 地区分析": [create_geographic_analysis, lambda df: get_country_value(df, 30),
+                      lambda df: get_country_bootstrap(df, 30)],
+        "🛍️ 产品分析": [get_product_summary, lambda df: get_concentration(df, 'categories')],
+        "💳 支付分析": [get_payment_transitions],
+        "📅 时间趋势": [get_daily_index, get_anomaly_monitor],
+        "🎯 用户行为画像": [get_rfm],
+        "🛒 用户购买偏好": [get_next_category_model, get_next_category_holdout],
+    }
+    if HAS_CLUSTERING:
+        warmups["🎯 用户行为画像"].append(lambda df: get_customer_clusters(df, 5))
+    if HAS_CLV:
+        warmups["🎯 用户行为画像"].append(lambda df: get_clv_scores(df, 365))
+    return warmups
+
+def submit_exact_job(df, module):
+    """在后台线程中用全量数据计算模块的派生结果（只调用计算函数，不调用 st 的输出函数）
+
+    全量渲染时这些结果直接命中缓存，只剩由它们生成图表的开销。
+    """
+    def run():
+        for build in exact_warmups().get(module, []):
+            build(df)
+
+    registry = get_exact_jobs()
+    name, version = df.attrs.get('dataset_name'), df.attrs.get('dataset_version')
+    with registry['lock']:
+        job = registry['jobs'].get((name, version, module))
+        if job is None:
+            # 同一数据集旧版本的任务不再需要
+            for key in [k for k in registry['jobs'] if k[0] == name and k[1] != version]:
+                registry['jobs'].pop(key)
+            job = registry['pool'].submit(run)
+            registry['jobs'][(name, version, module)] = job
+    return job
+
+@st.fragment(run_every=1)
+def watch_exact_job(job):
+    """精确结果算完后整页重跑，用全量结果替换近似结果"""
+    if job.done():
+        st.rerun()
+    st.caption("⏳ 正在后台计算全量精确结果，完成后自动替换")
+
+def show_progressive_banner(sample, by_user):
+    """近似结果提示和带 95% 置信区间的 KPI"""
+    if by_user:
+        basis = f"随机抽取的 {sample['user_fraction']:.1%} 用户及其全部交易"
+        fraction = len(sample['users']) / sample['rows']
+    else:
+        basis = f"按国家×品类分层抽取的 {sample['fraction']:.1%} 交易"
+        fraction = sample['fraction']
+    st.info(f"⚡ 当前为近似结果：数据共 {sample['rows']:,} 笔交易，以下图表基于{basis}，"
+            f"其中的计数和合计约为全量的 {fraction:.1%}。")
+
+    kpis = estimate_kpis(sample)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        revenue = kpis['Revenue']
+        st.metric("💰 总销售额 (估计)", f"¥{revenue['estimate']:,.0f}")
+        st.caption(f"95% 区间 ¥{revenue['low']:,.0f} – ¥{revenue['high']:,.0f}")
+    with col2:
+        aov = kpis['AOV']
+        st.metric("💳 客单价 (估计)", f"¥{aov['estimate']:.2f}")
+        st.caption(f"95% 区间 ¥{aov['low']:.2f} – ¥{aov['high']:.2f}")
+    with col3:
+        repurchase = kpis['Repurchase_Rate']
+        st.metric("🔄 复购率 (估计)", f"{repurchase['estimate']:.1%}")
+        st.caption(f"95% 区间 {repurchase['low']:.1%} – {repurchase['high']:.1%}")
+    with col4:
+        st.metric("🛒 订单数", f"{kpis['Orders']['estimate']:,}")
+        st.caption("全量精确值")
+
+@st.cache_resource
+def get_cluster_centers():
+    """各数据集最近一次聚类的中心，数据版本更新后用于热启动，簇编号保持稳定"""
+    return {'lock': threading.Lock(), 'centers': {}}
+
+def get_customer_features(df):
+    """每个用户一行的 R/F/M 与品类消费占比特征（聚类与相似客户共用）"""
+    return derived(df, 'cluster_features', lambda: customer_features(df, get_user_metrics(df)))
+
+def get_similar_customers(df):
+    """相似客户检索索引（每个数据版本只建立一次）"""
+    return derived(df, 'similar_customers', lambda: SimilarCustomerIndex(get_customer_features(df)))
+
+def get_customer_clusters(df, n_clusters):
+    """RFM + 品类偏好的小批量 K-means 聚类（每个数据版本、每个 K 只计算一次）"""
+    def build():
+        registry = get_cluster_centers()
+        key = (df.attrs.get('dataset_name'), n_clusters)
+        with registry['lock']:
+            init = registry['centers'].get(key)
+        result = fit_customer_clusters(frame_batches(get_customer_features(df)), n_clusters, init=init)
+        with registry['lock']:
+            registry['centers'][key] = result['centers_scaled']
+        return result
+    return derived(df, f'customer_clusters_{n_clusters}', build)
+
+@st.cache_resource
+def get_figure_cache():
+    """进程内共享的图表缓存（磁盘缓存作为第二级）"""
+    return FigureCache(FIGURE_CACHE_MB * 1024 * 1024, disk=get_disk_cache())
+
+def cached_figure(df, module, chart_id, builder, filter_state=None):
+    """按 (模块, 图表, 筛选状态, 数据版本) 取缓存图表，未命中时调用 builder 构建
+
+    builder 返回 (图表, 附加信息字典)，附加信息用于图表旁的分析文字。
+    """
+    key = make_key(module, chart_id, filter_state, dataset_key(df))
+    content = df.attrs.get('content_hash')
+    disk_key = (content, df.attrs.get('dataset_name')) + key[:3] if content else None
+    return get_figure_cache().get_or_build(key, builder, disk_key)
+
 def create_user_analysis(df):
     """用户分析"""
     user_summary = df.groupby("User_Name").agg({
@@ -115,59 +585,181 @@ def create_geographic_analysis(df):
     
     return country_summary.sort_values("Revenue", ascending=False)
 
+# 可流式导出的结果表：表名 -> (名称, 由数据集生成结果表的函数)；交易明细按筛选条件分块导出
+EXPORT_TABLES = {
+    'transactions': ('交易明细（按筛选条件）', None),
+    'rfm': ('RFM 用户分层', get_rfm),
+    'user_metrics': ('用户顺序指标', get_user_metrics),
+    'country_summary': ('各国家表现', create_geographic_analysis),
+    'country_value': ('国家价值评分 (m=30)', lambda df: get_country_value(df, 30)),
+    'concentration': ('各维度收入集中度', get_concentration_summary),
+    'payment_stickiness': ('各国家支付方式粘性', lambda df: stickiness(get_payment_transitions(df)).rename_axis('Country').reset_index()),
+}
+if HAS_CLUSTERING:
+    EXPORT_TABLES['customer_clusters'] = ('用户聚类结果 (K=5)', lambda df: get_customer_clusters(df, 5)['assignments'])
+if HAS_CLV:
+    EXPORT_TABLES['clv_scores'] = ('CLV 预测 (未来365天)', lambda df: get_clv_scores(df, 365))
+
+def resolve_export(dataset_name, table, filters):
+    """导出服务的数据来源：数据集或表名不存在时返回 None"""
+    registry = discover_datasets()
+    if dataset_name not in registry or table not in EXPORT_TABLES:
+        return None
+    df = get_dataset_cache().get(dataset_name, registry[dataset_name], _load_and_profile)
+    if table == 'transactions':
+        return filtered_chunks(df, filters)
+    return frame_chunks(EXPORT_TABLES[table][1](df))
+
+@st.cache_resource
+def get_export_server():
+    """进程内只启动一个导出服务；端口都被占用或 EXPORT_PORT=0 时返回 None"""
+    if EXPORT_PORT <= 0:
+        return None
+    return start_on_free_port('导出服务', lambda host, port: ExportServer(resolve_export, host, port),
+                              EXPORT_HOST, EXPORT_PORT, EXPORT_PORT_SPAN)
+
+def export_base_url(server):
+    """浏览器访问本进程导出服务的地址"""
+    if EXPORT_BASE_URL:
+        return EXPORT_BASE_URL.replace('{port}', str(server.port))
+    if EXPORT_HOST in ('127.0.0.1', 'localhost', '::1'):
+        return f"http://localhost:{server.port}"
+    # 已开启远程访问：与浏览器访问仪表板时的主机名相同，远程用户的链接也指向部署仪表板的机器
+    host = urlsplit(f"//{st.context.headers.get('Host', '')}").hostname or 'localhost'
+    if ':' in host:
+        host = f'[{host}]'
+    return f"http://{host}:{server.port}"
+
 def main():
+    get_metrics_server()
+
     # 主标题
     st.markdown('<h1 class="main-header">🛒 电商数据分析仪表板</h1>', unsafe_allow_html=True)
     
-    # 加载数据
-    df = load_data()
-    
     # 侧边栏
     st.sidebar.title("📊 分析导航")
     
+    # 数据集选择
+    registry = discover_datasets()
+    if not registry:
+        st.error("❌ 找不到数据文件 'ecommerce_transactions.csv'，请确保文件在正确位置")
+        st.stop()
+    dataset_name = st.sidebar.selectbox("选择数据集", list(registry))
+    
+    # 加载数据
+    df = load_data(dataset_name, registry[dataset_name])
+    
     # 分析选项
-    analysis_options = [
-        "📈 数据概览",
-        "👥 用户分析", 
-        "🌍 地区分析",
-        "🛍️ 产品分析",
-        "💳 支付分析",
-        "📅 时间趋势",
-        "🎯 用户行为画像",
-        "🛒 用户购买偏好"
-    ]
+    analysis_modules = {
+        "📈 数据概览": show_data_overview,
+        "👥 用户分析": show_user_analysis,
+        "🌍 地区分析": show_geographic_analysis,
+        "🛍️ 产品分析": show_product_analysis,
+        "💳 支付分析": show_payment_analysis,
+        "📅 时间趋势": show_time_analysis,
+        "🎯 用户行为画像": show_user_behavior_analysis,
+        "🛒 用户购买偏好": show_user_preference_analysis,
+        "🔎 客户查询": show_customer_lookup,
+    }
     
-    selected_analysis = st.sidebar.selectbox("选择分析模块", analysis_options)
-    
-    # 根据选择显示不同的分析
-    if selected_analysis == "📈 数据概览":
-        show_data_overview(df)
-    elif selected_analysis == "👥 用户分析":
-        show_user_analysis(df)
-    elif selected_analysis == "🌍 地区分析":
-        show_geographic_analysis(df)
-    elif selected_analysis == "🛍️ 产品分析":
-        show_product_analysis(df)
-    elif selected_analysis == "💳 支付分析":
-        show_payment_analysis(df)
-    elif selected_analysis == "📅 时间趋势":
-        show_time_analysis(df)
-    elif selected_analysis == "🎯 用户行为画像":
-        show_user_behavior_analysis(df)
-    elif selected_analysis == "🛒 用户购买偏好":
-        show_user_preference_analysis(df)
+    selected_analysis = st.sidebar.selectbox("选择分析模块", list(analysis_modules))
+    show_analysis = analysis_modules[selected_analysis]
+    
+    # 大数据集先用样本渲染，全量结果在后台算完后替换（客户查询始终使用全量数据）
+    view_df = df
+    if len(df) >= PROGRESSIVE_MIN_ROWS and selected_analysis != "🔎 客户查询":
+        progressive = st.sidebar.toggle("⚡ 渐进式渲染", value=True,
+                                        help="先用抽样数据快速给出近似结果，全量精确结果在后台计算完成后自动替换")
+        if progressive:
+            job = submit_exact_job(df, selected_analysis)
+            if not job.done():
+                sample = get_progressive_sample(df)
+                by_user = selected_analysis in USER_SAMPLE_MODULES
+                view_df = sample['users'] if by_user else sample['transactions']
+                show_progressive_banner(sample, by_user)
+                watch_exact_job(job)
+    
+    # 显示选择的分析（耗时按模块计入运行指标，样本渲染单独标记）
+    with get_metrics()['module_seconds'].time(module=show_analysis.__name__,
+                                               view='full' if view_df is df else 'sample'):
+        show_analysis(view_df)
+    
+    show_cache_status()
+    show_export_panel(df)
+
+def show_cache_status():
+    """侧边栏：数据集缓存和图表缓存的占用与命中情况"""
+    dataset_stats = get_dataset_cache().stats()
+    figure_stats = get_figure_cache().stats()
+    with st.sidebar.expander("🗄️ 缓存状态"):
+        st.write(f"数据集缓存: {dataset_stats['bytes'] / 1024**2:,.1f} / {dataset_stats['max_bytes'] / 1024**2:,.0f} MB")
+        st.write(f"- 已缓存数据集: {', '.join(dataset_stats['datasets']) or '无'}")
+        st.write(f"- 命中率: {dataset_stats['hit_ratio']:.1%} (命中 {dataset_stats['hits']} / 加载 {dataset_stats['misses']})")
+        st.write(f"- 淘汰次数: {dataset_stats['evictions']}")
+        if dataset_stats['shared']:
+            st.write(f"- 共享内存映射 (不计入预算): {', '.join(dataset_stats['shared'])}")
+        st.write(f"图表缓存: {figure_stats['bytes'] / 1024**2:,.1f} / {figure_stats['max_bytes'] / 1024**2:,.0f} MB")
+        st.write(f"- 命中 {figure_stats['hits']} / 未命中 {figure_stats['misses']} / 淘汰 {figure_stats['evictions']}")
+        disk = get_disk_cache()
+        if disk is not None:
+            disk_stats = disk.stats()
+            st.write(f"磁盘缓存: {disk_stats['bytes'] / 1024**2:,.1f} / {disk_stats['max_bytes'] / 1024**2:,.0f} MB ({disk_stats['entries']} 个文件)")
+            st.write(f"- 命中 {disk_stats['hits']} / 未命中 {disk_stats['misses']} / 淘汰 {disk_stats['evictions']}")
+        if dataset_stats['over_budget']:
+            st.warning("⚠️ 当前数据集本身已超过缓存预算，请调大 DATASET_CACHE_MB")
+
+def show_export_panel(df):
+    """侧边栏：结果表和筛选后交易明细的流式下载链接"""
+    server = get_export_server()
+    with st.sidebar:
+        with st.expander("📥 数据导出"):
+            if server is None:
+                st.warning(f"导出服务未启动（端口 {EXPORT_PORT}-{EXPORT_PORT + max(EXPORT_PORT_SPAN, 1) - 1} "
+                           f"均被占用或已禁用），可改用命令行 python export_stream.py")
+                return
+            export_form(df, server)
+
+@st.fragment(key='export_panel')
+def export_form(df, server):
+    """导出选项放在独立片段里，调整筛选条件不重跑整页"""
+    table = st.selectbox("导出内容", list(EXPORT_TABLES), format_func=lambda t: EXPORT_TABLES[t][0])
+    formats = ['csv.gz', 'parquet'] if HAS_PYARROW else ['csv.gz']
+    fmt = st.radio("格式", formats, horizontal=True)
+    filters = {}
+    if table == 'transactions':
+        # 日期范围取自数据画像，筛选项取值按数据版本缓存，重跑时不扫描数据表
+        dates = load_profile(df)['columns']['Transaction_Date']
+        first_day = pd.Timestamp(dates['min']).date()
+        last_day = pd.Timestamp(dates['max']).date()
+        date_range = st.date_input("日期区间", value=(first_day, last_day), min_value=first_day, max_value=last_day)
+        if isinstance(date_range, (list, tuple)):
+            filters['start'], filters['end'] = str(date_range[0]), str(date_range[-1])
+        values = get_filter_values(df)
+        filters['country'] = st.multiselect("国家", values['Country'])
+        filters['category'] = st.multiselect("品类", values['Product_Category'])
+        filters['payment'] = st.multiselect("支付方式", values['Payment_Method'])
+    url = server.url(export_base_url(server), df.attrs.get('dataset_name'), table, fmt, filters)
+    st.markdown(f"[⬇️ 下载 {EXPORT_TABLES[table][0]} ({fmt})]({url})")
+    st.caption("服务端按 10 万行分块生成并压缩、边生成边发送，内存占用与导出规模无关")
 
 def show_data_overview(df):
-    """数据概览"""
+    """数据概览（关键指标和分布来自导入时生成的数据画像；收入集中度按所选维度计算并缓存）"""
     st.markdown('<h2 class="section-header">📈 数据概览</h2>', unsafe_allow_html=True)
     
+    profile = load_profile(df)
+    columns = profile['columns']
+    amount = columns['Purchase_Amount']
+    first_date = pd.Timestamp(columns['Transaction_Date']['min'])
+    last_date = pd.Timestamp(columns['Transaction_Date']['max'])
+    time_span = (last_date - first_date).days
+    
     # 关键指标
     col1, col2, col3, col4 = st.columns(4)
     
-    total_revenue = df['Purchase_Amount'].sum()
-    total_orders = len(df)
-    total_users = df['User_Name'].nunique()
-    avg_order_value = df['Purchase_Amount'].mean()
+    total_revenue = amount['sum']
+    total_orders = profile['rows']
+    total_users = columns['User_Name']['unique']
+    avg_order_value = amount['mean']
     
     with col1:
         st.metric("💰 总收入", f"¥{total_revenue:,.0f}")
@@ -185,22 +777,22 @@ def show_data_overview(df):
     
     with col1:
         st.markdown("**数据维度**")
-        st.write(f"- 交易记录数: {len(df):,}")
-        st.write(f"- 数据列数: {df.shape[1]}")
-        st.write(f"- 唯一用户数: {df['User_Name'].nunique()}")
-        st.write(f"- 覆盖国家数: {df['Country'].nunique()}")
-        st.write(f"- 产品类别数: {df['Product_Category'].nunique()}")
+        st.write(f"- 交易记录数: {total_orders:,}")
+        st.write(f"- 数据列数: {profile['n_columns']}")
+        st.write(f"- 唯一用户数: {total_users}")
+        st.write(f"- 覆盖国家数: {columns['Country']['unique']}")
+        st.write(f"- 产品类别数: {columns['Product_Category']['unique']}")
     
     with col2:
         st.markdown("**时间范围**")
-        st.write(f"- 最早交易: {df['Transaction_Date'].min().strftime('%Y-%m-%d')}")
-        st.write(f"- 最晚交易: {df['Transaction_Date'].max().strftime('%Y-%m-%d')}")
-        st.write(f"- 时间跨度: {(df['Transaction_Date'].max() - df['Transaction_Date'].min()).days} 天")
+        st.write(f"- 最早交易: {first_date.strftime('%Y-%m-%d')}")
+        st.write(f"- 最晚交易: {last_date.strftime('%Y-%m-%d')}")
+        st.write(f"- 时间跨度: {time_span} 天")
     
     # 数据质量检查
     st.markdown("### 🔍 数据质量检查")
-    missing_data = df.isnull().sum()
-    if missing_data.sum() == 0:
+    missing_data = {col: stats['nulls'] for col, stats in columns.items()}
+    if sum(missing_data.values()) == 0:
         st.success("✅ 数据完整，无缺失值")
     else:
         st.warning("⚠️ 发现缺失值")
@@ -208,14 +800,135 @@ def show_data_overview(df):
             if missing > 0:
                 st.write(f"- {col}: {missing} 个缺失值")
 
+    # 字段画像
+    st.markdown("### 🧾 字段画像")
+    column_table = pd.DataFrame([
+        {
+            '字段': col,
+            '类型': stats['dtype'],
+            '缺失值': stats['nulls'],
+            '唯一值': stats['unique'],
+            '最小值': stats.get('min', ''),
+            '最大值': stats.get('max', ''),
+            '高频取值': ', '.join(f"{value} ({count:,})" for value, count in stats.get('top_values', [])[:3])
+        }
+        for col, stats in columns.items()
+    ]).astype({'最小值': str, '最大值': str})
+    st.dataframe(column_table, use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    for container, col, label in [(col1, 'Purchase_Amount', '交易金额'), (col2, 'Age', '年龄')]:
+        histogram = columns[col].get('histogram')
+        if histogram is None:
+            continue
+        edges = np.array(histogram['edges'])
+        with container:
+            fig_hist = px.bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=histogram['counts'],
+                title=f"{label}分布",
+                labels={'x': label, 'y': '交易数量'}
+            )
+            fig_hist.update_traces(width=np.diff(edges))
+            st.plotly_chart(fig_hist, use_container_width=True)
+
+    # 收入集中度：客户、国家、品类、支付方式共用同一个引擎
+    st.markdown("### 📐 收入集中度")
+
+    @st.fragment(key='overview_concentration')
+    def concentration_section():
+        # 默认显示产品类别：只需一次分组求和，客户维度要先构建逐用户指标，选中时才计算
+        dimension = st.radio("集中度维度", list(DIMENSIONS), index=list(DIMENSIONS).index('categories'),
+                             horizontal=True, format_func=lambda d: DIMENSIONS[d][0])
+        name = DIMENSIONS[dimension][0]
+        result = get_concentration(df, dimension)
+        top = result['top_shares'].set_index('Top_Percent')['Value_Share']
+        reach = result['reach'].set_index('Value_Share')
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric(f"🔢 {name}数", f"{result['groups']:,}")
+        with col2:
+            st.metric("📏 基尼系数", f"{result['gini']:.3f}")
+        with col3:
+            # 客户数很多时 HHI 远小于 1，保留两位小数
+            st.metric("🏛️ HHI", f"{result['hhi']:,.0f}" if result['hhi'] >= 10 else f"{result['hhi']:.2f}")
+        with col4:
+            st.metric(f"🥇 前20%{name}贡献", f"{top[20]:.1f}%")
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            def build_lorenz():
+                lorenz = result['lorenz']
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(
+                    x=lorenz['Population_Share'] * 100,
+                    y=lorenz['Value_Share'] * 100,
+                    mode='lines',
+                    name='洛伦兹曲线',
+                    line=dict(color='#1f77b4', width=3)
+                ))
+                fig.add_trace(go.Scatter(
+                    x=[0, 100], y=[0, 100], mode='lines', name='完全均匀',
+                    line=dict(color='gray', dash='dash')
+                ))
+                fig.update_layout(
+                    title=f"{name}收入洛伦兹曲线 (基尼系数 {result['gini']:.3f})",
+                    xaxis_title=f"{name}累计占比 (%，按收入从低到高)",
+                    yaxis_title="收入累计占比 (%)",
+                    height=400
+                )
+                return fig, {}
+
+            fig_lorenz, _ = cached_figure(df, 'overview', 'lorenz', build_lorenz, {'dimension': dimension})
+            st.plotly_chart(fig_lorenz, use_container_width=True)
+
+        with col2:
+            def build_top_shares():
+                top_shares = result['top_shares']
+                fig = px.bar(
+                    top_shares,
+                    x=top_shares['Top_Percent'].map(lambda p: f"前{p}%"),
+                    y='Value_Share',
+                    text=top_shares['Value_Share'].map(lambda v: f"{v:.1f}%"),
+                    hover_data={'Groups': True},
+                    title=f"收入最高的 X% {name}贡献的收入占比",
+                    labels={'x': f'{name}范围', 'Value_Share': '收入占比 (%)', 'Groups': f'{name}数'}
+                )
+                fig.add_hline(y=80, line_dash="dash", line_color="#ff4444", annotation_text="80%")
+                fig.update_layout(yaxis=dict(range=[0, 105]), height=400)
+                return fig, {}
+
+            fig_top, _ = cached_figure(df, 'overview', 'top_shares', build_top_shares, {'dimension': dimension})
+            st.plotly_chart(fig_top, use_container_width=True)
+
+        st.markdown(f"""
+        <div class="chart-analysis">
+        <strong>💡 图表分析:</strong> 收入最高的20%{name}贡献了{top[20]:.1f}%的收入，
+        {reach.loc[80, 'Groups']:,}个{name}（占{reach.loc[80, 'Group_Percent']:.1f}%）即可覆盖80%的收入。
+        基尼系数{result['gini']:.3f}，{'集中度较高，头部依赖明显，需关注头部流失风险' if result['gini'] >= 0.4 else '分布较为均匀，收入不依赖少数头部'}。
+        </div>
+        """, unsafe_allow_html=True)
+
+        # 对比表要计算全部四个维度（含客户维度），打开开关时才计算；折叠的 expander 内容仍会执行
+        if st.toggle("📋 各维度集中度对比", value=False):
+            columns = {'Dimension': '维度', 'Groups': '组数', 'Gini': '基尼系数'}
+            columns.update({f'Top{p}%_Share': f'前{p}%贡献(%)' for p in TOP_PERCENTS})
+            columns.update({f'Groups_for_{s}%': f'覆盖{s}%收入所需组占比(%)' for s in REACH_SHARES})
+            st.dataframe(get_concentration_summary(df).rename(columns=columns).round(3),
+                         hide_index=True, use_container_width=True)
+
+    concentration_section()
+
     # 添加概览洞察
     st.markdown(f"""
     <div class="chart-analysis">
     <strong>💡 数据概览分析:</strong><br>
-    • 本数据集覆盖{df['User_Name'].nunique()}个用户在{df['Country'].nunique()}个国家的{len(df):,}笔交易<br>
+    • 本数据集覆盖{total_users}个用户在{columns['Country']['unique']}个国家的{total_orders:,}笔交易<br>
     • 平均订单价值¥{avg_order_value:.0f}，处于中等消费水平<br>
     • 数据质量优秀，无缺失值，可直接进行深度分析<br>
-    • 时间跨度{(df['Transaction_Date'].max() - df['Transaction_Date'].min()).days}天，适合趋势分析
+    • 时间跨度{time_span}天，适合趋势分析
     </div>
     """, unsafe_allow_html=True)
 
@@ -351,28 +1064,104 @@ def show_geographic_analysis(df):
         </div>
         """, unsafe_allow_html=True)
 
+    # 国家价值评分：人均指标百分位排名 + 可信度加权，不受市场规模干扰
+    st.markdown("### 💎 国家价值评分")
+
+    @st.fragment(key='country_value')
+    def country_value_section():
+        m = st.select_slider("平滑参数 m", options=list(DEFAULT_M_GRID), value=30,
+                             help="可信度权重 cw = 活跃用户数 / (活跃用户数 + m)，m 越大，小样本国家越向整体均值收缩")
+        scores = get_country_value(df, m)
+        boot = get_country_bootstrap(df, m)
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            def build_rank_ci():
+                ordered = boot.sort_values('Rank_Stabilized', ascending=False)
+                fig = go.Figure(go.Scatter(
+                    x=ordered['Rank_Stabilized'],
+                    y=ordered['Country'],
+                    mode='markers',
+                    marker=dict(size=10),
+                    error_x=dict(type='data', symmetric=False,
+                                 array=ordered['Rank_High'] - ordered['Rank_Stabilized'],
+                                 arrayminus=ordered['Rank_Stabilized'] - ordered['Rank_Low']),
+                    customdata=ordered[['Rank_Low', 'Rank_High', 'P_Top3']],
+                    hovertemplate='%{y}: 第%{x}名 (95%区间 %{customdata[0]}-%{customdata[1]}，'
+                                  '进入前三概率 %{customdata[2]:.0%})<extra></extra>'
+                ))
+                fig.update_layout(
+                    title=f"稳健化排名及95%置信区间 (m={m}, 自助法{boot.attrs['n_boot']}次)",
+                    xaxis=dict(title='排名', autorange='reversed', dtick=1),
+                    yaxis_title='国家',
+                    height=400,
+                    margin=dict(l=100, r=50, t=50, b=50)
+                )
+                stable = boot.loc[boot['Rank_High'] - boot['Rank_Low'] <= 2, 'Country']
+                if len(stable):
+                    stability = f"排名区间窄（不超过2名）的国家：{', '.join(stable)}，这些国家的排名差异可信；"
+                else:
+                    stability = "各国排名区间都超过2名，样本量下排名差异不显著；"
+                return fig, {
+                    'top_country': boot.iloc[0]['Country'],
+                    'top_prob': boot.iloc[0]['P_Top3'],
+                    'stability': stability
+                }
+
+            fig_rank_ci, rank_meta = cached_figure(df, 'geo', 'country_rank_ci', build_rank_ci, {'m': m})
+            st.plotly_chart(fig_rank_ci, use_container_width=True)
+
+        with col2:
+            def build_m_sweep():
+                sweep = m_sweep(get_country_units(df)).reset_index().melt(
+                    id_vars='Country', var_name='m', value_name='Rank')
+                fig = px.line(
+                    sweep,
+                    x='m',
+                    y='Rank',
+                    color='Country',
+                    markers=True,
+                    log_x=True,
+                    title="平滑参数 m 对稳健化排名的影响",
+                    labels={'m': '平滑参数 m', 'Rank': '排名', 'Country': '国家'}
+                )
+                fig.update_layout(yaxis=dict(autorange='reversed', dtick=1), height=400,
+                                  margin=dict(l=50, r=50, t=50, b=50))
+                # m=0 无法在对数轴上显示，从最小的正值开始
+                fig.update_xaxes(range=[np.log10(min(v for v in DEFAULT_M_GRID if v > 0)), np.log10(max(DEFAULT_M_GRID))])
+                return fig, {}
+
+            fig_sweep, _ = cached_figure(df, 'geo', 'country_m_sweep', build_m_sweep)
+            st.plotly_chart(fig_sweep, use_container_width=True)
+
+        st.markdown(f"""
+        <div class="chart-analysis">
+        <strong>💡 图表分析:</strong> 按人均指标综合评分，{rank_meta['top_country']}的稳健化价值得分最高，
+        在{boot.attrs['n_boot']}次按国家重抽用户的自助法中有{rank_meta['top_prob']:.0%}的概率位列前三。
+        {rank_meta['stability']}
+        区间重叠较多的国家之间不宜仅凭排名先后分配资源。
+        </div>
+        """, unsafe_allow_html=True)
+
+        with st.expander("📋 国家价值评分明细"):
+            rpr_window = get_country_units(df)['rpr_window']
+            rpr_column = f"RPR_{rpr_window}"
+            st.dataframe(scores.rename(columns={
+                'Country': '国家', 'Active_Users': '活跃用户数', 'Orders_per_Active': '人均订单数',
+                'AOV': '客单价', rpr_column: f"{rpr_window}天复购率", 'Value_Score': '价值得分',
+                'Rank_Value_Score': '价值排名', 'Stabilized_Value_Score': '稳健化得分', 'Rank_Stabilized': '稳健化排名'
+            }).round(3), hide_index=True, use_container_width=True)
+
+    country_value_section()
+
 def show_product_analysis(df):
     """产品分析"""
     st.markdown('<h2 class="section-header">🛍️ 产品分析</h2>', unsafe_allow_html=True)
     
-    # 产品表现分析
-    product_summary = df.groupby('Product_Category').agg({
-        'Transaction_ID': 'count',
-        'Purchase_Amount': ['sum', 'mean']
-    }).reset_index()
-    
-    product_summary.columns = ['Product_Category', 'Total_Sales_Volume', 'Total_Revenue', 'Avg_Price']
-    product_summary = product_summary.sort_values('Total_Revenue', ascending=False)
-    
-    # 计算市场份额
-    total_revenue = product_summary['Total_Revenue'].sum()
-    product_summary['Market_Share'] = (product_summary['Total_Revenue'] / total_revenue * 100)
-    product_summary['Cumulative_Share'] = product_summary['Market_Share'].cumsum()
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # 产品收入排名
+    # 产品表现分析（只在有图表未命中缓存时才计算，按数据集版本缓存，片段重跑时不重算）
+    def build_product_revenue():
+        product_summary = get_product_summary(df)
         fig_product_revenue = px.bar(
             product_summary,
             x='Product_Category',
@@ -381,9 +1170,19 @@ def show_product_analysis(df):
             labels={'Product_Category': '产品类别', 'Total_Revenue': '总收入'}
         )
         fig_product_revenue.update_layout(xaxis_tickangle=45)
-        st.plotly_chart(fig_product_revenue, use_container_width=True)
-        
         top_product = product_summary.iloc[0]
+        return fig_product_revenue, {
+            'Product_Category': top_product['Product_Category'],
+            'Market_Share': top_product['Market_Share']
+        }
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # 产品收入排名
+        fig_product_revenue, top_product = cached_figure(df, 'product', 'revenue_bar', build_product_revenue)
+        st.plotly_chart(fig_product_revenue, use_container_width=True)
+
         st.markdown(f"""
         <div class="chart-analysis">
         <strong>💡 图表分析:</strong> {top_product['Product_Category']}以{top_product['Market_Share']:.1f}%的市场份额领先，
@@ -393,12 +1192,12 @@ def show_product_analysis(df):
     
     with col2:
         # 市场份额饼图
-        fig_market_share = px.pie(
-            product_summary,
+        fig_market_share, _ = cached_figure(df, 'product', 'market_share_pie', lambda: (px.pie(
+            get_product_summary(df),
             values='Market_Share',
             names='Product_Category',
             title="产品类别市场份额"
-        )
+        ), {}))
         st.plotly_chart(fig_market_share, use_container_width=True)
         
         st.markdown(f"""
@@ -413,99 +1212,116 @@ def show_product_analysis(df):
     st.markdown("### 📈 帕累托分析 (80/20法则)")
     st.markdown("*基于50,000笔交易数据，时间跨度：2023年4月-2024年10月*")
     
-    pareto_data = product_summary[product_summary['Cumulative_Share'] <= 80]
-    core_categories = pareto_data['Product_Category'].tolist()
-    
-    fig_pareto = go.Figure()
-    
-    # 为核心品类和长尾品类使用不同颜色
-    colors = ['#1f77b4' if cat in core_categories else '#aec7e8' for cat in product_summary['Product_Category']]
-    
-    # 收入柱状图
-    fig_pareto.add_trace(go.Bar(
-        x=product_summary['Product_Category'],
-        y=product_summary['Total_Revenue'],
-        name='收入',
-        yaxis='y',
-        marker_color=colors,
-        text=[f'¥{val:,.0f}' for val in product_summary['Total_Revenue']],
-        textposition='outside'
-    ))
-    
-    # 累计占比折线图
-    fig_pareto.add_trace(go.Scatter(
-        x=product_summary['Product_Category'],
-        y=product_summary['Cumulative_Share'],
-        mode='lines+markers',
-        name='累计占比',
-        yaxis='y2',
-        line=dict(color='#ff4444', width=4),
-        marker=dict(size=8, color='#ff4444')
-    ))
-    
-    # 80%参考线 - 更突出
-    fig_pareto.add_hline(
-        y=80, 
-        line_dash="dash", 
-        line_color="#ff0000", 
-        line_width=3,
-        annotation_text="<b>80%核心收入线</b>", 
-        annotation_position="top right",
-        annotation_font_size=14,
-        annotation_font_color="#ff0000",
-        yref='y2'
-    )
-    
-    # 添加核心品类标注
-    fig_pareto.add_annotation(
-        x=len(core_categories)-0.5,
-        y=85,
-        text=f"<b>核心{len(core_categories)}品类<br>贡献80%收入</b>",
-        showarrow=True,
-        arrowhead=2,
-        arrowcolor="#ff4444",
-        arrowwidth=2,
-        bgcolor="rgba(255,255,255,0.8)",
-        bordercolor="#ff4444",
-        borderwidth=2,
-        yref='y2'
-    )
-    
-    fig_pareto.update_layout(
-        title="产品收入帕累托图 - 核心品类识别",
-        xaxis=dict(title="产品类别", tickangle=45),
-        yaxis=dict(title="收入 (¥)", side="left"),
-        yaxis2=dict(title="累计占比 (%)", side="right", overlaying="y", range=[0, 105]),
-        legend=dict(
-            yanchor="top",
-            y=0.98,
-            xanchor="left", 
-            x=0.02,
-            bgcolor="rgba(255,255,255,0.8)",
-            bordercolor="black",
-            borderwidth=1
-        ),
-        height=550,
-        margin=dict(t=100, b=80, l=80, r=80)
-    )
+    # 帕累托图放在独立片段里：调整阈值只重跑这一块，不重跑整页
+    @st.fragment(key='product_pareto')
+    def pareto_section():
+        threshold = st.slider("核心收入线 (%)", min_value=50, max_value=95, value=80, step=5)
+
+        def build_pareto():
+            # 帕累托表（按收入降序的份额和累计份额）与数据概览的品类集中度共用同一份结果
+            pareto = get_concentration(df, 'categories')['pareto']
+            pareto_data = pareto[pareto['Cumulative_Share'] <= threshold]
+            core_categories = pareto_data['Label'].tolist()
+
+            fig_pareto = go.Figure()
+
+            # 为核心品类和长尾品类使用不同颜色
+            colors = ['#1f77b4' if cat in core_categories else '#aec7e8' for cat in pareto['Label']]
+
+            # 收入柱状图
+            fig_pareto.add_trace(go.Bar(
+                x=pareto['Label'],
+                y=pareto['Value'],
+                name='收入',
+                yaxis='y',
+                marker_color=colors,
+                text=[f'¥{val:,.0f}' for val in pareto['Value']],
+                textposition='outside'
+            ))
+
+            # 累计占比折线图
+            fig_pareto.add_trace(go.Scatter(
+                x=pareto['Label'],
+                y=pareto['Cumulative_Share'],
+                mode='lines+markers',
+                name='累计占比',
+                yaxis='y2',
+                line=dict(color='#ff4444', width=4),
+                marker=dict(size=8, color='#ff4444')
+            ))
+
+            # 阈值参考线 - 更突出
+            fig_pareto.add_hline(
+                y=threshold,
+                line_dash="dash", 
+                line_color="#ff0000", 
+                line_width=3,
+                annotation_text=f"<b>{threshold}%核心收入线</b>",
+                annotation_position="top right",
+                annotation_font_size=14,
+                annotation_font_color="#ff0000",
+                yref='y2'
+            )
+
+            # 添加核心品类标注
+            fig_pareto.add_annotation(
+                x=len(core_categories)-0.5,
+                y=min(threshold + 5, 100),
+                text=f"<b>核心{len(core_categories)}品类<br>贡献{threshold}%收入</b>",
+                showarrow=True,
+                arrowhead=2,
+                arrowcolor="#ff4444",
+                arrowwidth=2,
+                bgcolor="rgba(255,255,255,0.8)",
+                bordercolor="#ff4444",
+                borderwidth=2,
+                yref='y2'
+            )
+
+            fig_pareto.update_layout(
+                title="产品收入帕累托图 - 核心品类识别",
+                xaxis=dict(title="产品类别", tickangle=45),
+                yaxis=dict(title="收入 (¥)", side="left"),
+                yaxis2=dict(title="累计占比 (%)", side="right", overlaying="y", range=[0, 105]),
+                legend=dict(
+                    yanchor="top",
+                    y=0.98,
+                    xanchor="left", 
+                    x=0.02,
+                    bgcolor="rgba(255,255,255,0.8)",
+                    bordercolor="black",
+                    borderwidth=1
+                ),
+                height=550,
+                margin=dict(t=100, b=80, l=80, r=80)
+            )
+
+            core_detail = pareto_data.rename(columns={
+                'Label': 'Product_Category', 'Share': 'Market_Share', 'Value': 'Total_Revenue'
+            })[['Product_Category', 'Market_Share', 'Total_Revenue']]
+            return fig_pareto, {'core_detail': core_detail.to_dict('records')}
+
+        fig_pareto, pareto_meta = cached_figure(df, 'product', 'pareto', build_pareto, {'threshold': threshold})
     
-    st.plotly_chart(fig_pareto, use_container_width=True)
+        st.plotly_chart(fig_pareto, use_container_width=True)
     
-    # 添加核心品类明细表
-    st.markdown("#### 🎯 核心品类明细")
-    core_detail = product_summary[product_summary['Product_Category'].isin(core_categories)][['Product_Category', 'Market_Share', 'Total_Revenue']].copy()
-    core_detail.columns = ['核心品类', '市场份额(%)', '收入贡献(¥)']
-    core_detail['市场份额(%)'] = core_detail['市场份额(%)'].round(1)
-    core_detail['收入贡献(¥)'] = core_detail['收入贡献(¥)'].apply(lambda x: f"¥{x:,.0f}")
-    st.dataframe(core_detail, use_container_width=True, hide_index=True)
+        # 添加核心品类明细表
+        st.markdown("#### 🎯 核心品类明细")
+        core_detail = pd.DataFrame(pareto_meta['core_detail'], columns=['Product_Category', 'Market_Share', 'Total_Revenue'])
+        core_detail.columns = ['核心品类', '市场份额(%)', '收入贡献(¥)']
+        core_detail['市场份额(%)'] = core_detail['市场份额(%)'].round(1)
+        core_detail['收入贡献(¥)'] = core_detail['收入贡献(¥)'].apply(lambda x: f"¥{x:,.0f}")
+        st.dataframe(core_detail, use_container_width=True, hide_index=True)
     
-    st.markdown(f"""
-    <div class="chart-analysis">
-    <strong>💡 图表分析:</strong> {len(pareto_data)}个核心品类贡献了80%的收入，
-    符合帕累托原理。运用机器学习的聚类分析，可进一步优化产品组合策略，
-    建议重点投入核心品类的营销资源配置。
-    </div>
-    """, unsafe_allow_html=True)
+        st.markdown(f"""
+        <div class="chart-analysis">
+        <strong>💡 图表分析:</strong> {len(core_detail)}个核心品类贡献了{threshold}%的收入，
+        符合帕累托原理。运用机器学习的聚类分析，可进一步优化产品组合策略，
+        建议重点投入核心品类的营销资源配置。
+        </div>
+        """, unsafe_allow_html=True)
+
+    pareto_section()
 
 def show_payment_analysis(df):
     """支付分析"""
@@ -645,111 +1461,206 @@ def show_payment_analysis(df):
         </div>
         """, unsafe_allow_html=True)
 
+    # 支付方式切换（相邻两笔订单）
+    st.markdown("### 🔁 支付方式切换分析")
+    st.markdown("*同一用户相邻两笔订单之间的支付方式转移，国家按后一笔订单计；复购用户按最近一笔订单所在国家计*")
+
+    transitions = get_payment_transitions(df)
+    if transitions['pairs'] == 0:
+        st.info("没有复购用户，暂无法分析支付方式切换")
+        return
+
+    @st.fragment(key='payment_transitions')
+    def transition_section():
+        country = st.selectbox("国家", ['全部国家'] + transitions['countries'])
+        selected = None if country == '全部国家' else country
+        counts = transition_matrix(transitions, selected, normalize=False)
+        pairs = int(counts.to_numpy().sum())
+        stay = float(np.trace(counts.to_numpy())) / pairs if pairs else float('nan')
+        switch_users, repeat_users = user_counts(transitions, selected)
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("🔗 相邻订单对", f"{pairs:,}")
+        with col2:
+            st.metric("📌 沿用同一方式", f"{stay:.1%}")
+        with col3:
+            st.metric("🔀 曾切换方式的复购用户", f"{switch_users / max(repeat_users, 1):.1%}")
+        with col4:
+            st.metric("👥 复购用户", f"{repeat_users:,}")
+        if pairs == 0:
+            st.info(f"{country}没有复购用户")
+            return
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            def build_transition_heatmap():
+                probabilities = transition_matrix(transitions, selected)
+                fig = px.imshow(
+                    probabilities,
+                    text_auto='.1%',
+                    aspect='auto',
+                    color_continuous_scale='Blues',
+                    title=f"支付方式转移概率 ({country})",
+                    labels={'x': '下一笔订单', 'y': '上一笔订单', 'color': '概率'}
+                )
+                off_diagonal = counts.to_numpy().astype(float)
+                np.fill_diagonal(off_diagonal, -1)
+                src, dst = np.unravel_index(off_diagonal.argmax(), off_diagonal.shape)
+                return fig, {'top_switch': (counts.index[src], counts.columns[dst]),
+                             'top_switch_share': off_diagonal[src, dst] / pairs * 100}
+
+            fig_transition, transition_meta = cached_figure(df, 'payment', 'transition_heatmap',
+                                                            build_transition_heatmap, {'country': country})
+            st.plotly_chart(fig_transition, use_container_width=True)
+
+        with col2:
+            fig_first_latest, _ = cached_figure(df, 'payment', 'first_latest', lambda: (px.imshow(
+                first_latest_matrix(transitions, selected),
+                text_auto=True,
+                aspect='auto',
+                color_continuous_scale='Greens',
+                title=f"首次 vs 最近一次支付方式 用户数 ({country})",
+                labels={'x': '最近一次', 'y': '首次', 'color': '用户数'}
+            ), {}), {'country': country})
+            st.plotly_chart(fig_first_latest, use_container_width=True)
+
+        src, dst = transition_meta['top_switch']
+        st.markdown(f"""
+        <div class="chart-analysis">
+        <strong>💡 图表分析:</strong> {country}相邻两笔订单沿用同一支付方式的比例为{stay:.1%}，
+        最常见的切换路径是 {src} → {dst}（占全部订单对的{transition_meta['top_switch_share']:.1f}%）。
+        粘性低的支付方式说明用户并不固定，可结合支付优惠引导用户沉淀到低成本渠道。
+        </div>
+        """, unsafe_allow_html=True)
+
+    transition_section()
+
+    with st.expander("📋 各国家支付方式粘性（下一笔仍用同一方式的比例）"):
+        sticky = stickiness(transitions).rename(columns={'Overall': '整体'})
+        st.dataframe((sticky * 100).round(1), use_container_width=True)
+
 def show_time_analysis(df):
     """时间趋势分析"""
     st.markdown('<h2 class="section-header">📅 时间趋势分析</h2>', unsafe_allow_html=True)
     
-    # 计算数据时间跨度
-    time_span = (df['Transaction_Date'].max() - df['Transaction_Date'].min()).days
-    total_weeks = time_span // 7
-    
-    # 月度趋势
-    monthly_sales = df.groupby('YearMonth')['Purchase_Amount'].sum().reset_index()
-    monthly_sales['YearMonth_str'] = monthly_sales['YearMonth'].astype(str)
-    
-    st.markdown("### 📈 月度销售趋势")
-    st.markdown(f"*基于{time_span}天历史数据，涵盖{len(monthly_sales)}个完整月份*")
-    
-    fig_monthly = px.line(
-        monthly_sales,
-        x='YearMonth_str',
-        y='Purchase_Amount',
-        title=f"月度销售额趋势 ({monthly_sales['YearMonth_str'].iloc[0]} - {monthly_sales['YearMonth_str'].iloc[-1]})",
-        labels={'YearMonth_str': '月份', 'Purchase_Amount': '销售额 (¥)'},
-        markers=True
-    )
-    
-    # 添加机器学习增强的趋势线分析
-    import numpy as np
-    X = np.arange(len(monthly_sales))
-    y = monthly_sales['Purchase_Amount'].values
-    
-    # 优先使用sklearn，回退到numpy
-    try:
-        from sklearn.linear_model import LinearRegression
-        from sklearn.metrics import r2_score
-        
-        model = LinearRegression().fit(X.reshape(-1, 1), y)
-        trend_line = model.predict(X.reshape(-1, 1))
-        r2 = r2_score(y, trend_line)
-        trend_text = f'趋势线 (R²={r2:.3f})'
-        
-        # 添加置信区间（简化版）
-        residuals = y - trend_line
-        mse = np.mean(residuals**2)
-        confidence_interval = 1.96 * np.sqrt(mse)  # 95%置信区间
-        
-    except ImportError:
-        # 回退到numpy方法
-        z = np.polyfit(X, y, 1)
-        trend_line = np.poly1d(z)(X)
-        trend_text = '趋势线'
-        confidence_interval = None
-    
-    fig_monthly.add_trace(go.Scatter(
-        x=monthly_sales['YearMonth_str'],
-        y=trend_line,
-        mode='lines',
-        name=trend_text,
-        line=dict(dash='dash', color='red', width=3)
-    ))
-    
-    # 添加置信区间（如果sklearn可用）
-    if 'confidence_interval' in locals() and confidence_interval is not None:
-        fig_monthly.add_trace(go.Scatter(
-            x=monthly_sales['YearMonth_str'],
-            y=trend_line + confidence_interval,
-            mode='lines',
-            line=dict(width=0),
-            showlegend=False,
-            hoverinfo='skip'
-        ))
+    def build_monthly():
+        # 计算数据时间跨度
+        time_span = (df['Transaction_Date'].max() - df['Transaction_Date'].min()).days
+
+        # 月度趋势
+        monthly_sales = df.groupby('YearMonth')['Purchase_Amount'].sum().reset_index()
+        monthly_sales['YearMonth_str'] = monthly_sales['YearMonth'].astype(str)
+
+        fig_monthly = px.line(
+            monthly_sales,
+            x='YearMonth_str',
+            y='Purchase_Amount',
+            title=f"月度销售额趋势 ({monthly_sales['YearMonth_str'].iloc[0]} - {monthly_sales['YearMonth_str'].iloc[-1]})",
+            labels={'YearMonth_str': '月份', 'Purchase_Amount': '销售额 (¥)'},
+            markers=True
+        )
+
+        # 添加机器学习增强的趋势线分析
+        X = np.arange(len(monthly_sales))
+        y = monthly_sales['Purchase_Amount'].values
+
+        # 优先使用sklearn，回退到numpy
+        try:
+            from sklearn.linear_model import LinearRegression
+            from sklearn.metrics import r2_score
+
+            model = LinearRegression().fit(X.reshape(-1, 1), y)
+            trend_line = model.predict(X.reshape(-1, 1))
+            r2 = r2_score(y, trend_line)
+            trend_text = f'趋势线 (R²={r2:.3f})'
+
+            # 添加置信区间（简化版）
+            residuals = y - trend_line
+            mse = np.mean(residuals**2)
+            confidence_interval = 1.96 * np.sqrt(mse)  # 95%置信区间
+
+        except ImportError:
+            # 回退到numpy方法
+            z = np.polyfit(X, y, 1)
+            trend_line = np.poly1d(z)(X)
+            trend_text = '趋势线'
+            confidence_interval = None
+
         fig_monthly.add_trace(go.Scatter(
             x=monthly_sales['YearMonth_str'],
-            y=trend_line - confidence_interval,
+            y=trend_line,
             mode='lines',
-            line=dict(width=0),
-            fill='tonexty',
-            fillcolor='rgba(255,0,0,0.1)',
-            name='95%置信区间',
-            hoverinfo='skip'
+            name=trend_text,
+            line=dict(dash='dash', color='red', width=3)
         ))
-    
-    fig_monthly.update_layout(
-        xaxis_tickangle=45, 
-        height=450,
-        legend=dict(
-            yanchor="top",
-            y=0.99,
-            xanchor="left",
-            x=0.01
+
+        # 添加置信区间（如果sklearn可用）
+        if 'confidence_interval' in locals() and confidence_interval is not None:
+            fig_monthly.add_trace(go.Scatter(
+                x=monthly_sales['YearMonth_str'],
+                y=trend_line + confidence_interval,
+                mode='lines',
+                line=dict(width=0),
+                showlegend=False,
+                hoverinfo='skip'
+            ))
+            fig_monthly.add_trace(go.Scatter(
+                x=monthly_sales['YearMonth_str'],
+                y=trend_line - confidence_interval,
+                mode='lines',
+                line=dict(width=0),
+                fill='tonexty',
+                fillcolor='rgba(255,0,0,0.1)',
+                name='95%置信区间',
+                hoverinfo='skip'
+            ))
+
+        fig_monthly.update_layout(
+            xaxis_tickangle=45, 
+            height=450,
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01
+            )
         )
-    )
-    st.plotly_chart(fig_monthly, use_container_width=True)
+
+        # 计算趋势
+        peak_month = monthly_sales.loc[monthly_sales['Purchase_Amount'].idxmax(), 'YearMonth_str']
+        growth_rate = ((monthly_sales['Purchase_Amount'].iloc[-1] / monthly_sales['Purchase_Amount'].iloc[0]) - 1) * 100
+
+        # 添加统计显著性检验
+        try:
+            from scipy import stats
+            # 进行趋势显著性检验
+            X_test = np.arange(len(monthly_sales))
+            slope, intercept, r_value, p_value, std_err = stats.linregress(X_test, monthly_sales['Purchase_Amount'])
+            significance_text = f"(p={p_value:.3f}, {'显著' if p_value < 0.05 else '不显著'})"
+        except ImportError:
+            significance_text = ""
+
+        return fig_monthly, {
+            'time_span': time_span,
+            'months': len(monthly_sales),
+            'peak_month': peak_month,
+            'growth_rate': growth_rate,
+            'significance_text': significance_text
+        }
+
+    fig_monthly, monthly_meta = cached_figure(df, 'time', 'monthly_trend', build_monthly)
+    time_span = monthly_meta['time_span']
+    total_weeks = time_span // 7
+    peak_month = monthly_meta['peak_month']
+    growth_rate = monthly_meta['growth_rate']
+    significance_text = monthly_meta['significance_text']
     
-    # 计算趋势
-    peak_month = monthly_sales.loc[monthly_sales['Purchase_Amount'].idxmax(), 'YearMonth_str']
-    growth_rate = ((monthly_sales['Purchase_Amount'].iloc[-1] / monthly_sales['Purchase_Amount'].iloc[0]) - 1) * 100
+    st.markdown("### 📈 月度销售趋势")
+    st.markdown(f"*基于{time_span}天历史数据，涵盖{monthly_meta['months']}个完整月份*")
     
-    # 添加统计显著性检验
-    try:
-        from scipy import stats
-        # 进行趋势显著性检验
-        X_test = np.arange(len(monthly_sales))
-        slope, intercept, r_value, p_value, std_err = stats.linregress(X_test, monthly_sales['Purchase_Amount'])
-        significance_text = f"(p={p_value:.3f}, {'显著' if p_value < 0.05 else '不显著'})"
-    except ImportError:
-        significance_text = ""
+    st.plotly_chart(fig_monthly, use_container_width=True)
     
     st.markdown(f"""
     <div class="chart-analysis">
@@ -761,110 +1672,246 @@ def show_time_analysis(df):
     
     # 星期几分析
     st.markdown("### 📅 一周销售模式")
-    st.markdown(f"*基于{total_weeks}个完整周期的统计分析，样本充足度高*")
-    
-    weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    sales_by_dow = df.groupby('DayOfWeek').agg({
-        'Purchase_Amount': ['sum', 'count', 'mean']
-    }).reset_index()
-    
-    sales_by_dow.columns = ['DayOfWeek', 'Total_Sales', 'Transaction_Count', 'Avg_Transaction']
-    sales_by_dow['DayOfWeek'] = pd.Categorical(sales_by_dow['DayOfWeek'], categories=weekday_order, ordered=True)
-    sales_by_dow = sales_by_dow.sort_values('DayOfWeek')
-    
-    # 计算统计显著性指标
-    total_daily_avg = sales_by_dow['Total_Sales'].mean()
-    sales_by_dow['Performance_Index'] = (sales_by_dow['Total_Sales'] / total_daily_avg * 100).round(1)
-    
-    fig_weekday = px.bar(
-        sales_by_dow,
-        x='DayOfWeek',
-        y='Total_Sales',
-        title=f"一周销售模式分析 (基于{total_weeks}周数据)",
-        labels={'DayOfWeek': '星期', 'Total_Sales': '销售额 (¥)'},
-        text='Performance_Index',
-        color='Performance_Index',
-        color_continuous_scale='RdYlBu_r',
-        height=500
-    )
     
-    # 改进数字显示
-    fig_weekday.update_traces(
-        texttemplate='%{text}%', 
-        textposition='outside',
-        textfont=dict(size=14, color='black')
-    )
-    fig_weekday.update_layout(
-        showlegend=False,
-        yaxis=dict(title="销售额 (¥)"),
-        xaxis=dict(title="星期"),
-        margin=dict(t=80, b=50, l=50, r=50)
-    )
-    st.plotly_chart(fig_weekday, use_container_width=True)
+    # 以下三块各自是独立片段：切换指标、区间或序列时只重跑所在的块
+    @st.fragment(key='time_weekday_pattern')
+    def weekday_section():
+        weekday_labels = {'Total_Sales': '销售额', 'Transaction_Count': '订单数', 'Avg_Transaction': '平均订单价值'}
+        weekday_metric = st.radio("对比指标", list(weekday_labels), format_func=weekday_labels.get, horizontal=True)
+
+        def build_weekday():
+            time_span = (df['Transaction_Date'].max() - df['Transaction_Date'].min()).days
+            total_weeks = time_span // 7
+
+            weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+            sales_by_dow = df.groupby('DayOfWeek').agg({
+                'Purchase_Amount': ['sum', 'count', 'mean']
+            }).reset_index()
+
+            sales_by_dow.columns = ['DayOfWeek', 'Total_Sales', 'Transaction_Count', 'Avg_Transaction']
+            sales_by_dow['DayOfWeek'] = pd.Categorical(sales_by_dow['DayOfWeek'], categories=weekday_order, ordered=True)
+            sales_by_dow = sales_by_dow.sort_values('DayOfWeek')
+
+            # 计算统计显著性指标
+            total_daily_avg = sales_by_dow[weekday_metric].mean()
+            sales_by_dow['Performance_Index'] = (sales_by_dow[weekday_metric] / total_daily_avg * 100).round(1)
+
+            fig_weekday = px.bar(
+                sales_by_dow,
+                x='DayOfWeek',
+                y=weekday_metric,
+                title=f"一周{weekday_labels[weekday_metric]}模式分析 (基于{total_weeks}周数据)",
+                labels={'DayOfWeek': '星期', weekday_metric: weekday_labels[weekday_metric]},
+                text='Performance_Index',
+                color='Performance_Index',
+                color_continuous_scale='RdYlBu_r',
+                height=500
+            )
+
+            # 改进数字显示
+            fig_weekday.update_traces(
+                texttemplate='%{text}%', 
+                textposition='outside',
+                textfont=dict(size=14, color='black')
+            )
+            fig_weekday.update_layout(
+                showlegend=False,
+                yaxis=dict(title=weekday_labels[weekday_metric]),
+                xaxis=dict(title="星期"),
+                margin=dict(t=80, b=50, l=50, r=50)
+            )
+
+            peak_day = sales_by_dow.loc[sales_by_dow[weekday_metric].idxmax(), 'DayOfWeek']
+            weekend_sales = sales_by_dow[sales_by_dow['DayOfWeek'].isin(['Saturday', 'Sunday'])]['Total_Sales'].sum()
+            weekday_sales = sales_by_dow[~sales_by_dow['DayOfWeek'].isin(['Saturday', 'Sunday'])]['Total_Sales'].sum()
+
+            peak_row = sales_by_dow.loc[sales_by_dow['DayOfWeek'] == peak_day].iloc[0]
+            return fig_weekday, {
+                'peak_day': peak_day,
+                'peak_index': peak_row['Performance_Index'],
+                'weekend_share': weekend_sales / (weekend_sales + weekday_sales) * 100
+            }
+
+        fig_weekday, weekday_meta = cached_figure(df, 'time', 'weekday_pattern', build_weekday, {'metric': weekday_metric})
+        peak_day = weekday_meta['peak_day']
     
-    peak_day = sales_by_dow.loc[sales_by_dow['Total_Sales'].idxmax(), 'DayOfWeek']
-    weekend_sales = sales_by_dow[sales_by_dow['DayOfWeek'].isin(['Saturday', 'Sunday'])]['Total_Sales'].sum()
-    weekday_sales = sales_by_dow[~sales_by_dow['DayOfWeek'].isin(['Saturday', 'Sunday'])]['Total_Sales'].sum()
+        st.markdown(f"*基于{total_weeks}个完整周期的统计分析，样本充足度高*")
+        st.plotly_chart(fig_weekday, use_container_width=True)
     
-    st.markdown(f"""
-    <div class="chart-analysis">
-    <strong>💡 图表分析:</strong> {peak_day}是销售高峰日(性能指数{sales_by_dow.loc[sales_by_dow['DayOfWeek']==peak_day, 'Performance_Index'].iloc[0]}%)。
-    周末销售占比{(weekend_sales/(weekend_sales+weekday_sales)*100):.1f}%，
-    建议在{peak_day}加强营销投入。基于{total_weeks}周样本，结果具有统计显著性。
-    </div>
-    """, unsafe_allow_html=True)
+        st.markdown(f"""
+        <div class="chart-analysis">
+        <strong>💡 图表分析:</strong> {peak_day}是{weekday_labels[weekday_metric]}高峰日(性能指数{weekday_meta['peak_index']}%)。
+        周末销售占比{weekday_meta['weekend_share']:.1f}%，
+        建议在{peak_day}加强营销投入。基于{total_weeks}周样本，结果具有统计显著性。
+        </div>
+        """, unsafe_allow_html=True)
+
+    weekday_section()
+
+    # 任意区间分析（基于按天前缀和索引，每次查询都是常数时间）
+    st.markdown("### 🗓️ 任意区间分析")
+
+    @st.fragment(key='time_range_analysis')
+    def range_section():
+        daily_index = get_daily_index(df)
+        first_day = daily_index['dates'][0].date()
+        last_day = daily_index['dates'][-1].date()
+
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            date_range = st.date_input(
+                "选择日期区间",
+                value=(daily_index['dates'][max(0, daily_index['n_days'] - 90)].date(), last_day),
+                min_value=first_day,
+                max_value=last_day
+            )
+        with col2:
+            granularity_labels = {'day': '日', 'week': '周', 'month': '月', 'quarter': '季度'}
+            granularity = st.selectbox("汇总粒度", list(granularity_labels), index=1,
+                                       format_func=granularity_labels.get)
+        with col3:
+            window = st.selectbox("滚动窗口", [7, 28, 90], format_func=lambda w: f"{w}天")
+
+        # 区间选择未完成（只选了起点）时按单日处理
+        if isinstance(date_range, (list, tuple)):
+            range_start, range_end = date_range[0], date_range[-1]
+        else:
+            range_start = range_end = date_range
+
+        comparison = compare_periods(daily_index, range_start, range_end)
+        current = comparison['current']
+        change = comparison['change_pct']
+        delta_text = lambda k: None if np.isnan(change[k]) else f"{change[k]:+.1f}%"
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("💰 区间销售额", f"¥{current['Revenue']:,.0f}", delta_text('Revenue'))
+        with col2:
+            st.metric("📦 区间订单数", f"{current['Orders']:,.0f}", delta_text('Orders'))
+        with col3:
+            st.metric("🆕 新用户数", f"{current['New_Users']:,.0f}", delta_text('New_Users'))
+        with col4:
+            st.metric("💵 平均订单价值", f"¥{current['AOV']:.0f}", delta_text('AOV'))
+        st.caption(f"共{current['Days']}天，环比对象为紧邻的前{current['Days']}天")
+
+        filter_state = {'start': str(range_start), 'end': str(range_end), 'granularity': granularity, 'window': window}
+
+        def build_range_chart():
+            periods = resample(daily_index, granularity, range_start, range_end)
+            rolling_revenue = rolling(daily_index, window)
+            rolling_revenue = rolling_revenue[str(range_start):str(range_end)] / window
+
+            fig = make_subplots(specs=[[{"secondary_y": True}]])
+            fig.add_trace(go.Bar(x=periods['Start'], y=periods['Revenue'], name=f"销售额 (按{granularity_labels[granularity]})",
+                                 customdata=periods[['Period', 'Orders']],
+                                 hovertemplate='%{customdata[0]}<br>销售额: ¥%{y:,.0f}<br>订单数: %{customdata[1]:,.0f}<extra></extra>'),
+                          secondary_y=False)
+            fig.add_trace(go.Scatter(x=rolling_revenue.index, y=rolling_revenue.values, mode='lines',
+                                     name=f"{window}天滚动日均销售额"),
+                          secondary_y=True)
+            fig.update_layout(title=f"区间销售额 ({range_start} ~ {range_end})", height=450, bargap=0.1)
+            fig.update_yaxes(title_text="周期销售额 (¥)", secondary_y=False)
+            fig.update_yaxes(title_text="滚动日均销售额 (¥)", secondary_y=True)
+            return fig, {'periods': len(periods)}
+
+        fig_range, _ = cached_figure(df, 'time', 'range_revenue', build_range_chart, filter_state)
+        st.plotly_chart(fig_range, use_container_width=True)
+
+    range_section()
+
+    # 异常监控（按 国家×品类 的日销售额和订单数）
+    st.markdown("### 🚨 异常监控")
+
+    @st.fragment(key='time_anomaly_monitor')
+    def anomaly_section():
+        monitor = get_anomaly_monitor(df)
+        monitor_stats = monitor.stats()
+        if monitor_stats['last_day'] is None:
+            st.info("数据天数不足，暂无法进行异常监控")
+            return
+
+        anomalies = monitor.anomalies_frame()
+        recent = anomalies[anomalies['Date'] > monitor_stats['last_day'] - pd.Timedelta(days=30)]
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("📡 监控序列数", f"{monitor_stats['series']:,}")
+        with col2:
+            st.metric("📆 已处理至", monitor_stats['last_day'].strftime('%Y-%m-%d'))
+        with col3:
+            st.metric("⚠️ 近30天异常", f"{len(recent):,}")
+        with col4:
+            st.metric("📋 累计异常", f"{monitor_stats['anomalies']:,}")
+        st.caption(f"每个 国家×品类 序列维护指数加权基线和星期季节性，|z|>{monitor.threshold} 记为异常；"
+                   "最新一天可能尚未结束，等下一天的数据到来后再判断。")
+
+        if anomalies.empty:
+            st.success("✅ 暂未发现异常")
+            return
+
+        metric_labels = {'Revenue': '销售额', 'Orders': '订单数'}
+        direction_labels = {'spike': '📈 激增', 'drop': '📉 骤降'}
+        recent_table = (recent if not recent.empty else anomalies.tail(20)).sort_values(
+            ['Date', 'Z'], ascending=[False, False]).head(20)
+        st.dataframe(
+            recent_table.assign(
+                Metric=recent_table['Metric'].map(metric_labels),
+                Direction=recent_table['Direction'].map(direction_labels),
+                Date=recent_table['Date'].dt.strftime('%Y-%m-%d')
+            ).rename(columns={
+                'Date': '日期', 'Country': '国家', 'Product_Category': '品类', 'Metric': '指标',
+                'Value': '实际值', 'Expected': '基线', 'Z': 'z值', 'Direction': '方向'
+            }).round(2),
+            use_container_width=True,
+            hide_index=True
+        )
+
+        # 默认展示最近一次异常所在的序列
+        latest = recent_table.iloc[0]
+        default_key = (latest['Country'], latest['Product_Category'])
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            series_key = st.selectbox("查看序列", monitor.keys, index=monitor.keys.index(default_key),
+                                      format_func=lambda k: f"{k[0]} / {k[1]}")
+        with col2:
+            series_metric = st.radio("指标", list(metric_labels), format_func=metric_labels.get, horizontal=True)
+
+        def build_series_chart():
+            history = monitor.series_history(series_key, series_metric)
+            flagged = anomalies[(anomalies['Country'] == series_key[0]) &
+                                (anomalies['Product_Category'] == series_key[1]) &
+                                (anomalies['Metric'] == series_metric) &
+                                (anomalies['Date'] >= history['Date'].min())]
+            band = monitor.threshold * history['Std']
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(x=history['Date'], y=history['Expected'] + band, mode='lines',
+                                     line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=history['Date'], y=(history['Expected'] - band).clip(lower=0), mode='lines',
+                                     line=dict(width=0), fill='tonexty', fillcolor='rgba(30,136,229,0.15)',
+                                     name='正常范围'))
+            fig.add_trace(go.Scatter(x=history['Date'], y=history['Expected'], mode='lines',
+                                     line=dict(dash='dash', color='#1e88e5'), name='基线'))
+            fig.add_trace(go.Scatter(x=history['Date'], y=history['Value'], mode='lines',
+                                     line=dict(color='#555'), name='实际值'))
+            fig.add_trace(go.Scatter(x=flagged['Date'], y=flagged['Value'], mode='markers',
+                                     marker=dict(color='red', size=10, symbol='x'), name='异常'))
+            fig.update_layout(
+                title=f"{series_key[0]} / {series_key[1]} 日{metric_labels[series_metric]} (最近{len(history)}天)",
+                height=400
+            )
+            return fig, {}
+
+        fig_series, _ = cached_figure(df, 'time', 'anomaly_series', build_series_chart, {
+            'series': list(series_key), 'metric': series_metric, 'last_day': str(monitor_stats['last_day'])
+        })
+        st.plotly_chart(fig_series, use_container_width=True)
+
+    anomaly_section()
 
 def show_user_behavior_analysis(df):
     """基于RFM模型的用户行为画像"""
     st.markdown('<h2 class="section-header">🎯 用户行为画像</h2>', unsafe_allow_html=True)
     
-    # 计算RFM指标
-    current_date = df['Transaction_Date'].max()
-    
-    rfm_data = df.groupby('User_Name').agg({
-        'Transaction_Date': lambda x: (current_date - x.max()).days,  # Recency
-        'Transaction_ID': 'count',  # Frequency
-        'Purchase_Amount': 'sum'  # Monetary
-    }).reset_index()
-    
-    rfm_data.columns = ['User_Name', 'Recency', 'Frequency', 'Monetary']
-    
-    # RFM分位数划分 - 修复标签错误
-    try:
-        rfm_data['R_Score'] = pd.qcut(rfm_data['Recency'], q=5, duplicates='drop', labels=False) + 1
-        rfm_data['R_Score'] = 6 - rfm_data['R_Score']  # 反转分数，越近期分数越高
-        
-        rfm_data['F_Score'] = pd.qcut(rfm_data['Frequency'].rank(method='first'), q=5, duplicates='drop', labels=False) + 1
-        rfm_data['M_Score'] = pd.qcut(rfm_data['Monetary'], q=5, duplicates='drop', labels=False) + 1
-    except ValueError:
-        # 如果分位数划分失败，使用简单的分段方法
-        rfm_data['R_Score'] = pd.cut(rfm_data['Recency'], bins=5, labels=[5,4,3,2,1]).astype(int)
-        rfm_data['F_Score'] = pd.cut(rfm_data['Frequency'], bins=5, labels=[1,2,3,4,5]).astype(int)  
-        rfm_data['M_Score'] = pd.cut(rfm_data['Monetary'], bins=5, labels=[1,2,3,4,5]).astype(int)
-    
-    # 组合RFM分数
-    rfm_data['RFM_Score'] = rfm_data['R_Score'].astype(str) + rfm_data['F_Score'].astype(str) + rfm_data['M_Score'].astype(str)
-    
-    # 详细的用户细分逻辑
-    def rfm_segment_detailed(row):
-        r, f, m = row['R_Score'], row['F_Score'], row['M_Score']
-        if r >= 4 and f >= 4 and m >= 4:
-            return 'Champions'
-        elif r >= 3 and f >= 3 and m >= 3:
-            return 'Loyal Customers'
-        elif r >= 4 and f <= 2:
-            return 'New Customers'
-        elif r >= 3 and f >= 3 and m <= 2:
-            return 'Potential Loyalists'
-        elif r <= 2 and f >= 4 and m >= 4:
-            return 'At Risk'
-        elif r <= 2 and f <= 2:
-            return 'Lost Customers'
-        else:
-            return 'Others'
-    
-    rfm_data['Segment'] = rfm_data.apply(rfm_segment_detailed, axis=1)
-    
     # RFM标准说明表
     st.markdown("### 📋 RFM分层标准")
     st.markdown("*基于50,000笔交易数据，采用五分位数法评分*")
@@ -893,52 +1940,214 @@ def show_user_behavior_analysis(df):
     # 用户细分可视化
     st.markdown("### 🎯 用户细分分析")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # 用户细分分布
-        segment_counts = rfm_data['Segment'].value_counts()
-        fig_segments = px.pie(
-            values=segment_counts.values,
-            names=segment_counts.index,
-            title="用户细分分布占比",
-            color_discrete_sequence=px.colors.qualitative.Set3
-        )
-        fig_segments.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_segments, use_container_width=True)
+    # 细分、聚类和 CLV 各自是独立片段，调整本块控件时只重跑本块
+    @st.fragment(key='rfm_segments')
+    def segment_section():
+        segment_weights = {'Users': '用户数', 'Monetary': '消费金额'}
+        segment_weight = st.radio("统计口径", list(segment_weights), format_func=segment_weights.get, horizontal=True)
+
+        col1, col2 = st.columns(2)
+    
+        with col1:
+            # 用户细分分布
+            def build_segment_pie():
+                rfm_data = get_rfm(df)
+                if segment_weight == 'Monetary':
+                    segment_totals = rfm_data.groupby('Segment')['Monetary'].sum().sort_values(ascending=False)
+                else:
+                    segment_totals = rfm_data['Segment'].value_counts()
+                shares = segment_totals / segment_totals.sum() * 100
+                fig_segments = px.pie(
+                    values=segment_totals.values,
+                    names=segment_totals.index,
+                    title=f"用户细分{segment_weights[segment_weight]}占比",
+                    color_discrete_sequence=px.colors.qualitative.Set3
+                )
+                fig_segments.update_traces(textposition='inside', textinfo='percent+label')
+                return fig_segments, {
+                    'champion_pct': shares.get('Champions', 0.0),
+                    'at_risk_pct': shares.get('At Risk', 0.0)
+                }
+
+            fig_segments, segment_meta = cached_figure(df, 'rfm', 'segment_pie', build_segment_pie,
+                                                       {'weight': segment_weight})
+            st.plotly_chart(fig_segments, use_container_width=True)
         
-        champion_pct = (rfm_data['Segment'] == 'Champions').mean() * 100
-        at_risk_pct = (rfm_data['Segment'] == 'At Risk').mean() * 100
+            champion_pct = segment_meta['champion_pct']
+            at_risk_pct = segment_meta['at_risk_pct']
+        
+            st.markdown(f"""
+            <div class="chart-analysis">
+            <strong>💡 图表分析:</strong> Champions用户的{segment_weights[segment_weight]}占{champion_pct:.1f}%，是业务核心资产，需VIP服务维护。
+            At Risk用户的{segment_weights[segment_weight]}占{at_risk_pct:.1f}%，建议实施精准挽回营销。
+            基于RFM科学分层，为精准营销策略制定提供数据支撑。
+            </div>
+            """, unsafe_allow_html=True)
+    
+        with col2:
+            # RFM三维分布图
+            fig_rfm, _ = cached_figure(df, 'rfm', 'rfm_3d', lambda: (px.scatter_3d(
+                get_rfm(df),
+                x='Recency',
+                y='Frequency', 
+                z='Monetary',
+                color='Segment',
+                title="RFM三维分布",
+                labels={'Recency': '最近购买天数', 'Frequency': '购买频次', 'Monetary': '消费金额'}
+            ), {}))
+            st.plotly_chart(fig_rfm, use_container_width=True)
         
+            st.markdown(f"""
+            <div class="chart-analysis">
+            <strong>💡 图表分析:</strong> 用户在RFM三维空间中呈现明显的聚类特征，
+            不同细分群体具有显著差异。结合无监督学习算法(如K-means聚类)，
+            可进一步优化用户分层策略，为精准营销提供更科学的数据支撑。
+            </div>
+            """, unsafe_allow_html=True)
+
+    segment_section()
+
+    # 数据驱动的用户聚类
+    st.markdown("### 🧩 数据驱动的用户聚类")
+    st.markdown("*对标准化后的 R/F/M 与品类消费占比做小批量 K-means，与规则细分对照*")
+
+    @st.fragment(key='rfm_customer_clusters')
+    def cluster_section():
+        if not HAS_CLUSTERING:
+            st.info("💡 安装 scikit-learn 后可对用户做小批量 K-means 聚类")
+            return
+        n_users = len(get_user_metrics(df))
+        n_clusters = st.slider("聚类数 K", min_value=2, max_value=max(2, min(8, n_users)), value=min(5, max(2, n_users)))
+        clusters = get_customer_clusters(df, n_clusters)
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            profile = describe_centroids(clusters['centroids']).rename(columns={
+                'Cluster': '簇', 'Customers': '用户数', 'Recency': '最近购买天数', 'Frequency': '购买频次',
+                'Monetary': '消费金额', 'Top_Category': '偏好品类', 'Top_Share': '偏好品类占比'
+            })
+            st.dataframe(profile.round(2), hide_index=True, use_container_width=True)
+
+        with col2:
+            def build_cluster_crosstab():
+                merged = clusters['assignments'].merge(get_rfm(df)[['User_Name', 'Segment']], on='User_Name')
+                table = pd.crosstab(merged['Cluster'], merged['Segment'])
+                table.index = [f'簇 {c}' for c in table.index]
+                fig = px.imshow(
+                    table,
+                    text_auto=True,
+                    aspect='auto',
+                    color_continuous_scale='Blues',
+                    title="聚类簇 × 规则细分 用户数",
+                    labels={'x': '规则细分', 'y': '聚类簇', 'color': '用户数'}
+                )
+                # 纯度：每个簇中占比最高的规则细分所覆盖的用户比例
+                return fig, {
+                    'purity': table.max(axis=1).sum() / table.to_numpy().sum() * 100,
+                    'largest': table.sum(axis=1).idxmax(),
+                    'largest_segment': table.loc[table.sum(axis=1).idxmax()].idxmax()
+                }
+
+            fig_crosstab, cluster_meta = cached_figure(df, 'rfm', 'cluster_crosstab', build_cluster_crosstab,
+                                                       {'k': n_clusters})
+            st.plotly_chart(fig_crosstab, use_container_width=True)
+
         st.markdown(f"""
         <div class="chart-analysis">
-        <strong>💡 图表分析:</strong> Champions用户占{champion_pct:.1f}%，是业务核心资产，需VIP服务维护。
-        At Risk用户占{at_risk_pct:.1f}%，建议实施精准挽回营销。
-        基于RFM科学分层，为精准营销策略制定提供数据支撑。
+        <strong>💡 图表分析:</strong> 聚类与规则细分的吻合度为{cluster_meta['purity']:.1f}%，
+        最大的{cluster_meta['largest']}以{cluster_meta['largest_segment']}用户为主。
+        吻合度低的簇说明规则阈值之外还存在品类偏好等差异，可作为补充细分用于个性化推荐。
         </div>
         """, unsafe_allow_html=True)
-    
-    with col2:
-        # RFM三维分布图
-        fig_rfm = px.scatter_3d(
-            rfm_data,
-            x='Recency',
-            y='Frequency', 
-            z='Monetary',
-            color='Segment',
-            title="RFM三维分布",
-            labels={'Recency': '最近购买天数', 'Frequency': '购买频次', 'Monetary': '消费金额'}
-        )
-        st.plotly_chart(fig_rfm, use_container_width=True)
-        
+
+    cluster_section()
+
+    # 客户终身价值预测
+    st.markdown("### 💎 客户终身价值预测 (CLV)")
+    if not HAS_CLV:
+        st.info("💡 安装 SciPy 后可基于 BG/NBD + Gamma-Gamma 模型预测客户终身价值")
+        return
+
+    @st.fragment(key='rfm_clv')
+    def clv_section():
+        horizon = st.selectbox("预测期", [90, 180, 365], index=2, format_func=lambda d: f"未来{d}天")
+        clv_params = get_clv_params(df)
+        clv_scores = get_clv_scores(df, horizon)
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("💎 预测总价值", f"¥{clv_scores['CLV'].sum():,.0f}")
+        with col2:
+            st.metric("👤 人均CLV", f"¥{clv_scores['CLV'].mean():,.0f}")
+        with col3:
+            st.metric("💓 平均活跃概率", f"{clv_scores['P_Alive'].mean():.1%}")
+        with col4:
+            st.metric("🛒 预测购买次数", f"{clv_scores['Expected_Purchases'].sum():,.0f}")
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            def build_clv_by_segment():
+                merged = clv_scores.merge(get_rfm(df)[['User_Name', 'Segment']], on='User_Name')
+                by_segment = merged.groupby('Segment').agg(
+                    Avg_CLV=('CLV', 'mean'), Total_CLV=('CLV', 'sum'), Users=('User_Name', 'count')
+                ).reset_index().sort_values('Avg_CLV', ascending=False)
+                fig = px.bar(
+                    by_segment,
+                    x='Segment',
+                    y='Avg_CLV',
+                    title=f"各细分用户的人均预测价值 (未来{horizon}天)",
+                    labels={'Segment': '用户细分', 'Avg_CLV': '人均CLV (¥)'},
+                    text='Users'
+                )
+                fig.update_traces(texttemplate='%{text}人', textposition='outside')
+                top = by_segment.iloc[0]
+                return fig, {
+                    'top_segment': top['Segment'],
+                    'top_share': top['Total_CLV'] / by_segment['Total_CLV'].sum() * 100
+                }
+
+            fig_clv_segment, clv_meta = cached_figure(df, 'rfm', 'clv_by_segment', build_clv_by_segment,
+                                                      {'horizon': horizon})
+            st.plotly_chart(fig_clv_segment, use_container_width=True)
+
+        with col2:
+            fig_clv_dist, _ = cached_figure(df, 'rfm', 'clv_distribution', lambda: (px.scatter(
+                clv_scores,
+                x='P_Alive',
+                y='CLV',
+                size='Expected_Purchases',
+                hover_name='User_Name',
+                title="活跃概率与预测价值",
+                labels={'P_Alive': '活跃概率', 'CLV': '预测价值 (¥)', 'Expected_Purchases': '预测购买次数'}
+            ), {}), {'horizon': horizon})
+            st.plotly_chart(fig_clv_dist, use_container_width=True)
+
         st.markdown(f"""
         <div class="chart-analysis">
-        <strong>💡 图表分析:</strong> 用户在RFM三维空间中呈现明显的聚类特征，
-        不同细分群体具有显著差异。结合无监督学习算法(如K-means聚类)，
-        可进一步优化用户分层策略，为精准营销提供更科学的数据支撑。
+        <strong>💡 图表分析:</strong> {clv_meta['top_segment']}的人均预测价值最高，
+        贡献了{clv_meta['top_share']:.1f}%的预测总价值。活跃概率低但历史价值高的用户是挽回营销的重点对象，
+        建议结合CLV制定差异化的获客与留存预算。
         </div>
         """, unsafe_allow_html=True)
 
+        with st.expander("🏆 预测价值 Top 10 客户与模型参数"):
+            top_customers = clv_scores.nlargest(10, 'CLV').rename(columns={
+                'User_Name': '客户', 'P_Alive': '活跃概率', 'Expected_Purchases': '预测购买次数',
+                'Expected_Value': '预测客单价', 'CLV': '预测价值'
+            })
+            st.dataframe(top_customers.round(3), hide_index=True, use_container_width=True)
+            bgnbd = clv_params['bgnbd']
+            gamma_gamma = clv_params['gamma_gamma']
+            st.caption(
+                f"BG/NBD: r={bgnbd['r']:.3g}, α={bgnbd['alpha']:.3g}, a={bgnbd['a']:.3g}, b={bgnbd['b']:.3g} | "
+                f"Gamma-Gamma: p={gamma_gamma['p']:.3g}, q={gamma_gamma['q']:.3g}, v={gamma_gamma['v']:.3g} | "
+                f"时间单位 {clv_params['time_unit_days']} 天，共 {clv_params['customers']:,} 位客户"
+            )
+
+    clv_section()
+
 def show_user_preference_analysis(df):
     """用户购买偏好分析"""
     st.markdown('<h2 class="section-header">🛒 用户购买偏好分析</h2>', unsafe_allow_html=True)
@@ -982,26 +2191,20 @@ def show_user_preference_analysis(df):
     st.markdown("*基于用户购买品类多样性的行为分析*")
     
     user_behavior = df.groupby('User_Name').agg({
-        'Product_Category': lambda x: len(set(x)),  # 购买品类数
+        'Product_Category': 'nunique',  # 购买品类数
         'Transaction_ID': 'count',  # 总购买次数
         'Purchase_Amount': 'mean'  # 平均订单价值
     }).reset_index()
     
     user_behavior.columns = ['User_Name', 'Category_Count', 'Order_Count', 'AOV']
     
-    # 修正用户类型划分逻辑
-    def user_type_corrected(row):
-        categories = row['Category_Count']
-        total_categories = df['Product_Category'].nunique()  # 总共8个品类
-        
-        if categories <= 2:
-            return '专一型用户'
-        elif categories <= 5:
-            return '偏好型用户'  
-        else:
-            return '探索型用户'
-    
-    user_behavior['User_Type'] = user_behavior.apply(user_type_corrected, axis=1)
+    # 修正用户类型划分逻辑：1-2 个品类为专一型，3-5 个为偏好型，6 个及以上为探索型
+    # （向量化分箱，原逐行 apply 在每一行都对全表重新计算品类数）
+    user_behavior['User_Type'] = np.select(
+        [user_behavior['Category_Count'] <= 2, user_behavior['Category_Count'] <= 5],
+        ['专一型用户', '偏好型用户'],
+        default='探索型用户'
+    )
     
     # 添加用户类型统计信息
     type_stats = user_behavior['User_Type'].value_counts()
@@ -1085,41 +2288,25 @@ def show_user_preference_analysis(df):
             </div>
             """, unsafe_allow_html=True)
         else:
-            # 显示订单价值与品类数的关系 - 使用统计建模
-            correlation = user_behavior['Category_Count'].corr(user_behavior['AOV'])
-            
-            # 尝试使用plotly的统计功能
-            try:
-                fig_scatter = px.scatter(
-                    user_behavior,
-                    x='Category_Count',
-                    y='AOV',
+            # 显示订单价值与品类数的关系 - 由充分统计量计算回归，按品类数分箱展示均值
+            def build_category_aov():
+                acc = derived(df, 'category_aov_regression', lambda: RegressionAccumulator().update(
+                    user_behavior['Category_Count'], user_behavior['AOV']))
+                fig = binned_regression_figure(
+                    acc,
                     title="购买品类数与订单价值关系 - 回归分析",
-                    labels={'Category_Count': '购买品类数', 'AOV': '平均订单价值 (¥)'},
-                    trendline="ols"  # 普通最小二乘回归
-                )
-                
-                # 尝试获取回归结果
-                try:
-                    results = px.get_trendline_results(fig_scatter)
-                    if not results.empty:
-                        r_squared = results.iloc[0]["px_fit_results"].rsquared
-                        p_value = results.iloc[0]["px_fit_results"].pvalues.iloc[1]
-                        regression_info = f"R²={r_squared:.3f}, p={p_value:.3f}"
-                    else:
-                        regression_info = f"相关系数={correlation:.3f}"
-                except:
-                    regression_info = f"相关系数={correlation:.3f}"
-                    
-            except Exception:
-                # 回退到简单散点图
-                fig_scatter = px.scatter(
-                    user_behavior,
-                    x='Category_Count',
-                    y='AOV',
-                    title="购买品类数与订单价值关系",
-                    labels={'Category_Count': '购买品类数', 'AOV': '平均订单价值 (¥)'}
+                    x_label='购买品类数',
+                    y_label='平均订单价值 (¥)'
                 )
+                return fig, acc.result()
+
+            fig_scatter, fit = cached_figure(df, 'preference', 'category_aov_regression', build_category_aov)
+            correlation = fit['r']
+            if np.isfinite(fit['p_value']):
+                regression_info = f"R²={fit['r_squared']:.3f}, p={fit['p_value']:.3f}"
+            elif not np.isfinite(fit['slope']):
+                regression_info = "各用户购买品类数相同，无法拟合回归"
+            else:
                 regression_info = f"相关系数={correlation:.3f}"
             
             st.plotly_chart(fig_scatter, use_container_width=True)
@@ -1132,6 +2319,83 @@ def show_user_preference_analysis(df):
             </div>
             """, unsafe_allow_html=True)
 
+    # 下一品类预测
+    st.markdown("### 🔮 下一品类预测")
+    st.markdown("*基于用户购买序列的一阶/二阶马尔可夫转移，按 年龄段×国家 分段并逐级回退平滑*")
+
+    holdout = get_next_category_holdout(df)
+    if holdout is None:
+        st.info("复购序列不足，暂无法评估下一品类预测")
+    else:
+        model = get_next_category_model(df)
+        hit_rate = holdout['hit_rate'].set_index('K')
+        top_k = min(3, hit_rate.index.max())
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric(f"🎯 模型命中率@{top_k}", f"{hit_rate.loc[top_k, 'Model']:.1%}",
+                      f"{(hit_rate.loc[top_k, 'Model'] - hit_rate.loc[top_k, 'Popularity']) * 100:+.1f}pp")
+        with col2:
+            st.metric(f"🔥 热门基线@{top_k}", f"{hit_rate.loc[top_k, 'Popularity']:.1%}")
+        with col3:
+            st.metric("🧪 留出转移数", f"{holdout['test_transitions']:,}")
+        with col4:
+            st.metric("📦 模型大小", f"{model.nbytes / 1024:,.0f} KB")
+        st.caption(f"以 {holdout['cutoff']:%Y-%m-%d} 为切分点，模型只用此前的 {holdout['train_transitions']:,} 次转移拟合，"
+                   "用切分点之后每笔复购订单的实际前序订单预测其品类")
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            def build_hit_rate():
+                long = holdout['hit_rate'].melt(id_vars='K', var_name='Method', value_name='Hit_Rate')
+                long['Method'] = long['Method'].map({'Model': '马尔可夫模型', 'Popularity': '热门品类基线'})
+                fig = px.line(
+                    long,
+                    x='K',
+                    y='Hit_Rate',
+                    color='Method',
+                    markers=True,
+                    title="留出集命中率 hit@K",
+                    labels={'K': '推荐品类数 K', 'Hit_Rate': '命中率', 'Method': '方法'}
+                )
+                fig.update_yaxes(tickformat='.0%')
+                return fig, {}
+
+            fig_hit, _ = cached_figure(df, 'preference', 'next_category_hit_rate', build_hit_rate)
+            st.plotly_chart(fig_hit, use_container_width=True)
+
+        with col2:
+            fig_transition, _ = cached_figure(df, 'preference', 'category_transition', lambda: (px.imshow(
+                model.transition_matrix(),
+                text_auto='.0%',
+                aspect='auto',
+                color_continuous_scale='Purples',
+                title="品类转移概率 (全局一阶)",
+                labels={'x': '下一笔品类', 'y': '当前品类', 'color': '概率'}
+            ), {}))
+            st.plotly_chart(fig_transition, use_container_width=True)
+
+        lift = hit_rate.loc[top_k, 'Model'] - hit_rate.loc[top_k, 'Popularity']
+        st.markdown(f"""
+        <div class="chart-analysis">
+        <strong>💡 图表分析:</strong> 推荐{top_k}个品类时，转移模型的留出命中率比直接推荐热门品类
+        {'高' if lift >= 0 else '低'}{abs(lift) * 100:.1f}个百分点。
+        {'购买序列中存在可利用的品类先后关系，可用于“下一单”推荐和交叉营销。' if lift > 0.01 else '品类先后关系较弱，推荐时应更多依赖整体热度与用户偏好。'}
+        </div>
+        """, unsafe_allow_html=True)
+
+        # 单用户推荐放在独立片段里，输入客户名只重跑这一块
+        @st.fragment(key='next_category_lookup')
+        def next_category_lookup():
+            user_name = st.text_input("查看客户的下一品类推荐（输入完整姓名）", str(model.user_names[0]))
+            recommendations = model.recommend(user_name)
+            recommendations.columns = ['推荐品类', '概率']
+            recommendations['概率'] = recommendations['概率'].map(lambda p: f"{p:.1%}")
+            st.dataframe(recommendations, use_container_width=True, hide_index=True)
+
+        next_category_lookup()
+
     # 页面底部信息
     st.markdown("---")
     st.markdown("""
@@ -1141,6 +2405,110 @@ def show_user_preference_analysis(df):
     </div>
     """, unsafe_allow_html=True)
 
+def show_customer_lookup(df):
+    """单个客户360视图"""
+    st.markdown('<h2 class="section-header">🔎 客户查询</h2>', unsafe_allow_html=True)
+
+    index = get_customer_index(df)
+
+    # 查询区放在独立片段里：换客户只重跑查询区，不重新加载数据和侧边栏
+    @st.fragment(key='customer_lookup')
+    def lookup_section():
+        # 姓名前缀搜索
+        prefix = st.text_input("输入客户姓名（前缀匹配，不区分大小写）", "")
+        matches = prefix_search(index, prefix, limit=50)
+        if not matches:
+            st.warning("⚠️ 没有匹配的客户")
+            return
+
+        selected_user = st.selectbox(f"匹配到的客户 (显示前{len(matches)}个)", matches)
+        profile = customer_profile(index, selected_user)
+        history = profile['history']
+        rfm_row = profile['rfm']
+        gaps = profile['gaps']
+
+        # 关键指标
+        col1, col2, col3, col4 = st.columns(4)
+
+        with col1:
+            st.metric("📦 订单数", f"{len(history):,}")
+        with col2:
+            st.metric("💰 总消费", f"¥{history['Purchase_Amount'].sum():,.0f}")
+        with col3:
+            st.metric("💵 平均订单价值", f"¥{history['Purchase_Amount'].mean():.0f}")
+        with col4:
+            st.metric("🏷️ RFM细分", rfm_row['Segment'])
+
+        st.markdown(f"""
+        <div class="chart-analysis">
+        <strong>👤 客户档案:</strong> {history['Age'].iloc[0]}岁，来自{history['Country'].iloc[0]}，
+        首次购买于{history['Transaction_Date'].min().strftime('%Y-%m-%d')}，
+        最近一次购买于{history['Transaction_Date'].max().strftime('%Y-%m-%d')}（{rfm_row['Recency']}天前）。
+        RFM评分 R={rfm_row['R_Score']} / F={rfm_row['F_Score']} / M={rfm_row['M_Score']}。
+        </div>
+        """, unsafe_allow_html=True)
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # 品类构成
+            fig_mix = px.pie(
+                profile['category_mix'],
+                values='Spend',
+                names='Product_Category',
+                title="消费品类构成"
+            )
+            st.plotly_chart(fig_mix, use_container_width=True)
+
+        with col2:
+            # 复购间隔分布
+            if len(gaps) > 0:
+                fig_gaps = px.histogram(
+                    gaps,
+                    x='Gap_Days',
+                    nbins=30,
+                    title=f"复购间隔分布 (中位数 {gaps.median():.0f} 天)",
+                    labels={'Gap_Days': '间隔天数', 'count': '次数'}
+                )
+                st.plotly_chart(fig_gaps, use_container_width=True)
+            else:
+                st.info("该客户只有一笔交易，暂无复购间隔")
+
+        # 交易明细
+        st.markdown("### 📋 交易明细")
+        st.dataframe(
+            history[['Transaction_ID', 'Transaction_Date', 'Product_Category', 'Purchase_Amount', 'Payment_Method']],
+            use_container_width=True,
+            hide_index=True
+        )
+
+        # 相似客户：R/F/M 与品类消费占比的余弦相似度
+        st.markdown("### 👯 相似客户")
+        similar_index = get_similar_customers(df)
+        n_similar = st.slider("相似客户数", min_value=5, max_value=30, value=10, step=5)
+        start = time.perf_counter()
+        similar = similar_index.query(selected_user, n_similar)
+        query_ms = (time.perf_counter() - start) * 1000
+        method_labels = {'balltree': '球树精确检索', 'brute': '精确检索', 'lsh': '随机投影近似检索'}
+        st.caption(f"基于 {len(similar_index.names):,} 位客户的 R/F/M 与品类消费占比，"
+                   f"{method_labels[similar_index.method]}，本次查询 {query_ms:.1f} ms")
+        if similar is None or similar.empty:
+            st.info("没有可比较的其他客户")
+            return
+
+        share_columns = [c for c in similar.columns if c.startswith('Share_')]
+        similar_table = pd.DataFrame({
+            '客户': similar['User_Name'],
+            '相似度': similar['Similarity'].round(3),
+            '最近购买天数': similar['Recency'].round(0).astype(int),
+            '订单数': np.expm1(similar['Log_Frequency']).round(0).astype(int),
+            '消费总额': np.expm1(similar['Log_Monetary']).map(lambda v: f"¥{v:,.0f}"),
+            '偏好品类': similar[share_columns].idxmax(axis=1).str[len('Share_'):] if share_columns else '',
+        })
+        st.dataframe(similar_table, use_container_width=True, hide_index=True)
+
+    lookup_section()
+
 if __name__ == "__main__":
 
     main()
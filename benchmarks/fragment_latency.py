@@ -0,0 +1,191 @@
+"""片段级重跑延迟对比：整页重跑 vs 只重跑控件所在的 st.fragment
+
+对每个带片段的图表块，交替切换块内控件的取值，分别计时：
+- 整页重跑：与旧版行为相同，控件变化后整个 app.py 从头执行；
+- 片段重跑：与浏览器中操作片段内控件相同，只执行该片段。
+两种方式的取值都先各跑一遍预热缓存，计时的都是缓存命中后的交互延迟。
+
+AppTest 没有公开的“只重跑某个片段”的入口，片段重跑借用了它的内部接口
+（片段登记表和 RerunData 的 fragment_id_queue），只在 STREAMLIT_TESTED 列出的
+版本上验证过：其他版本默认拒绝运行（--allow-untested-streamlit 可跳过版本检查），
+内部接口缺失时直接报错退出，不会静默测成整页重跑。
+
+用法：
+    python benchmarks/fragment_latency.py --rows 1000000 --reps 5
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic import write_synthetic_csv
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = str(ROOT / "app.py")
+MODULE_LABEL = "选择分析模块"
+DATASET_LABEL = "选择数据集"
+
+# 片段重跑所依赖的 AppTest 内部接口已验证的 Streamlit 版本 (主版本.次版本)
+STREAMLIT_TESTED = ("1.66",)
+
+# run_fragment 临时替换模块级的 RerunData，同一进程内的并发调用需串行
+_PATCH_LOCK = threading.Lock()
+
+# (模块, 片段 key, 控件类型, 控件标签前缀, 交替的两个取值；None 表示取控件的前两个选项)
+CONTROLS = [
+    ("📈 数据概览", "overview_concentration", "radio", "集中度维度", ("customers", "countries")),
+    ("🌍 地区分析", "country_value", "select_slider", "平滑参数 m", (30, 100)),
+    ("🛍️ 产品分析", "product_pareto", "slider", "核心收入线", (80, 70)),
+    ("📅 时间趋势", "time_weekday_pattern", "radio", "对比指标", ("Total_Sales", "Transaction_Count")),
+    ("📅 时间趋势", "time_anomaly_monitor", "radio", "指标", ("Revenue", "Orders")),
+    ("🎯 用户行为画像", "rfm_segments", "radio", "统计口径", ("Users", "Monetary")),
+    ("🎯 用户行为画像", "rfm_customer_clusters", "slider", "聚类数 K", (5, 4)),
+    ("🎯 用户行为画像", "rfm_clv", "selectbox", "预测期", (365, 180)),
+    ("🔎 客户查询", "customer_lookup", "selectbox", "匹配到的客户", None),
+]
+
+
+def _selectbox(at, label):
+    return next(s for s in at.sidebar.selectbox if s.label == label)
+
+
+def _widget(at, kind, label):
+    return next(w for w in getattr(at, kind) if w.label.startswith(label))
+
+
+def check_streamlit(at, allow_untested=False):
+    """确认当前 Streamlit 版本和片段重跑所需的 AppTest 内部接口，不满足时报错退出"""
+    import dataclasses
+
+    import streamlit
+    from streamlit.testing.v1 import local_script_runner
+
+    version = ".".join(streamlit.__version__.split(".")[:2])
+    if version not in STREAMLIT_TESTED and not allow_untested:
+        raise SystemExit(f"fragment_latency.py 依赖 AppTest 内部接口，只在 Streamlit {', '.join(STREAMLIT_TESTED)} 上验证过，"
+                         f"当前为 {streamlit.__version__}；请安装已验证的版本，或确认接口未变后加 --allow-untested-streamlit")
+    rerun_data = getattr(local_script_runner, "RerunData", None)
+    missing = []
+    if rerun_data is None or "fragment_id_queue" not in {f.name for f in dataclasses.fields(rerun_data)}:
+        missing.append("streamlit.testing.v1.local_script_runner.RerunData(fragment_id_queue=...)")
+    if not hasattr(getattr(at, "_fragment_storage", None), "_ids_by_target_key"):
+        missing.append("AppTest._fragment_storage._ids_by_target_key")
+    if not callable(getattr(at, "_run", None)):
+        missing.append("AppTest._run")
+    if missing:
+        raise SystemExit(f"Streamlit {streamlit.__version__} 的 AppTest 缺少片段重跑所需的内部接口: {'; '.join(missing)}")
+
+
+def run_fragment(at, fragment_key):
+    """按浏览器中片段内控件变化时的方式，只重跑指定 key 的片段（接口由 check_streamlit 预先检查）"""
+    from streamlit.testing.v1 import local_script_runner
+
+    fragment_ids = list(at._fragment_storage._ids_by_target_key.get(fragment_key, {}))
+    if not fragment_ids:
+        raise RuntimeError(f"本次运行没有登记片段 {fragment_key}")
+    with _PATCH_LOCK:
+        rerun_data = local_script_runner.RerunData
+        local_script_runner.RerunData = functools.partial(rerun_data, fragment_id_queue=fragment_ids)
+        try:
+            return at._run(at._tree.get_widget_states())
+        finally:
+            local_script_runner.RerunData = rerun_data
+
+
+def measure_control(at, module, fragment_key, kind, label, values, reps):
+    """返回 (整页重跑耗时列表, 片段重跑耗时列表)"""
+    _selectbox(at, MODULE_LABEL).set_value(module).run()
+    if values is None:
+        values = tuple(_widget(at, kind, label).options[:2])
+    full, partial = [], []
+    for i in range(reps + 1):
+        value = values[i % 2]
+        # 整页重跑
+        _widget(at, kind, label).set_value(value)
+        start = time.perf_counter()
+        at.run()
+        elapsed_full = time.perf_counter() - start
+
+        # 片段重跑（先切回另一个取值，再只重跑片段）
+        _widget(at, kind, label).set_value(values[(i + 1) % 2])
+        start = time.perf_counter()
+        run_fragment(at, fragment_key)
+        elapsed_partial = time.perf_counter() - start
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        # 片段重跑后的元素树只有片段内容，整页跑一次恢复
+        at.run()
+        if i:
+            # 第一轮两个取值都还没进缓存，不计入
+            full.append(elapsed_full)
+            partial.append(elapsed_partial)
+    return full, partial
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="合成数据行数")
+    parser.add_argument("--users", type=int, default=None, help="合成数据用户数 (默认 行数/50)")
+    parser.add_argument("--reps", type=int, default=5, help="每个控件的计时次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="单次重跑超时 (秒)")
+    parser.add_argument("--data-dir", default=None, help="合成数据目录 (默认临时目录)")
+    parser.add_argument("--json", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--allow-untested-streamlit", action="store_true",
+                        help="在未验证的 Streamlit 版本上运行（内部接口缺失时仍会报错退出）")
+    args = parser.parse_args()
+
+    os.environ.setdefault("STREAMLIT_BROWSER_GATHER_USAGE_STATS", "false")
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="ecom_fragment_")
+    dataset_name = f"synthetic_{args.rows}"
+    write_synthetic_csv(os.path.join(data_dir, dataset_name + ".csv"), args.rows, args.users, args.seed)
+    os.environ["DATASET_DIR"] = data_dir
+    os.chdir(ROOT)
+
+    import logging
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.run()
+    check_streamlit(at, args.allow_untested_streamlit)
+    _selectbox(at, DATASET_LABEL).set_value(dataset_name).run()
+    modules = _selectbox(at, MODULE_LABEL).options
+
+    results = []
+    for module, fragment_key, kind, label, values in CONTROLS:
+        if module not in modules:
+            continue
+        full, partial = measure_control(at, module, fragment_key, kind, label, values, args.reps)
+        p50_full = float(np.median(full)) * 1000
+        p50_partial = float(np.median(partial)) * 1000
+        results.append({
+            "module": module,
+            "fragment": fragment_key,
+            "full_p50_ms": round(p50_full, 1),
+            "fragment_p50_ms": round(p50_partial, 1),
+            "reduction_pct": round((1 - p50_partial / p50_full) * 100, 1) if p50_full else 0.0,
+        })
+
+    print(f"数据集: {args.rows:,} 行 | 每个控件计时 {args.reps} 次 (缓存命中后)")
+    print(f"{'模块':<14}{'片段':<24}{'整页p50(ms)':>12}{'片段p50(ms)':>12}{'降低':>8}")
+    for r in results:
+        print(f"{r['module']:<14}{r['fragment']:<24}{r['full_p50_ms']:>12}{r['fragment_p50_ms']:>12}"
+              f"{r['reduction_pct']:>7}%")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": args.rows, "reps": args.reps, "controls": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
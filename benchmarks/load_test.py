@@ -0,0 +1,182 @@
+"""并发会话压测：用 Streamlit AppTest 无界面驱动 app.py
+
+模拟 N 个会话在侧边栏各分析模块之间随机切换，统计每次重跑的延迟
+(p50/p95/p99)、吞吐量和进程内存，数据为指定规模的合成数据集，完全离线运行。
+
+用法：
+    python benchmarks/load_test.py --rows 1000000 --sessions 8 --reruns 20
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic import write_synthetic_csv
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = str(ROOT / "app.py")
+MODULE_LABEL = "选择分析模块"
+DATASET_LABEL = "选择数据集"
+
+
+def current_rss_mb():
+    """当前进程常驻内存 (MB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存 (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _serialize_script_compilation():
+    """多个会话线程同时编译 app.py 时 ast.parse 会出错，给编译步骤加锁"""
+    from streamlit.runtime.scriptrunner import magic, script_cache
+
+    lock = threading.Lock()
+    add_magic = magic.add_magic
+
+    def locked_add_magic(code, script_path):
+        with lock:
+            return add_magic(code, script_path)
+
+    script_cache.magic.add_magic = locked_add_magic
+
+
+def _selectbox(at, label):
+    return next(s for s in at.sidebar.selectbox if s.label == label)
+
+
+def run_session(session_id, dataset_name, modules, reruns, seed, timeout, results, errors):
+    """单个模拟会话：选中数据集后在模块之间随机切换"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng(seed + session_id)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    try:
+        at.run()
+        _selectbox(at, DATASET_LABEL).set_value(dataset_name).run()
+    except Exception as e:
+        errors.append(("<启动>", repr(e)))
+        return
+    for _ in range(reruns):
+        module = modules[rng.integers(0, len(modules))]
+        start = time.perf_counter()
+        try:
+            _selectbox(at, MODULE_LABEL).set_value(module).run()
+        except Exception as e:
+            # 上一次重跑失败后侧边栏可能不完整，本会话到此结束
+            errors.append((module, repr(e)))
+            return
+        elapsed = time.perf_counter() - start
+        if at.exception:
+            errors.append((module, at.exception[0].message))
+        results.append((module, elapsed))
+
+
+def percentiles(values):
+    """p50/p95/p99 (毫秒)"""
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99]).tolist()
+    return {"p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="合成数据行数")
+    parser.add_argument("--users", type=int, default=None, help="合成数据用户数 (默认 行数/50)")
+    parser.add_argument("--sessions", type=int, default=4, help="并发会话数")
+    parser.add_argument("--reruns", type=int, default=10, help="每个会话的模块切换次数")
+    parser.add_argument("--modules", nargs="*", default=None, help="只测试名称包含这些关键字的模块")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="单次重跑超时 (秒)")
+    parser.add_argument("--data-dir", default=None, help="合成数据目录 (默认临时目录)")
+    parser.add_argument("--json", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    os.environ.setdefault("STREAMLIT_BROWSER_GATHER_USAGE_STATS", "false")
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="ecom_loadtest_")
+    dataset_name = f"synthetic_{args.rows}"
+    write_synthetic_csv(os.path.join(data_dir, dataset_name + ".csv"), args.rows, args.users, args.seed)
+    os.environ["DATASET_DIR"] = data_dir
+    os.chdir(ROOT)
+
+    import logging
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    from streamlit.testing.v1 import AppTest
+    _serialize_script_compilation()
+
+    # 预热：加载数据集并读取模块列表（冷启动时间单独报告）
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.run()
+    _selectbox(at, DATASET_LABEL).set_value(dataset_name).run()
+    cold_load = time.perf_counter() - start
+    modules = _selectbox(at, MODULE_LABEL).options
+    if args.modules:
+        modules = [m for m in modules if any(k in m for k in args.modules)]
+
+    results, errors = [], []
+    threads = [
+        threading.Thread(target=run_session,
+                         args=(i, dataset_name, modules, args.reruns, args.seed, args.timeout, results, errors))
+        for i in range(args.sessions)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed for _, elapsed in results]
+    report = {
+        "rows": args.rows,
+        "sessions": args.sessions,
+        "reruns": len(results),
+        "cold_load_s": round(cold_load, 2),
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(results) / wall, 2) if wall else 0.0,
+        "overall": percentiles(latencies) if latencies else {},
+        "modules": {
+            module: dict(percentiles([e for m, e in results if m == module]),
+                         n=sum(1 for m, _ in results if m == module))
+            for module in modules if any(m == module for m, _ in results)
+        },
+        "rss_mb": {"before": round(rss_before, 1), "after": round(current_rss_mb(), 1), "peak": round(peak_rss_mb(), 1)},
+        "errors": errors,
+    }
+
+    print(f"数据集: {args.rows:,} 行 | 会话: {args.sessions} | 重跑: {len(results)} | 冷启动加载: {cold_load:.2f}s")
+    print(f"总耗时: {wall:.2f}s | 吞吐量: {report['throughput_rps']} 次重跑/秒")
+    print(f"整体延迟: {report['overall']}")
+    print(f"{'模块':<16}{'n':>5}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for module, stats in report["modules"].items():
+        print(f"{module:<16}{stats['n']:>5}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"进程内存 (MB): {report['rss_mb']}")
+    if errors:
+        print(f"⚠️ {len(errors)} 次重跑出现异常，例如: {errors[0]}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""性能回归门禁：在固定的合成数据上计时 app.py 各分析函数和 电商分析.py 各单元格，
+与提交在仓库中的基线 (benchmarks/perf_baseline.json) 比较
+
+每个基准重复运行若干次，取中位数和 MAD（中位数绝对偏差）；另做一次 tracemalloc
+运行记录内存峰值。当前中位数超过 基线×(1+容差) 且超出部分大于噪声带
+(k×MAD) 和最小绝对差时判定为变慢；内存峰值同理。存在回归时输出逐项对比并以非零退出。
+
+基线记录生成时的校准耗时（固定的 NumPy/Pandas 工作负载），比较前按当前机器的
+校准耗时缩放基线，以减小不同机器之间的差异。
+
+用法：
+    python benchmarks/perf_gate.py                # 与基线比较
+    python benchmarks/perf_gate.py --update       # 重新生成基线
+    python benchmarks/perf_gate.py --only show_user_preference_analysis
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic import write_synthetic_csv
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT_PATH = ROOT / "电商分析.py"
+BASELINE_PATH = Path(__file__).resolve().parent / "perf_baseline.json"
+DATA_FILE = "ecommerce_transactions.csv"
+
+# 参与计时的 app.py 分析函数（均以 df 为唯一参数）
+APP_FUNCTIONS = [
+    "create_user_analysis",
+    "create_geographic_analysis",
+    "show_data_overview",
+    "show_user_analysis",
+    "show_geographic_analysis",
+    "show_product_analysis",
+    "show_payment_analysis",
+    "show_time_analysis",
+    "show_user_behavior_analysis",
+    "show_user_preference_analysis",
+    "show_customer_lookup",
+]
+
+CELL_PATTERN = re.compile(r"^# In\[(.*?)\]:", re.M)
+
+
+def calibrate(repeat=7):
+    """固定工作负载的最短耗时（首轮预热不计），用于在不同机器之间缩放基线"""
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"k": rng.integers(0, 1000, 500_000), "v": rng.random(500_000)})
+    times = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        frame.groupby("k")["v"].agg(["sum", "mean", "count"])
+        np.sort(frame["v"].to_numpy())
+        times.append(time.perf_counter() - start)
+    return float(min(times[1:]))
+
+
+def median_mad(values):
+    values = np.asarray(values, dtype=np.float64)
+    median = np.median(values)
+    return float(median), float(np.median(np.abs(values - median)))
+
+
+def split_cells(source):
+    """按 '# In[n]:' 标记把导出的 notebook 脚本拆成 [(名称, 代码)]"""
+    marks = list(CELL_PATTERN.finditer(source))
+    cells, seen = [], {}
+    for i, mark in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(source)
+        if not source[mark.end():end].strip():
+            continue
+        label = mark.group(1).strip() or "_"
+        seen[label] = seen.get(label, 0) + 1
+        name = f"script:In[{label}]" + (f"#{seen[label]}" if seen[label] > 1 else "")
+        # 在代码前补空行，使报错的行号与原文件一致
+        line_no = source.count("\n", 0, mark.start())
+        cells.append((name, "\n" * line_no + source[mark.start():end]))
+    return cells
+
+
+class Bench:
+    """收集一组基准的耗时和内存峰值"""
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.times = {}
+        self.peaks = {}
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        if self.trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.trace:
+                self.peaks[name] = (tracemalloc.get_traced_memory()[1] - base) / 1024 ** 2
+            else:
+                self.times[name] = elapsed
+
+
+def _inline_fragment(func=None, *args, **kwargs):
+    # 裸模式下 @st.fragment 装饰的函数体不会执行，计时时按普通函数内联运行（与 report.py 记录片段的方式相同）
+    if func is None:
+        return lambda f: f
+    return func
+
+
+def run_app_functions(app, df, bench, only=None):
+    """依次调用 app.py 的分析函数，每次调用前清空图表和数据集缓存；片段内联运行，计入所在函数"""
+    fragment = app.st.fragment
+    app.st.fragment = _inline_fragment
+    try:
+        for func_name in APP_FUNCTIONS:
+            name = f"app:{func_name}"
+            if only and not any(k in name for k in only):
+                continue
+            app.get_dataset_cache.clear()
+            app.get_figure_cache.clear()
+            with bench.measure(name):
+                getattr(app, func_name)(df)
+    finally:
+        app.st.fragment = fragment
+
+
+def run_script_cells(cells, workdir, bench, only=None):
+    """在新的命名空间中依次执行脚本单元格（后面的单元格依赖前面的变量）"""
+    import matplotlib.pyplot as plt
+
+    namespace = {"__name__": "__perf__", "__file__": str(SCRIPT_PATH)}
+    with contextlib.chdir(workdir), contextlib.redirect_stdout(io.StringIO()):
+        for name, code in cells:
+            compiled = compile(code, str(SCRIPT_PATH), "exec")
+            if only and not any(k in name for k in only):
+                exec(compiled, namespace)
+            else:
+                with bench.measure(name):
+                    exec(compiled, namespace)
+            plt.close("all")
+
+
+def collect(args):
+    """运行全部基准，返回 {名称: {median_s, mad_s, peak_mb, runs}}"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import plotly.basedatatypes
+    plotly.basedatatypes.BaseFigure.show = lambda self, *a, **k: None
+    warnings.filterwarnings("ignore")
+
+    workdir = tempfile.mkdtemp(prefix="ecom_perf_")
+    data_path = write_synthetic_csv(os.path.join(workdir, DATA_FILE), args.rows, args.users, args.seed)
+
+    sys.path.insert(0, str(ROOT))
+    import app
+    from ingest import load_transactions
+
+    # 裸模式下 Streamlit 对每个组件调用都会打印警告（日志级别在导入 app 时按配置重置）
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+
+    df = load_transactions(data_path)
+    df.attrs["dataset_name"] = "perf"
+    df.attrs["dataset_path"] = data_path
+    cells = split_cells(SCRIPT_PATH.read_text(encoding="utf-8"))
+
+    def one_pass(bench):
+        run_app_functions(app, df, bench, args.only)
+        if args.only is None or any(k.startswith("script") for k in args.only):
+            run_script_cells(cells, workdir, bench, args.only)
+
+    for _ in range(args.warmup):
+        one_pass(Bench())
+
+    runs = []
+    for _ in range(args.repeat):
+        bench = Bench()
+        one_pass(bench)
+        runs.append(bench.times)
+
+    tracemalloc.start()
+    mem = Bench(trace=True)
+    one_pass(mem)
+    tracemalloc.stop()
+
+    results = {}
+    for name in runs[0]:
+        samples = [run[name] for run in runs]
+        median, mad = median_mad(samples)
+        results[name] = {
+            "median_s": round(median, 5),
+            "mad_s": round(mad, 5),
+            "peak_mb": round(mem.peaks.get(name, 0.0), 2),
+            "runs": [round(s, 5) for s in samples],
+        }
+    return results
+
+
+def compare(baseline, current, scale, args):
+    """逐项比较，返回 (报告行, 回归项列表)"""
+    rows, regressions = [], []
+    base_items = baseline.get("benchmarks", {})
+    # 按运行顺序列出，基线中有而本次没有运行的项放在最后
+    for name in list(current) + [n for n in base_items if n not in current]:
+        base, cur = base_items.get(name), current.get(name)
+        if cur is None:
+            if not args.only:
+                rows.append((name, base["median_s"] * scale, None, None, base["peak_mb"], None, "missing"))
+            continue
+        if base is None:
+            rows.append((name, None, cur["median_s"], None, None, cur["peak_mb"], "new"))
+            continue
+
+        base_median = base["median_s"] * scale
+        noise = args.noise_k * 1.4826 * max(base["mad_s"] * scale, cur["mad_s"])
+        limit = max(base_median * (1 + args.time_tol), base_median + args.min_delta_ms / 1000) + noise
+        mem_limit = max(base["peak_mb"] * (1 + args.mem_tol), base["peak_mb"] + args.min_delta_mb)
+
+        status = []
+        if cur["median_s"] > limit:
+            status.append("slower")
+        if cur["peak_mb"] > mem_limit:
+            status.append("more memory")
+        if status:
+            regressions.append(name)
+        change = (cur["median_s"] / base_median - 1) * 100 if base_median > 0 else 0.0
+        rows.append((name, base_median, cur["median_s"], change, base["peak_mb"], cur["peak_mb"],
+                     ", ".join(status) or "ok"))
+    return rows, regressions
+
+
+def print_report(rows, scale):
+    fmt_s = lambda v: "-" if v is None else f"{v * 1000:.1f}"
+    fmt_mb = lambda v: "-" if v is None else f"{v:.1f}"
+    print(f"基线缩放系数 (校准): {scale:.2f}")
+    print(f"{'基准':<44}{'基线ms':>10}{'当前ms':>10}{'变化':>9}{'基线MB':>9}{'当前MB':>9}  状态")
+    for name, base_s, cur_s, change, base_mb, cur_mb, status in rows:
+        change_text = "-" if change is None else f"{change:+.0f}%"
+        print(f"{name:<44}{fmt_s(base_s):>10}{fmt_s(cur_s):>10}{change_text:>9}"
+              f"{fmt_mb(base_mb):>9}{fmt_mb(cur_mb):>9}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="基线文件路径")
+    parser.add_argument("--update", action="store_true", help="运行后写入新的基线")
+    parser.add_argument("--rows", type=int, default=50_000, help="合成数据行数")
+    parser.add_argument("--users", type=int, default=None, help="合成数据用户数 (默认 行数/50)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="每个基准的计时次数")
+    parser.add_argument("--warmup", type=int, default=1, help="不计入结果的预热轮数")
+    parser.add_argument("--only", nargs="*", default=None, help="只运行名称包含这些关键字的基准")
+    parser.add_argument("--time-tol", type=float, default=0.5, help="允许的相对变慢比例")
+    parser.add_argument("--mem-tol", type=float, default=0.25, help="允许的内存峰值相对增长")
+    parser.add_argument("--noise-k", type=float, default=3.0, help="噪声带宽度 (MAD 的倍数)")
+    parser.add_argument("--min-delta-ms", type=float, default=20.0, help="低于此绝对差的变慢不计")
+    parser.add_argument("--min-delta-mb", type=float, default=2.0, help="低于此绝对差的内存增长不计")
+    parser.add_argument("--no-calibrate", action="store_true", help="不按校准耗时缩放基线")
+    args = parser.parse_args()
+
+    # 运行前后各校准一次取平均，反映整个运行期间的机器状态
+    calibration = calibrate()
+    current = collect(args)
+    calibration = (calibration + calibrate()) / 2
+
+    if args.update:
+        baseline = {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "rows": args.rows,
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "calibration_s": round(calibration, 5),
+            },
+            "benchmarks": current,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=1)
+        print(f"已写入基线 {args.baseline} ({len(current)} 项)")
+        return 0
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        print(f"❌ 找不到基线文件 {args.baseline}，请先运行 --update 生成")
+        return 2
+
+    meta = baseline.get("meta", {})
+    if meta.get("rows") != args.rows or meta.get("seed") != args.seed:
+        print(f"⚠️ 基线数据规模为 rows={meta.get('rows')} seed={meta.get('seed')}，与本次运行不一致")
+    scale = 1.0
+    if not args.no_calibrate and meta.get("calibration_s"):
+        scale = calibration / meta["calibration_s"]
+
+    rows, regressions = compare(baseline, current, scale, args)
+    print_report(rows, scale)
+    if regressions:
+        print(f"\n❌ {len(regressions)} 项性能回归: {', '.join(regressions)}")
+        return 1
+    print("\n✅ 未发现性能回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
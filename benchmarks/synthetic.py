@@ -0,0 +1,57 @@
+"""生成与 ecommerce_transactions.csv 同结构的合成交易数据（离线、可复现）"""
+import os
+
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = ["Ava", "Sophia", "Liam", "Noah", "Emma", "Olivia", "Mia", "Lucas", "Ethan", "Isabella",
+               "James", "Amelia", "Harper", "Elijah", "Mason", "Evelyn", "Logan", "Abigail", "Jacob", "Emily"]
+LAST_NAMES = ["Hall", "Allen", "Anderson", "Clark", "Harris", "Smith", "Johnson", "Brown", "Lee", "Walker",
+              "Young", "King", "Wright", "Lopez", "Hill", "Scott", "Green", "Adams", "Baker", "Nelson"]
+COUNTRIES = ["USA", "UK", "Canada", "Germany", "France", "India", "Japan", "Mexico", "Brazil", "Australia"]
+CATEGORIES = ["Electronics", "Clothing", "Home & Kitchen", "Books", "Toys", "Beauty", "Sports", "Grocery"]
+PAYMENT_METHODS = ["Credit Card", "Debit Card", "PayPal", "UPI", "Net Banking", "Cash on Delivery"]
+
+
+def make_user_names(n_users):
+    """生成 n_users 个不重复的姓名，组合用完后追加编号"""
+    idx = np.arange(n_users)
+    base = len(FIRST_NAMES) * len(LAST_NAMES)
+    first = np.array(FIRST_NAMES, dtype=object)[idx % len(FIRST_NAMES)]
+    last = np.array(LAST_NAMES, dtype=object)[(idx // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    names = first + " " + last
+    suffix = idx // base
+    has_suffix = suffix > 0
+    names[has_suffix] = names[has_suffix] + " " + suffix[has_suffix].astype(str).astype(object)
+    return names
+
+
+def make_transactions(n_rows, n_users=None, seed=0, start="2023-03-09", days=731):
+    """生成 n_rows 行合成交易数据"""
+    if n_users is None:
+        n_users = max(100, n_rows // 50)
+    rng = np.random.default_rng(seed)
+
+    names = make_user_names(n_users)
+    user_age = rng.integers(18, 70, n_users)
+    user_country = rng.integers(0, len(COUNTRIES), n_users)
+    users = rng.integers(0, n_users, n_rows)
+
+    start_day = np.datetime64(start, "D")
+    return pd.DataFrame({
+        "Transaction_ID": np.arange(1, n_rows + 1),
+        "User_Name": names[users],
+        "Age": user_age[users],
+        "Country": np.array(COUNTRIES, dtype=object)[user_country[users]],
+        "Product_Category": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), n_rows)],
+        "Purchase_Amount": np.round(rng.uniform(10, 1000, n_rows), 2),
+        "Payment_Method": np.array(PAYMENT_METHODS, dtype=object)[rng.integers(0, len(PAYMENT_METHODS), n_rows)],
+        "Transaction_Date": (start_day + rng.integers(0, days, n_rows)).astype(str),
+    })
+
+
+def write_synthetic_csv(path, n_rows, n_users=None, seed=0):
+    """写出合成数据CSV，已存在同名文件时直接复用"""
+    if not os.path.exists(path):
+        make_transactions(n_rows, n_users, seed).to_csv(path, index=False)
+    return path
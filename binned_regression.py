@@ -0,0 +1,164 @@
+"""基于充分统计量的一元线性回归与分箱均值图
+
+回归只依赖 n、Σx、Σy、Σx²、Σy²、Σxy 六个累加量，分箱图只依赖每个分箱的
+n、Σy、Σy²。这些累加量可以缓存，新数据到来时直接累加（或把两份统计合并），
+刷新图表的开销与原始数据量无关。
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+try:
+    from scipy import stats as _scipy_stats
+except ImportError:
+    _scipy_stats = None
+
+
+def _t_sf_two_sided(t, dof):
+    """双侧 t 检验 p 值；没有 scipy 时用正态近似"""
+    if _scipy_stats is not None:
+        return float(2 * _scipy_stats.t.sf(abs(t), dof))
+    return math.erfc(abs(t) / math.sqrt(2))
+
+
+class RegressionAccumulator:
+    """可增量更新、可合并的回归与分箱统计
+
+    bin_edges 为 None 时按 x 的取值分箱（适合品类数这类离散变量），
+    否则按给定边界分箱，分箱位置取区间中点。
+    """
+
+    def __init__(self, bin_edges=None):
+        self.bin_edges = None if bin_edges is None else np.asarray(bin_edges, dtype=np.float64)
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.syy = self.sxy = 0.0
+        # 分箱位置 -> [n, Σy, Σy²]
+        self.bins = {}
+
+    def _bin_positions(self, x):
+        if self.bin_edges is None:
+            return x
+        idx = np.clip(np.searchsorted(self.bin_edges, x, side='right') - 1, 0, len(self.bin_edges) - 2)
+        return (self.bin_edges[idx] + self.bin_edges[idx + 1]) / 2
+
+    def update(self, x, y):
+        """累加一批观测值，返回自身以便链式调用"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = x[valid], y[valid]
+        if len(x) == 0:
+            return self
+
+        self.n += len(x)
+        self.sx += float(x.sum())
+        self.sy += float(y.sum())
+        self.sxx += float(np.dot(x, x))
+        self.syy += float(np.dot(y, y))
+        self.sxy += float(np.dot(x, y))
+
+        positions, inverse = np.unique(self._bin_positions(x), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(positions))
+        sums = np.bincount(inverse, weights=y, minlength=len(positions))
+        squares = np.bincount(inverse, weights=y * y, minlength=len(positions))
+        for pos, c, s, q in zip(positions.tolist(), counts.tolist(), sums.tolist(), squares.tolist()):
+            acc = self.bins.setdefault(pos, [0, 0.0, 0.0])
+            acc[0] += c
+            acc[1] += s
+            acc[2] += q
+        return self
+
+    def merge(self, other):
+        """合并另一份统计（分箱方式需相同），返回自身"""
+        self.n += other.n
+        self.sx += other.sx
+        self.sy += other.sy
+        self.sxx += other.sxx
+        self.syy += other.syy
+        self.sxy += other.sxy
+        for pos, (c, s, q) in other.bins.items():
+            acc = self.bins.setdefault(pos, [0, 0.0, 0.0])
+            acc[0] += c
+            acc[1] += s
+            acc[2] += q
+        return self
+
+    def result(self):
+        """斜率、截距、R²、相关系数、斜率标准误和 p 值（样本不足时为 NaN）"""
+        n = self.n
+        fit = {'n': n, 'slope': np.nan, 'intercept': np.nan, 'r': np.nan,
+               'r_squared': np.nan, 'stderr': np.nan, 'p_value': np.nan}
+        if n < 2:
+            return fit
+        # 中心化的平方和与交叉积
+        sxx = self.sxx - self.sx * self.sx / n
+        syy = self.syy - self.sy * self.sy / n
+        sxy = self.sxy - self.sx * self.sy / n
+        if sxx <= 0:
+            return fit
+
+        slope = sxy / sxx
+        fit['slope'] = slope
+        fit['intercept'] = (self.sy - slope * self.sx) / n
+        if syy > 0:
+            r = max(-1.0, min(1.0, sxy / math.sqrt(sxx * syy)))
+            fit['r'] = r
+            fit['r_squared'] = r * r
+        if n > 2 and syy > 0:
+            sse = max(syy - slope * sxy, 0.0)
+            stderr = math.sqrt(sse / (n - 2) / sxx)
+            fit['stderr'] = stderr
+            if stderr > 0:
+                fit['p_value'] = _t_sf_two_sided(slope / stderr, n - 2)
+            else:
+                fit['p_value'] = 0.0
+        return fit
+
+    def bins_frame(self):
+        """每个分箱的样本数、均值、标准差和均值标准误"""
+        if not self.bins:
+            return pd.DataFrame(columns=['x', 'n', 'mean', 'std', 'sem'])
+        positions = sorted(self.bins)
+        counts = np.array([self.bins[p][0] for p in positions], dtype=np.float64)
+        sums = np.array([self.bins[p][1] for p in positions])
+        squares = np.array([self.bins[p][2] for p in positions])
+        mean = sums / counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = np.where(counts > 1, (squares - counts * mean * mean) / (counts - 1), np.nan)
+        std = np.sqrt(np.clip(var, 0, None))
+        return pd.DataFrame({
+            'x': positions,
+            'n': counts.astype(np.int64),
+            'mean': mean,
+            'std': std,
+            'sem': std / np.sqrt(counts),
+        })
+
+
+def binned_regression_figure(acc, title, x_label, y_label):
+    """分箱均值（95% 置信区间误差棒）加回归直线"""
+    bins = acc.bins_frame()
+    fit = acc.result()
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=bins['x'],
+        y=bins['mean'],
+        mode='markers',
+        name='分箱均值',
+        error_y=dict(type='data', array=(1.96 * bins['sem']).fillna(0), visible=True),
+        customdata=bins[['n']],
+        hovertemplate=f'{x_label}: %{{x}}<br>{y_label}均值: %{{y:.2f}}<br>样本数: %{{customdata[0]}}<extra></extra>',
+    ))
+    if len(bins) and np.isfinite(fit['slope']):
+        x_line = np.array([bins['x'].min(), bins['x'].max()], dtype=np.float64)
+        fig.add_trace(go.Scatter(
+            x=x_line,
+            y=fit['intercept'] + fit['slope'] * x_line,
+            mode='lines',
+            name=f"OLS: y = {fit['slope']:.2f}x + {fit['intercept']:.2f}",
+        ))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
+    return fig
@@ -0,0 +1,226 @@
+"""国家价值评分：人均指标百分位排名、可信度加权与自助法排名置信区间
+
+与 电商分析.py 中“深度地区分析”的口径一致：ARPU、人均订单数 (Orders_per_Active)、
+客单价 (AOV) 和 60 天窗口复购率 (RPR_60) 在国家之间做百分位排名，平均得到
+Value_Score；再按活跃用户数做可信度加权 cw = n / (n + m)，向全体均值收缩得到
+Stabilized_Value_Score。
+
+自助法在每个国家内部有放回地重抽用户：一次重抽等价于该国用户上的多项分布
+权重（n_c 次均匀抽取的计数），各指标由权重矩阵乘以用户的订单数/消费额得到，
+一批重抽只需一次 bincount 和一次矩阵乘法。复购标记是 0/1，重抽后的复购人数
+恰好服从 Binomial(h_c, RPR_c)，直接按二项分布抽取。
+"""
+import numpy as np
+import pandas as pd
+
+PCT_COLUMNS = ['ARPU', 'Orders_per_Active', 'AOV', 'RPR']
+DEFAULT_M_GRID = (0, 5, 10, 20, 30, 50, 100, 200, 500)
+
+
+def country_units(df, user_order, user_metrics, rpr_window=60):
+    """按国家重抽所需的用户级数据
+
+    user_order 为 seq_kernels.sort_by_user 的结果，user_metrics 为
+    user_sequence_metrics 的结果（两者用户顺序一致）。每个 (国家, 用户) 组合是
+    该国的一个活跃用户，记录其在该国的订单数和消费额；复购率按用户首笔订单
+    所在国家（与脚本中用户表 Country 取首单国家一致）统计。
+    """
+    order, user_codes_sorted, _, names = user_order
+    country_codes, countries = pd.factorize(df['Country'], sort=True)
+    n_users = len(names)
+
+    user_codes = np.empty(len(order), dtype=np.int64)
+    user_codes[order] = user_codes_sorted
+    # (国家, 用户) 组合编码，排序后同一国家的用户连续存放
+    pairs, inverse = np.unique(country_codes.astype(np.int64) * n_users + user_codes, return_inverse=True)
+    unit_orders = np.bincount(inverse, minlength=len(pairs)).astype(np.float64)
+    unit_revenue = np.bincount(inverse, weights=df['Purchase_Amount'].to_numpy(dtype=np.float64), minlength=len(pairs))
+    unit_country = pairs // n_users
+
+    # 首单国家：排序后每个用户的第一行
+    starts = np.flatnonzero(np.r_[True, user_codes_sorted[1:] != user_codes_sorted[:-1]]) if len(order) else np.array([], dtype=np.int64)
+    home_country = country_codes[order[starts]]
+    repurchased = (user_metrics['Days_to_2nd'].to_numpy(dtype=np.float64) <= rpr_window)
+
+    n_countries = len(countries)
+    return {
+        'countries': np.asarray(countries),
+        'rpr_window': rpr_window,
+        'unit_offsets': np.searchsorted(unit_country, np.arange(n_countries + 1)),
+        'unit_orders': unit_orders,
+        'unit_revenue': unit_revenue,
+        'home_users': np.bincount(home_country, minlength=n_countries),
+        'home_repurchased': np.bincount(home_country, weights=repurchased, minlength=n_countries),
+    }
+
+
+def _country_totals(units):
+    """各国家的订单数、消费额、活跃用户数和复购率（无首单用户的国家复购率记为 0）"""
+    offsets = units['unit_offsets']
+    orders = np.add.reduceat(units['unit_orders'], offsets[:-1]) if len(units['unit_orders']) else np.zeros(0)
+    revenue = np.add.reduceat(units['unit_revenue'], offsets[:-1]) if len(units['unit_revenue']) else np.zeros(0)
+    active = np.diff(offsets).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rpr = np.where(units['home_users'] > 0, units['home_repurchased'] / units['home_users'], 0.0)
+    return orders, revenue, active, rpr
+
+
+def percentile_rank(values):
+    """沿最后一维的百分位排名（并列取平均名次，与 rank(pct=True) 一致）；整行相同时为 0.5"""
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    greater = (values[..., :, None] > values[..., None, :]).sum(axis=-1)
+    ties = (values[..., :, None] == values[..., None, :]).sum(axis=-1)
+    pct = (greater + (ties + 1) / 2) / n
+    constant = (values.max(axis=-1) == values.min(axis=-1))[..., None]
+    return np.where(constant, 0.5, pct)
+
+
+def score_countries(orders, revenue, active, rpr, m):
+    """Value_Score 与 Stabilized_Value_Score；各输入最后一维为国家，可带任意前置维度（重抽、m 网格）"""
+    metrics = np.stack([revenue / active, orders / active, revenue / orders,
+                        np.broadcast_to(rpr, np.broadcast_shapes(np.shape(rpr), np.shape(orders)))])
+    value_score = percentile_rank(metrics).mean(axis=0)
+    cw = active / (active + np.asarray(m, dtype=np.float64))
+    baseline = value_score.mean(axis=-1, keepdims=True)
+    return value_score, cw * value_score + (1 - cw) * baseline
+
+
+def rank_desc(scores):
+    """沿最后一维按得分从高到低的名次（1 为最高，并列按国家顺序）"""
+    order = np.argsort(-scores, axis=-1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, scores.shape[-1] + 1), axis=-1)
+    return ranks
+
+
+def value_scores(units, m=30):
+    """各国家价值评分表（按 Value_Score 从高到低排序，列与脚本输出一致）"""
+    orders, revenue, active, rpr = _country_totals(units)
+    value_score, stabilized = score_countries(orders, revenue, active, rpr, m)
+    rpr_column = f"RPR_{units['rpr_window']}"
+    result = pd.DataFrame({
+        'Country': units['countries'],
+        'Active_Users': active.astype(np.int64),
+        'ARPU': revenue / active,
+        'Orders_per_Active': orders / active,
+        'AOV': revenue / orders,
+        rpr_column: rpr,
+        'Value_Score': value_score,
+        'Rank_Value_Score': rank_desc(value_score),
+        'Stabilized_Value_Score': stabilized,
+        'Rank_Stabilized': rank_desc(stabilized),
+    })
+    return result.sort_values('Rank_Value_Score').reset_index(drop=True)
+
+
+def m_sweep(units, ms=DEFAULT_M_GRID):
+    """不同平滑参数 m 下的稳健化排名：行为国家，列为 m"""
+    orders, revenue, active, rpr = _country_totals(units)
+    grid = np.asarray(ms, dtype=np.float64)[:, None]
+    _, stabilized = score_countries(orders, revenue, active, rpr, grid)
+    return pd.DataFrame(rank_desc(stabilized).T, index=pd.Index(units['countries'], name='Country'), columns=list(ms))
+
+
+def bootstrap_ranks(units, m=30, n_boot=500, seed=0, level=0.95, top_k=3, batch_elements=20_000_000):
+    """按国家重抽用户的自助法稳健化排名置信区间
+
+    每批重抽的权重矩阵最多 batch_elements 个元素。返回每个国家的点估计名次、
+    重抽名次的中位数和 level 置信区间、得分区间，以及进入前 top_k 的概率。
+    """
+    rng = np.random.default_rng(seed)
+    offsets = units['unit_offsets']
+    n_countries = len(offsets) - 1
+    orders = np.zeros((n_boot, n_countries))
+    revenue = np.zeros((n_boot, n_countries))
+    values = np.column_stack([units['unit_orders'], units['unit_revenue']])
+
+    for c in range(n_countries):
+        block = values[offsets[c]:offsets[c + 1]]
+        n = len(block)
+        if n == 0:
+            continue
+        batch = max(1, batch_elements // n)
+        for start in range(0, n_boot, batch):
+            size = min(batch, n_boot - start)
+            # n 次均匀抽取的计数即多项分布权重；每个重抽占权重矩阵的一行
+            draws = rng.integers(0, n, size=(size, n)) + (np.arange(size) * n)[:, None]
+            weights = np.bincount(draws.ravel(), minlength=size * n).reshape(size, n)
+            sums = weights @ block
+            orders[start:start + size, c] = sums[:, 0]
+            revenue[start:start + size, c] = sums[:, 1]
+
+    home_users = units['home_users']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.where(home_users > 0, units['home_repurchased'] / np.maximum(home_users, 1), 0.0)
+        rpr = np.where(home_users > 0, rng.binomial(home_users, p, size=(n_boot, n_countries)) / home_users, 0.0)
+    active = np.diff(offsets).astype(np.float64)
+    _, stabilized = score_countries(orders, revenue, active, rpr, m)
+    ranks = rank_desc(stabilized)
+
+    point = value_scores(units, m).set_index('Country')
+    tail = (1 - level) / 2
+    result = pd.DataFrame({
+        'Country': units['countries'],
+        'Stabilized_Value_Score': point.loc[units['countries'], 'Stabilized_Value_Score'].to_numpy(),
+        'Rank_Stabilized': point.loc[units['countries'], 'Rank_Stabilized'].to_numpy(),
+        'Rank_Median': np.median(ranks, axis=0),
+        'Rank_Low': np.quantile(ranks, tail, axis=0, method='lower'),
+        'Rank_High': np.quantile(ranks, 1 - tail, axis=0, method='higher'),
+        'Score_Low': np.quantile(stabilized, tail, axis=0),
+        'Score_High': np.quantile(stabilized, 1 - tail, axis=0),
+        f'P_Top{top_k}': (ranks <= top_k).mean(axis=0),
+    })
+    result.attrs.update({'n_boot': n_boot, 'm': m, 'level': level})
+    return result.sort_values('Rank_Stabilized').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # 基准测试：python country_value.py [数据文件] [重抽次数]；结果与脚本的 pandas 实现逐项核对
+    import sys
+    import time
+
+    from ingest import load_transactions
+    from seq_kernels import sort_by_user, user_sequence_metrics
+
+    path = sys.argv[1] if len(sys.argv) > 1 else 'ecommerce_transactions.csv'
+    n_boot = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    df = load_transactions(path)
+    user_order = sort_by_user(df)
+    user_metrics = user_sequence_metrics(df)
+
+    start = time.perf_counter()
+    units = country_units(df, user_order, user_metrics)
+    units_time = time.perf_counter() - start
+    scores = value_scores(units)
+
+    # 电商分析.py 的原实现
+    basic = df.groupby("Country").agg(Orders=("Transaction_ID", "count"), Revenue=("Purchase_Amount", "sum"),
+                                      Active_Users=("User_Name", "nunique"))
+    basic["Orders_per_Active"] = basic["Orders"] / basic["Active_Users"]
+    basic["AOV"] = basic["Revenue"] / basic["Orders"]
+    basic["ARPU"] = basic["Revenue"] / basic["Active_Users"]
+    order, _, _, _ = user_order
+    home = df['Country'].to_numpy()[order][np.r_[True, user_order[1][1:] != user_order[1][:-1]]]
+    rpr = pd.Series(user_metrics["Days_to_2nd"].to_numpy() <= 60).groupby(home).mean().rename("RPR_60")
+    deep = basic[["Active_Users", "Orders_per_Active", "AOV", "ARPU"]].join(rpr, how='left').fillna(0)
+    for col in ["ARPU", "Orders_per_Active", "AOV", "RPR_60"]:
+        deep[f"{col}_pct"] = deep[col].rank(pct=True) if deep[col].nunique() > 1 else 0.5
+    deep["Value_Score"] = deep[[c for c in deep.columns if c.endswith('_pct')]].mean(axis=1)
+    cw = deep["Active_Users"] / (deep["Active_Users"] + 30)
+    deep["Stabilized_Value_Score"] = cw * deep["Value_Score"] + (1 - cw) * deep["Value_Score"].mean()
+    check = scores.set_index('Country').loc[deep.index]
+    same = all(np.allclose(check[col], deep[col]) for col in ["ARPU", "Orders_per_Active", "AOV", "RPR_60",
+                                                               "Value_Score", "Stabilized_Value_Score"])
+
+    start = time.perf_counter()
+    boot = bootstrap_ranks(units, n_boot=n_boot)
+    boot_time = time.perf_counter() - start
+    start = time.perf_counter()
+    sweep = m_sweep(units)
+    sweep_time = time.perf_counter() - start
+
+    print(f"{len(df):,} 行, {len(units['countries'])} 个国家, {len(units['unit_orders']):,} 个 (国家, 用户) 组合")
+    print(f"用户级数据 {units_time:.2f}s, 与原实现一致: {same}")
+    print(f"自助法 {n_boot} 次重抽 {boot_time:.2f}s, m 网格 {len(sweep.columns)} 个取值 {sweep_time * 1000:.1f}ms")
+    print(boot.round(3).to_string(index=False))
@@ -0,0 +1,86 @@
+"""单个客户查询：基于排序姓名索引的前缀搜索与客户360视图"""
+import numpy as np
+import pandas as pd
+
+from rfm import compute_rfm
+
+
+def build_customer_index(df):
+    """按 User_Name 排序建立客户索引
+
+    交易表按 (小写姓名, 姓名, 交易日期) 排序一次，之后每个客户的全部交易
+    都是一段连续的行，查询时只需切片，无需对全表做过滤。
+    """
+    keys = df['User_Name'].str.casefold()
+    # 先把字符串编码成有序整数再排序，比直接比较字符串快得多
+    key_codes, _ = pd.factorize(keys, sort=True)
+    name_codes, _ = pd.factorize(df['User_Name'], sort=True)
+    order = np.lexsort((df['Transaction_Date'].to_numpy(), name_codes, key_codes))
+    frame = df.iloc[order].reset_index(drop=True)
+
+    # 每个客户在排序表中的起止位置
+    user_col = frame['User_Name'].to_numpy()
+    is_start = np.ones(len(frame), dtype=bool)
+    is_start[1:] = user_col[1:] != user_col[:-1]
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(frame))
+
+    names = user_col[starts]
+    rfm = compute_rfm(df).set_index('User_Name').reindex(names)
+
+    return {
+        'frame': frame,
+        'names': names,
+        'keys': keys.to_numpy()[order][starts],
+        'starts': starts,
+        'ends': ends,
+        'rfm': rfm,
+    }
+
+
+def prefix_search(index, prefix, limit=50):
+    """返回以 prefix 开头（不区分大小写）的客户姓名"""
+    key = prefix.strip().casefold()
+    keys = index['keys']
+    lo = np.searchsorted(keys, key, side='left')
+    hi = np.searchsorted(keys, key + '\U0010ffff', side='left')
+    return index['names'][lo:min(hi, lo + limit)].tolist()
+
+
+def _locate(index, name):
+    """二分查找客户在索引中的位置，找不到返回 None"""
+    keys = index['keys']
+    key = name.casefold()
+    lo = np.searchsorted(keys, key, side='left')
+    hi = np.searchsorted(keys, key, side='right')
+    for pos in range(lo, hi):
+        if index['names'][pos] == name:
+            return pos
+    return None
+
+
+def customer_profile(index, name):
+    """单个客户的交易明细、RFM分数、品类构成和复购间隔"""
+    pos = _locate(index, name)
+    if pos is None:
+        return None
+
+    history = index['frame'].iloc[index['starts'][pos]:index['ends'][pos]]
+
+    category_mix = history.groupby('Product_Category').agg(
+        Orders=('Transaction_ID', 'count'),
+        Spend=('Purchase_Amount', 'sum')
+    ).reset_index().sort_values('Spend', ascending=False)
+    category_mix['Spend_Share'] = category_mix['Spend'] / category_mix['Spend'].sum() * 100
+
+    # 相邻两次购买之间的天数
+    dates = history['Transaction_Date'].to_numpy()
+    gaps = pd.Series(np.diff(dates).astype('timedelta64[D]').astype(np.int64), name='Gap_Days')
+
+    return {
+        'name': name,
+        'history': history,
+        'rfm': index['rfm'].iloc[pos],
+        'category_mix': category_mix,
+        'gaps': gaps,
+    }
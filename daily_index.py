@@ -0,0 +1,111 @@
+"""按天的时间序列索引：稠密日数组加前缀和
+
+索引为数据覆盖的每一天保存销售额、订单数和新用户数（首次购买落在当天的
+用户数），并保存它们的前缀和。任意日期区间的合计、滚动窗口和环比/同比
+都只需前缀和相减，按周/月/季度汇总也直接从同一组数组得到。
+"""
+import numpy as np
+import pandas as pd
+
+METRICS = ['Revenue', 'Orders', 'New_Users']
+
+GRANULARITY_FREQ = {
+    'day': 'D',
+    'week': 'W',
+    'month': 'M',
+    'quarter': 'Q',
+}
+
+
+def build_daily_index(df):
+    """由交易表建立按天索引"""
+    days = df['Transaction_Date'].to_numpy().astype('datetime64[D]')
+    if len(days):
+        start = days.min()
+        n_days = int((days.max() - start).astype(np.int64)) + 1
+    else:
+        # 空数据集：索引不覆盖任何一天，区间查询的合计均为 0
+        start = np.datetime64('1970-01-01', 'D')
+        n_days = 0
+    offsets = (days - start).astype(np.int64)
+
+    # 每个用户的首次购买日
+    user_codes, users = pd.factorize(df['User_Name'])
+    first_offset = np.full(len(users), n_days, dtype=np.int64)
+    np.minimum.at(first_offset, user_codes, offsets)
+
+    daily = {
+        'Revenue': np.bincount(offsets, weights=df['Purchase_Amount'].to_numpy(np.float64), minlength=n_days),
+        'Orders': np.bincount(offsets, minlength=n_days).astype(np.float64),
+        'New_Users': np.bincount(first_offset, minlength=n_days).astype(np.float64),
+    }
+    # 前缀和前面补 0，区间 [i, j) 的合计为 cum[j] - cum[i]
+    cum = {k: np.concatenate(([0.0], np.cumsum(v))) for k, v in daily.items()}
+
+    return {
+        'start': start,
+        'n_days': n_days,
+        'dates': pd.date_range(pd.Timestamp(start), periods=n_days, freq='D'),
+        'daily': daily,
+        'cum': cum,
+    }
+
+
+def _offset(index, date):
+    """日期转为相对首日的天数"""
+    return int((np.datetime64(pd.Timestamp(date).date(), 'D') - index['start']).astype(np.int64))
+
+
+def range_totals(index, start, end):
+    """闭区间 [start, end] 内各指标合计，超出数据覆盖范围的部分按 0 计"""
+    lo = min(max(_offset(index, start), 0), index['n_days'])
+    hi = min(max(_offset(index, end) + 1, lo), index['n_days'])
+    totals = {k: float(c[hi] - c[lo]) for k, c in index['cum'].items()}
+    totals['AOV'] = totals['Revenue'] / totals['Orders'] if totals['Orders'] else 0.0
+    totals['Days'] = _offset(index, end) - _offset(index, start) + 1
+    return totals
+
+
+def compare_periods(index, start, end, shift_days=None):
+    """当前区间与前一个等长区间（或向前平移 shift_days 天，如同比用 364）的对比"""
+    length = _offset(index, end) - _offset(index, start) + 1
+    shift = pd.Timedelta(days=shift_days if shift_days is not None else length)
+    current = range_totals(index, start, end)
+    previous = range_totals(index, pd.Timestamp(start) - shift, pd.Timestamp(end) - shift)
+    change = {
+        k: (current[k] / previous[k] - 1) * 100 if previous[k] else np.nan
+        for k in METRICS + ['AOV']
+    }
+    return {'current': current, 'previous': previous, 'change_pct': change}
+
+
+def rolling(index, window, metric='Revenue'):
+    """以每天为终点的滚动 window 天合计（数据不足 window 天的开头部分按已有天数计）"""
+    cum = index['cum'][metric]
+    ends = np.arange(1, index['n_days'] + 1)
+    starts = np.maximum(ends - window, 0)
+    return pd.Series(cum[ends] - cum[starts], index=index['dates'], name=f'{metric}_{window}d')
+
+
+def resample(index, granularity='day', start=None, end=None):
+    """按 日/周/月/季度 汇总指定区间，返回每个周期一行的 DataFrame"""
+    lo = 0 if start is None else min(max(_offset(index, start), 0), index['n_days'])
+    hi = index['n_days'] if end is None else min(max(_offset(index, end) + 1, lo), index['n_days'])
+    if hi <= lo:
+        return pd.DataFrame(columns=['Period', 'Start'] + METRICS + ['AOV'])
+
+    periods = index['dates'][lo:hi].to_period(GRANULARITY_FREQ[granularity])
+    codes = periods.asi8
+    # 周期边界：周期编号变化的位置
+    bounds = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+    seg_starts = lo + bounds
+    seg_ends = np.append(seg_starts[1:], hi)
+
+    result = pd.DataFrame({
+        'Period': periods[bounds].astype(str),
+        'Start': index['dates'][seg_starts],
+    })
+    for metric, cum in index['cum'].items():
+        result[metric] = cum[seg_ends] - cum[seg_starts]
+    result['AOV'] = (result['Revenue'] / result['Orders'].replace(0, np.nan)).fillna(0.0)
+    return result
@@ -0,0 +1,127 @@
+"""数据画像：导入时生成、与数据集放在一起的列统计边车文件
+
+边车文件 <数据文件>.profile.json 记录总行数、各列缺失值、唯一值数、
+最小/最大值、高频取值和数值列直方图，数据概览页直接读取它渲染，
+不再在每次刷新时扫描整张表。
+
+生成边车文件：python data_profile.py ecommerce_transactions.csv
+"""
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PROFILE_SUFFIX = ".profile.json"
+
+
+def profile_path(data_path):
+    """数据文件对应的边车文件路径"""
+    return data_path + PROFILE_SUFFIX
+
+
+def _to_native(value):
+    """numpy/pandas 标量转换为可写入JSON的原生类型"""
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def build_profile(df, dataset_version=None, top_n=5, bins=20):
+    """计算数据画像"""
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        non_null = series.dropna()
+        stats = {
+            'dtype': str(series.dtype),
+            'nulls': int(series.isnull().sum()),
+            'unique': int(series.nunique()),
+        }
+
+        is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        is_datetime = pd.api.types.is_datetime64_any_dtype(series)
+        if (is_numeric or is_datetime) and len(non_null):
+            stats['min'] = _to_native(non_null.min())
+            stats['max'] = _to_native(non_null.max())
+
+        if is_numeric and len(non_null):
+            values = non_null.to_numpy(dtype=np.float64)
+            stats['sum'] = float(values.sum())
+            stats['mean'] = float(values.mean())
+            stats['std'] = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+            counts, edges = np.histogram(values, bins=bins)
+            stats['histogram'] = {'counts': counts.tolist(), 'edges': edges.tolist()}
+
+        # 唯一值等于行数的列（如交易ID）没有高频取值可言
+        if stats['unique'] < len(series):
+            top = series.value_counts().head(top_n)
+            stats['top_values'] = [[_to_native(k), int(v)] for k, v in top.items()]
+
+        columns[col] = stats
+
+    return {
+        'dataset_version': dataset_version if dataset_version is not None else df.attrs.get('dataset_version'),
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'rows': int(len(df)),
+        'n_columns': int(df.shape[1]),
+        'columns': columns,
+    }
+
+
+def write_profile(profile, path):
+    """原子写入边车文件（先写临时文件再替换）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_profile(path, dataset_version=None):
+    """读取边车文件；文件不存在、损坏或版本不匹配时返回 None"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if dataset_version is not None and profile.get('dataset_version') != dataset_version:
+        return None
+    return profile
+
+
+def ensure_profile(df, data_path):
+    """读取与当前数据版本一致的画像，没有则重新计算并尝试写回边车文件"""
+    path = profile_path(data_path)
+    version = df.attrs.get('dataset_version')
+    profile = read_profile(path, version)
+    if profile is None:
+        profile = build_profile(df, version)
+        try:
+            write_profile(profile, path)
+        except OSError:
+            # 只读部署环境下只保留内存中的画像
+            pass
+    return profile
+
+
+if __name__ == "__main__":
+    from ingest import load_transactions
+
+    for data_path in sys.argv[1:] or ["ecommerce_transactions.csv"]:
+        df = load_transactions(data_path)
+        profile = build_profile(df)
+        write_profile(profile, profile_path(data_path))
+        print(f"已生成 {profile_path(data_path)} ({profile['rows']:,} 行, {profile['n_columns']} 列)")
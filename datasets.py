@@ -0,0 +1,173 @@
+"""数据集注册表与带内存预算的 LRU 数据集缓存
+
+注册表收集可供切换的交易导出文件：项目根目录下的默认数据文件，以及
+DATASET_DIR 目录（默认 data/）中的所有 CSV。已加载的数据集和由它派生的
+聚合结果一起放在 DatasetCache 中，总占用超过预算时淘汰最久未使用的数据集。
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ingest import get_dataset_version
+
+DEFAULT_DATA_FILE = "ecommerce_transactions.csv"
+
+
+def discover_datasets(default_file=DEFAULT_DATA_FILE, data_dir=None):
+    """返回 {数据集名称: 文件路径}，名称取文件名（不含扩展名）"""
+    if data_dir is None:
+        data_dir = os.environ.get("DATASET_DIR", "data")
+    registry = OrderedDict()
+    if os.path.exists(default_file):
+        registry[os.path.splitext(os.path.basename(default_file))[0]] = default_file
+    if os.path.isdir(data_dir):
+        for file_name in sorted(os.listdir(data_dir)):
+            if file_name.lower().endswith(".csv"):
+                name = os.path.splitext(file_name)[0]
+                registry.setdefault(name, os.path.join(data_dir, file_name))
+    return registry
+
+
+def estimate_bytes(obj):
+    """估算对象占用的内存字节数"""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.memmap):
+        # 内存映射的数组由页缓存承担，不占进程私有内存
+        return 0
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_bytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_bytes(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class DatasetCache:
+    """按总内存预算淘汰的数据集 LRU 缓存
+
+    每个条目保存一个数据集（及其版本）和它的派生结果，派生结果与数据集
+    一起计入预算、一起淘汰。数据文件发生变化（版本不同）时自动重新加载。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.derived_hits = 0
+        self.derived_misses = 0
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def get(self, name, path, loader):
+        """取数据集，未缓存或文件已变化时调用 loader(path) 加载"""
+        version = get_dataset_version(path)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry['version'] == version:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry['df']
+
+        # 同一数据集只加载一次，其他会话等待加载完成
+        with self._load_lock(name):
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry['version'] == version:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    return entry['df']
+            df = loader(path)
+            df.attrs['dataset_name'] = name
+            df.attrs['dataset_path'] = path
+            with self._lock:
+                self.misses += 1
+                self._entries.pop(name, None)
+                self._entries[name] = {
+                    'version': df.attrs.get('dataset_version', version),
+                    'df': df,
+                    'derived': {},
+                    # 从共享存储映射的数据集不占进程私有内存
+                    'bytes': 0 if df.attrs.get('shared_dir') else estimate_bytes(df),
+                    'shared': bool(df.attrs.get('shared_dir')),
+                    'path': path,
+                    'rows': len(df),
+                    'loaded_at': time.time(),
+                }
+                self._evict(keep=name)
+            return df
+
+    def derived(self, name, key, builder, version=None):
+        """取数据集的派生结果（索引、画像、聚合表等），未缓存时调用 builder() 计算
+
+        version 为 builder 所用数据的版本：与缓存中的数据集版本不同时不读也不写缓存。
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and version is not None and entry['version'] != version:
+                entry = None
+            if entry is not None and key in entry['derived']:
+                self.derived_hits += 1
+                return entry['derived'][key]
+
+        value = builder()
+        with self._lock:
+            self.derived_misses += 1
+            # 计算期间数据集被淘汰或重新加载（条目已换成新版本）时只返回结果，不写入新条目
+            if entry is not None and self._entries.get(name) is entry and key not in entry['derived']:
+                entry['derived'][key] = value
+                entry['bytes'] += estimate_bytes(value)
+                self._evict(keep=name)
+            return value
+
+    def _evict(self, keep):
+        """淘汰最久未使用的数据集，直到总占用不超过预算（当前数据集除外）"""
+        total = sum(entry['bytes'] for entry in self._entries.values())
+        for name in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self._entries.pop(name)['bytes']
+            self.evictions += 1
+
+    def describe(self):
+        """各已缓存数据集的版本、路径、行数、占用和加载时间"""
+        with self._lock:
+            return {
+                name: {key: entry[key] for key in ('version', 'path', 'rows', 'bytes', 'shared', 'loaded_at')}
+                for name, entry in self._entries.items()
+            }
+
+    def stats(self):
+        """缓存统计"""
+        with self._lock:
+            total = sum(entry['bytes'] for entry in self._entries.values())
+            lookups = self.hits + self.misses
+            return {
+                'datasets': {name: entry['bytes'] for name, entry in self._entries.items()},
+                'shared': [name for name, entry in self._entries.items() if entry['shared']],
+                'bytes': total,
+                'max_bytes': self.max_bytes,
+                'over_budget': total > self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'derived_hits': self.derived_hits,
+                'derived_misses': self.derived_misses,
+            }
@@ -0,0 +1,218 @@
+"""重启后仍然有效的磁盘结果缓存
+
+进程内缓存在每次部署或崩溃后清空，重启后的第一批用户要重新读取 CSV、重新
+计算各模块的聚合。DiskCache 把数据集快照、派生结果和图表规格以 pickle 文件
+保存在磁盘上：
+
+- 键包含数据文件内容的哈希（不是修改时间，文件被复制或 touch 后仍能命中）和
+  代码版本（应用目录下所有 .py 源码的哈希，代码变化后旧结果自动失效）；
+- 先写临时文件再 os.replace，读取方和并发写入的进程不会看到写了一半的文件；
+- 命中时更新文件修改时间，总大小超过预算时从最久未使用的文件开始删除。
+  占用的字节数和文件数在内存中随写入/删除累加，只在启动时和超出预算时扫描
+  目录（扫描结果同时校正其他进程写入造成的偏差），写入和统计都不遍历文件。
+
+缓存目录只应由本应用写入（pickle 文件加载时会执行其中的构造代码）。
+"""
+import glob
+import hashlib
+import os
+import pickle
+import threading
+
+from ingest import get_dataset_version
+
+_MISSING = object()
+
+# 文件内容哈希的进程内记忆：(路径, 大小+修改时间版本) -> 哈希
+_content_hashes = {}
+_content_lock = threading.Lock()
+
+
+def content_hash(path, chunk_size=1 << 24):
+    """数据文件内容的哈希（同一版本的文件只计算一次）"""
+    memo_key = (os.path.abspath(path), get_dataset_version(path))
+    with _content_lock:
+        if memo_key in _content_hashes:
+            return _content_hashes[memo_key]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    value = digest.hexdigest()
+    with _content_lock:
+        _content_hashes[memo_key] = value
+    return value
+
+
+def source_version(directory, extra_files=()):
+    """目录下所有 .py 源码（以及 extra_files，如分层定义文件）的哈希，作为代码版本"""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in sorted(glob.glob(os.path.join(directory, '*.py'))) + list(extra_files):
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """按总大小淘汰的磁盘缓存
+
+    键为可 repr 的元组，会与 version（代码版本）一起哈希成文件名。值用 pickle
+    序列化，不能序列化的值只返回、不缓存。
+    """
+
+    def __init__(self, directory, max_bytes, version=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        self._rescan()
+
+    def _path(self, key):
+        name = hashlib.sha256(repr((self.version, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:2], name + '.pkl')
+
+    def get(self, key, default=None):
+        """取缓存值，不存在或无法读取时返回 default"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return default
+        except Exception:
+            # 文件损坏或由不兼容的依赖版本写入：当作未命中，并删除该文件
+            with self._lock:
+                self.misses += 1
+                self.errors += 1
+            self._discard(path)
+            return default
+        try:
+            # 修改时间即最近使用时间，淘汰时据此排序
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """原子写入缓存，返回是否写入成功"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp)
+            if size > self.max_bytes:
+                self._remove(tmp)
+                return False
+            previous = self._size(path)
+            os.replace(tmp, path)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            self._remove(tmp)
+            return False
+        with self._lock:
+            self.writes += 1
+            self._bytes += size - (previous or 0)
+            self._entries += previous is None
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+        return True
+
+    def get_or_compute(self, key, builder):
+        """命中返回缓存值，否则调用 builder() 计算并写入"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = builder()
+            self.put(key, value)
+        return value
+
+    def _files(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for item in os.scandir(entry.path):
+                if item.name.endswith('.pkl'):
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, item.path))
+        return files
+
+    def _rescan(self):
+        """扫描目录，用实际的文件数和总大小校正内存中的计数，返回文件列表"""
+        files = self._files()
+        with self._lock:
+            self._bytes = sum(size for _, size, _ in files)
+            self._entries = len(files)
+        return files
+
+    def evict(self):
+        """总大小超过预算时删除最久未使用的文件（扫描一次目录）"""
+        files = self._rescan()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+                    self._bytes -= size
+                    self._entries -= 1
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def _discard(self, path):
+        """删除一个缓存文件并更新计数"""
+        size = self._size(path)
+        if size is not None and self._remove(path):
+            with self._lock:
+                self._bytes -= size
+                self._entries -= 1
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def stats(self):
+        """缓存统计：文件数、占用字节（内存中的计数，不扫描目录）和本进程的命中/未命中/写入/淘汰次数"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': self._entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
@@ -0,0 +1,285 @@
+"""分块流式导出：筛选后的交易明细和各模块结果表
+
+下载按钮需要先在内存中拼出完整文件，大范围导出时服务器内存会随导出规模
+暴涨。这里改为按行分块处理：交易明细在每个块上单独应用筛选条件，不生成筛选
+后的完整副本；每块序列化后立即压缩并写出，内存占用只与块大小有关。
+
+- gzip 压缩的 CSV：每块 to_csv 后送入同一个 zlib 压缩流；
+- Parquet：每块写成一个行组，写出后立即从缓冲区取走（需要 pyarrow）。
+
+ExportServer 在后台线程里提供一个本地 HTTP 端点，响应使用分块传输编码边生成
+边发送；也可以用命令行直接导出到文件。
+"""
+import argparse
+import io
+import secrets
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlparse
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+CHUNK_ROWS = 100_000
+
+FORMATS = {
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# 交易明细支持的筛选参数：日期区间和几个分类列的取值列表
+FILTER_COLUMNS = {
+    'country': 'Country',
+    'category': 'Product_Category',
+    'payment': 'Payment_Method',
+}
+
+
+def frame_chunks(frame, chunk_rows=CHUNK_ROWS):
+    """把内存中的结果表按行切块（切片是视图，不复制数据）"""
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def filtered_chunks(df, filters=None, chunk_rows=CHUNK_ROWS):
+    """逐块应用筛选条件的交易明细
+
+    filters 可包含 start / end（含当天的日期）以及 country / category / payment
+    （取值列表），未给出的条件不筛选。
+    """
+    filters = filters or {}
+    start = pd.Timestamp(filters['start']) if filters.get('start') else None
+    end = pd.Timestamp(filters['end']) + pd.Timedelta(days=1) if filters.get('end') else None
+    selected = {column: set(filters[key]) for key, column in FILTER_COLUMNS.items() if filters.get(key)}
+    matched = False
+    for chunk in frame_chunks(df, chunk_rows):
+        mask = np.ones(len(chunk), dtype=bool)
+        if start is not None:
+            mask &= (chunk['Transaction_Date'] >= start).to_numpy()
+        if end is not None:
+            mask &= (chunk['Transaction_Date'] < end).to_numpy()
+        for column, values in selected.items():
+            mask &= chunk[column].isin(values).to_numpy()
+        if mask.all():
+            matched = True
+            yield chunk
+        elif mask.any():
+            matched = True
+            yield chunk[mask]
+    if not matched:
+        # 没有匹配的行时仍输出一个空块，保证文件带表头/表结构
+        yield df.iloc[:0]
+
+
+def csv_gz_stream(chunks, level=6):
+    """分块生成 gzip 压缩的 CSV 字节流（只在第一块写表头）"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    header = True
+    for chunk in chunks:
+        data = compressor.compress(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _DrainBuffer(io.RawIOBase):
+    """只追加的写缓冲区，已写入的字节由 drain 取走"""
+
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_stream(chunks, compression='zstd'):
+    """分块生成 Parquet 字节流，每块一个行组"""
+    if not HAS_PYARROW:
+        raise ImportError('导出 Parquet 需要安装 pyarrow')
+    sink = _DrainBuffer()
+    writer = None
+    schema = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(sink, schema, compression=compression)
+            writer.write_table(table.cast(schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        if writer is not None:
+            writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def stream(chunks, fmt):
+    """按格式把数据块序列化为字节流"""
+    if fmt == 'csv.gz':
+        return csv_gz_stream(chunks)
+    if fmt == 'parquet':
+        return parquet_stream(chunks)
+    raise ValueError(f'不支持的导出格式: {fmt}')
+
+
+def parse_filters(query):
+    """URL 查询参数 → filtered_chunks 的筛选条件（列表参数为重复的同名参数，取值中可以含逗号）"""
+    params = parse_qs(query)
+    filters = {}
+    for key in ('start', 'end'):
+        if params.get(key):
+            filters[key] = params[key][0]
+    for key in FILTER_COLUMNS:
+        if params.get(key):
+            filters[key] = [value for value in params[key] if value]
+    return filters
+
+
+def filters_query(filters):
+    """筛选条件 → URL 查询参数"""
+    params = []
+    for key, value in filters.items():
+        if value:
+            values = value if isinstance(value, (list, tuple)) else [value]
+            params.extend((key, str(v)) for v in values)
+    return urlencode(params)
+
+
+class ExportServer:
+    """本地流式导出 HTTP 服务
+
+    路径为 /<token>/<数据集>/<表名>.<csv.gz|parquet>?<筛选条件>，resolve(数据集,
+    表名, 筛选条件) 返回数据块迭代器，数据集或表名不存在时返回 None。token 为
+    随机生成的路径前缀，避免同一主机上的其他人猜出导出地址。
+    """
+
+    def __init__(self, resolve, host='127.0.0.1', port=0):
+        self.resolve = resolve
+        self.token = secrets.token_urlsafe(16)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.host = host
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='export-server', daemon=True)
+        self.thread.start()
+
+    def url(self, base_url, dataset, table, fmt, filters=None):
+        """下载链接；base_url 为浏览器访问本服务所用的地址"""
+        query = filters_query(filters or {})
+        path = f"{self.token}/{quote(dataset, safe='')}/{quote(table, safe='')}.{fmt}"
+        return f"{base_url.rstrip('/')}/{path}" + (f"?{query}" if query else '')
+
+    def _handle(self, request):
+        parsed = urlparse(request.path)
+        parts = parsed.path.strip('/').split('/')
+        if len(parts) != 3 or parts[0] != self.token:
+            request.send_error(404)
+            return
+        dataset, filename = unquote(parts[1]), unquote(parts[2])
+        fmt = next((f for f in FORMATS if filename.endswith('.' + f)), None)
+        if fmt is None or (fmt == 'parquet' and not HAS_PYARROW):
+            request.send_error(415)
+            return
+        table = filename[:-len(fmt) - 1]
+        try:
+            chunks = self.resolve(dataset, table, parse_filters(parsed.query))
+        except Exception:
+            request.send_error(500)
+            return
+        if chunks is None:
+            request.send_error(404)
+            return
+
+        request.send_response(200)
+        request.send_header('Content-Type', FORMATS[fmt])
+        # 数据集名称可能含非 ASCII 字符，文件名按 RFC 5987 编码
+        request.send_header('Content-Disposition',
+                            f"attachment; filename*=UTF-8''{quote(f'{dataset}_{table}.{fmt}', safe='')}")
+        request.send_header('Transfer-Encoding', 'chunked')
+        request.end_headers()
+        try:
+            for data in stream(chunks, fmt):
+                if data:
+                    request.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            request.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # 浏览器取消下载
+            pass
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把交易明细（可筛选）分块流式导出为 csv.gz 或 Parquet')
+    parser.add_argument('--dataset', default=None, help='数据集名称（默认第一个数据集）')
+    parser.add_argument('--format', choices=list(FORMATS), default='csv.gz')
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--country', nargs='*', default=None)
+    parser.add_argument('--category', nargs='*', default=None)
+    parser.add_argument('--payment', nargs='*', default=None)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    from datasets import discover_datasets
+    from ingest import load_transactions
+
+    registry = discover_datasets()
+    name = args.dataset or next(iter(registry))
+    df = load_transactions(registry[name])
+    filters = {key: getattr(args, key) for key in ('start', 'end', *FILTER_COLUMNS)}
+    rows = 0
+    with open(args.output, 'wb') as f:
+        def counted(chunks):
+            nonlocal rows
+            for chunk in chunks:
+                rows += len(chunk)
+                yield chunk
+        for data in stream(counted(filtered_chunks(df, filters, args.chunk_rows)), args.format):
+            f.write(data)
+    print(f'{rows:,} 行 -> {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""图表级缓存：按 (模块, 图表ID, 筛选状态, 数据版本) 缓存序列化后的 Plotly 图表
+
+可选的磁盘缓存 (disk_cache.DiskCache) 作为第二级：内存未命中时先查磁盘，
+新构建的图表同时写入磁盘，进程重启后仍能命中。
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+
+def _json_default(value):
+    """numpy 标量/数组转成原生类型，其余对象转成字符串"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def make_key(module, chart_id, filter_state, dataset_version):
+    """生成缓存键，筛选状态按键排序后序列化，保证相同状态得到相同的键"""
+    state = json.dumps(filter_state or {}, sort_keys=True, default=_json_default, ensure_ascii=False)
+    return (module, chart_id, state, dataset_version)
+
+
+class FigureCache:
+    """带内存预算的 LRU 图表缓存
+
+    缓存内容是图表的 JSON 规格和一份可 JSON 序列化的附加信息（图表旁边
+    分析文字需要的少量汇总值），命中时既不重新聚合也不重新构建图表。
+    """
+
+    def __init__(self, max_bytes, disk=None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key, builder, disk_key=None):
+        """命中返回缓存的 (图表, 附加信息)，否则调用 builder() 构建并缓存
+
+        disk_key 为磁盘缓存的键（应基于数据内容而不是文件版本），为 None 时不使用磁盘缓存。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return pio.from_json(entry[0]), json.loads(entry[1])
+
+        stored = self.disk.get(('figure', disk_key)) if self.disk is not None and disk_key is not None else None
+        if stored is not None:
+            spec, meta_json = stored
+            fig = pio.from_json(spec)
+        else:
+            fig, meta = builder()
+            spec = fig.to_json()
+            meta_json = json.dumps(meta or {}, default=_json_default, ensure_ascii=False)
+            if self.disk is not None and disk_key is not None:
+                self.disk.put(('figure', disk_key), (spec, meta_json))
+        size = len(spec) + len(meta_json)
+
+        with self._lock:
+            self.misses += 1
+            if size <= self.max_bytes:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.bytes -= old[2]
+                self._entries[key] = (spec, meta_json, size)
+                self.bytes += size
+                # 超出预算时淘汰最久未使用的图表
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.bytes -= evicted[2]
+                    self.evictions += 1
+        return fig, json.loads(meta_json)
+
+    def stats(self):
+        """缓存统计：条目数、占用字节、命中/未命中/淘汰次数"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
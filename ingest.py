@@ -0,0 +1,32 @@
+"""数据导入：读取交易CSV、预处理并计算数据版本"""
+import os
+
+import pandas as pd
+
+from tiering import load_tiers
+
+
+def get_dataset_version(path):
+    """数据版本：由文件大小和修改时间决定，文件变化后版本随之变化"""
+    stat = os.stat(path)
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def preprocess(df):
+    """日期解析和派生列"""
+    df['Transaction_Date'] = pd.to_datetime(df['Transaction_Date'])
+    df['YearMonth'] = df['Transaction_Date'].dt.to_period('M')
+    df['DayOfWeek'] = df['Transaction_Date'].dt.day_name()
+    df['DayOfMonth'] = df['Transaction_Date'].dt.day
+
+    # 年龄分组（分层定义见 tiers.json 的 age_group）
+    df['Age_Group'] = load_tiers()['age_group'].assign(df['Age'])
+    return df
+
+
+def load_transactions(path):
+    """读取并预处理交易数据，数据版本记录在 df.attrs['dataset_version']"""
+    df = pd.read_csv(path)
+    df = preprocess(df)
+    df.attrs['dataset_version'] = get_dataset_version(path)
+    return df
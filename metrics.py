@@ -0,0 +1,176 @@
+"""Prometheus 文本格式的运行指标
+
+不依赖 prometheus_client，也不需要外部服务：MetricsRegistry 在进程内记录
+直方图，并在每次抓取时调用注册的采集函数读取缓存统计、数据集版本、进程内存
+等即时数值；MetricsServer 在后台线程里提供本地的 /metrics 端点。
+
+采集函数返回 [(指标名, 类型, 说明, [(标签字典, 数值), ...]), ...]，类型为
+gauge 或 counter（counter 指标名以 _total 结尾）。
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认分桶 (秒)：覆盖缓存命中后的亚秒级重跑到大数据集冷启动
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def _family(name, kind, documentation, samples):
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    lines.extend(f'{sample}{_format_labels(labels)} {_format_value(value)}' for sample, labels, value in samples)
+    return lines
+
+
+class Histogram:
+    """带标签的累积分桶直方图"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文：代码块正常结束时记录耗时"""
+        started = time.perf_counter()
+        yield
+        self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self):
+        samples = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    samples.append((f'{self.name}_bucket', {**labels, 'le': _format_value(float(bound))}, cumulative))
+                samples.append((f'{self.name}_bucket', {**labels, 'le': '+Inf'}, series['count']))
+                samples.append((f'{self.name}_sum', labels, series['sum']))
+                samples.append((f'{self.name}_count', labels, series['count']))
+        return _family(self.name, 'histogram', self.documentation, samples)
+
+
+class MetricsRegistry:
+    """直方图和抓取时调用的采集函数"""
+
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._histograms.append(histogram)
+        return histogram
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Prometheus 文本格式；采集函数出错时跳过，不影响其他指标"""
+        with self._lock:
+            histograms = list(self._histograms)
+            collectors = list(self._collectors)
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.collect())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception:
+                continue
+            for name, kind, documentation, samples in families:
+                lines.extend(_family(name, kind, documentation, [(name, labels, value) for labels, value in samples]))
+        return '\n'.join(lines) + '\n'
+
+
+def process_metrics():
+    """进程常驻内存 (RSS) 和启动时间；RSS 从 /proc 读取，其他平台只报告启动时间"""
+    families = [('process_start_time_seconds', 'gauge', '进程启动时间 (Unix 时间戳)', [({}, _PROCESS_START)])]
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        families.append(('process_resident_memory_bytes', 'gauge', '进程常驻内存 (字节)',
+                         [({}, resident_pages * os.sysconf('SC_PAGE_SIZE'))]))
+    except (OSError, ValueError, AttributeError):
+        pass
+    return families
+
+
+_PROCESS_START = time.time()
+
+
+class MetricsServer:
+    """在后台线程中提供 GET /metrics 的本地 HTTP 服务"""
+
+    def __init__(self, registry, host='127.0.0.1', port=0):
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,437 @@
+"""离线静态报告：并行渲染仪表板各分析模块，输出单个自包含的 HTML 文件
+
+直接调用 app.py 中各模块的 show_* 函数（Streamlit 裸模式，筛选控件取默认值），
+把它们输出的标题、分析文字、KPI 指标、表格和 Plotly 图表按调用顺序记录下来。
+各模块在线程池中并行计算，数据集、派生聚合和图表都走 app 的进程内缓存，
+多个模块共用的聚合（用户指标、按天索引等）只计算一次。
+
+用法：
+    python report.py                                   # 默认数据集，输出 report.html
+    python report.py --dataset 名称 --output weekly.html
+    python report.py --images report_images            # 另存每张图表的 PNG（需要 kaleido）
+"""
+import argparse
+import html
+import logging
+import os
+import re
+import sys
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# 报告包含的模块（客户查询是交互式检索，不纳入报告）
+REPORT_SECTIONS = [
+    ("📈 数据概览", "show_data_overview"),
+    ("👥 用户分析", "show_user_analysis"),
+    ("🌍 地区分析", "show_geographic_analysis"),
+    ("🛍️ 产品分析", "show_product_analysis"),
+    ("💳 支付分析", "show_payment_analysis"),
+    ("📅 时间趋势", "show_time_analysis"),
+    ("🎯 用户行为画像", "show_user_behavior_analysis"),
+    ("🛒 用户购买偏好", "show_user_preference_analysis"),
+]
+
+# 表格最多输出的行数
+MAX_TABLE_ROWS = 50
+
+# 图表每条轨迹最多内嵌的原始点数，超出时抽稀或换成汇总统计，避免报告文件过大
+MAX_TRACE_POINTS = 5000
+
+REPORT_CSS = """
+<style>
+    body { font-family: -apple-system, "Segoe UI", "PingFang SC", "Microsoft YaHei", sans-serif;
+           max-width: 1400px; margin: 0 auto; padding: 1rem 2rem; color: #262730; }
+    .toc a { margin-right: 1rem; }
+    .kpi-row { display: flex; flex-wrap: wrap; gap: 1rem; margin: 1rem 0; }
+    .kpi-row .metric-card { flex: 1 1 12rem; }
+    .metric-label { font-size: 0.85rem; color: #666; }
+    .metric-value { font-size: 1.6rem; font-weight: bold; }
+    .metric-delta { font-size: 0.85rem; color: #4caf50; }
+    .figure-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(560px, 1fr)); gap: 1rem; }
+    .data-table { border-collapse: collapse; font-size: 0.85rem; margin: 0.5rem 0; }
+    .data-table th, .data-table td { border: 1px solid #ddd; padding: 0.3rem 0.6rem; text-align: right; }
+    .caption { font-size: 0.85rem; color: #666; }
+    .alert { padding: 0.6rem 1rem; border-radius: 0.4rem; margin: 0.5rem 0; background: #f8f9fa; }
+    .alert-success { background: #e8f5e9; } .alert-warning { background: #fff8e1; }
+    .alert-error { background: #ffebee; } .alert-info { background: #e3f2fd; }
+    .section-error { color: #c62828; }
+    footer { margin-top: 3rem; font-size: 0.8rem; color: #888; }
+</style>
+"""
+
+_capture = threading.local()
+_install_lock = threading.Lock()
+
+
+class SectionRecorder:
+    """按调用顺序记录一个模块输出的元素 [(类型, 内容)]"""
+
+    def __init__(self, title):
+        self.title = title
+        self.elements = []
+        self.seconds = 0.0
+        self.error = None
+
+    def add(self, kind, payload):
+        self.elements.append((kind, payload))
+
+
+def _record_markdown(recorder, body, *args, **kwargs):
+    recorder.add('markdown', str(body))
+
+
+def _record_write(recorder, *args, **kwargs):
+    for arg in args:
+        if isinstance(arg, pd.DataFrame):
+            recorder.add('table', (arg, True))
+        else:
+            recorder.add('markdown', str(arg))
+
+
+def _record_caption(recorder, body, *args, **kwargs):
+    recorder.add('caption', str(body))
+
+
+def _record_alert(kind):
+    def record(recorder, body, *args, **kwargs):
+        recorder.add('alert', (kind, str(body)))
+    return record
+
+
+def _record_metric(recorder, label, value, delta=None, *args, **kwargs):
+    recorder.add('metric', (str(label), str(value), None if delta is None else str(delta)))
+
+
+def _record_plotly_chart(recorder, figure, *args, **kwargs):
+    recorder.add('figure', figure)
+
+
+def _record_dataframe(recorder, data, *args, **kwargs):
+    recorder.add('table', (pd.DataFrame(data), not kwargs.get('hide_index', False)))
+
+
+def _record_fragment(recorder, func=None, *args, **kwargs):
+    # 没有 ScriptRunContext 时片段不会执行，记录时按普通函数内联运行
+    if func is None:
+        return lambda f: f
+    return func
+
+
+_RECORDERS = {
+    'markdown': _record_markdown,
+    'write': _record_write,
+    'caption': _record_caption,
+    'info': _record_alert('info'),
+    'success': _record_alert('success'),
+    'warning': _record_alert('warning'),
+    'error': _record_alert('error'),
+    'metric': _record_metric,
+    'plotly_chart': _record_plotly_chart,
+    'dataframe': _record_dataframe,
+    'fragment': _record_fragment,
+}
+
+
+class _SkipRecordingThreads(logging.Filter):
+    """记录中的线程没有 ScriptRunContext，不输出裸模式警告"""
+
+    def filter(self, record):
+        return getattr(_capture, 'recorder', None) is None
+
+
+def install_capture(st):
+    """替换 st 上的输出函数：当前线程在记录时写入记录器，否则调用原函数"""
+    with _install_lock:
+        if getattr(st, '_report_capture_installed', False):
+            return
+        logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').addFilter(_SkipRecordingThreads())
+        for name, record in _RECORDERS.items():
+            original = getattr(st, name)
+
+            def wrapper(*args, _original=original, _record=record, **kwargs):
+                recorder = getattr(_capture, 'recorder', None)
+                if recorder is None:
+                    return _original(*args, **kwargs)
+                return _record(recorder, *args, **kwargs)
+
+            setattr(st, name, wrapper)
+        st._report_capture_installed = True
+
+
+def render_section(show_fn, df, title):
+    """在当前线程中运行一个模块并记录输出"""
+    recorder = SectionRecorder(title)
+    _capture.recorder = recorder
+    start = time.perf_counter()
+    try:
+        show_fn(df)
+    except Exception as e:
+        recorder.error = f"{type(e).__name__}: {e}"
+    finally:
+        recorder.seconds = time.perf_counter() - start
+        _capture.recorder = None
+    return recorder
+
+
+def build_sections(app, df, sections=REPORT_SECTIONS, workers=None):
+    """在线程池中并行渲染各模块，按 sections 的顺序返回记录器"""
+    install_capture(app.st)
+    workers = workers or min(len(sections), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report') as pool:
+        futures = [pool.submit(render_section, getattr(app, func_name), df, title) for title, func_name in sections]
+        return [future.result() for future in futures]
+
+
+def _sample_trace(trace, max_points):
+    """散点轨迹等间隔抽稀，同时截取逐点的文本、尺寸和颜色"""
+    n = len(trace.x)
+    keep = np.linspace(0, n - 1, max_points).astype(np.int64)
+
+    def take(values):
+        if values is None or isinstance(values, str) or np.ndim(values) == 0 or len(values) != n:
+            return None
+        return np.asarray(values)[keep]
+
+    updates = {attr: take(getattr(trace, attr, None)) for attr in ('x', 'y', 'z', 'text', 'hovertext', 'customdata', 'ids')}
+    trace.update({attr: value for attr, value in updates.items() if value is not None})
+    for attr in ('size', 'color'):
+        value = take(getattr(trace.marker, attr, None))
+        if value is not None:
+            trace.marker[attr] = value
+    return trace
+
+
+def _histogram_as_bars(trace):
+    """原始值直方图换成预先分好箱的柱状图（计数不变）"""
+    values = np.asarray(trace.x, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=trace.nbinsx or 50)
+    return go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), name=trace.name,
+                  marker=dict(color=trace.marker.color), showlegend=trace.showlegend)
+
+
+def _box_as_statistics(trace):
+    """原始值箱线图换成预先算好的四分位数和须线（1.5 IQR，不再画离群点）"""
+    vertical = trace.y is not None
+    values = np.asarray(trace.y if vertical else trace.x, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    lower = values[values >= q1 - 1.5 * iqr].min()
+    upper = values[values <= q3 + 1.5 * iqr].max()
+    stats = dict(q1=[q1], median=[median], q3=[q3], lowerfence=[lower], upperfence=[upper], mean=[values.mean()])
+    return go.Box(name=trace.name, marker=dict(color=trace.marker.color), boxpoints=False,
+                  **(stats if vertical else dict(stats, orientation='h')))
+
+
+def compact_figure(figure, max_points=MAX_TRACE_POINTS):
+    """减小报告中大图表的体积：散点抽稀，原始值直方图/箱线图换成汇总统计
+
+    返回副本，不修改缓存中的图表。
+    """
+    def raw_length(trace):
+        if trace.type in ('scatter', 'scattergl', 'scatter3d', 'histogram') and trace.x is not None:
+            return len(trace.x)
+        if trace.type == 'box':
+            values = trace.y if trace.y is not None else trace.x
+            return 0 if values is None else len(values)
+        return 0
+
+    if all(raw_length(trace) <= max_points for trace in figure.data):
+        return figure
+    traces = []
+    for trace in figure.data:
+        if raw_length(trace) <= max_points:
+            traces.append(trace)
+        elif trace.type == 'histogram':
+            traces.append(_histogram_as_bars(trace) if trace.y is None else trace)
+        elif trace.type == 'box':
+            traces.append(_box_as_statistics(trace))
+        else:
+            traces.append(_sample_trace(go.Figure(trace).data[0], max_points))
+    return go.Figure(data=traces, layout=figure.layout)
+
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*)$')
+
+
+def _inline(text):
+    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', text)
+    return re.sub(r'(?<!\*)\*(?!\s)(.+?)(?<!\s)\*(?!\*)', r'<em>\1</em>', text)
+
+
+def markdown_to_html(text):
+    """app 中用到的 Markdown 子集（标题、列表、粗体/斜体，HTML 原样保留）"""
+    text = textwrap.dedent(text).strip()
+    if text.startswith('<'):
+        return text
+    parts, items = [], []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('- '):
+            items.append(f'<li>{_inline(line[2:])}</li>')
+            continue
+        if items:
+            parts.append('<ul>' + ''.join(items) + '</ul>')
+            items = []
+        heading = _HEADING.match(line)
+        if heading:
+            level = len(heading.group(1))
+            parts.append(f'<h{level}>{_inline(heading.group(2))}</h{level}>')
+        elif line:
+            parts.append(f'<p>{_inline(line)}</p>')
+    if items:
+        parts.append('<ul>' + ''.join(items) + '</ul>')
+    return '\n'.join(parts)
+
+
+def _element_html(kind, payload):
+    if kind == 'markdown':
+        return markdown_to_html(payload)
+    if kind == 'caption':
+        return f'<p class="caption">{html.escape(payload)}</p>'
+    if kind == 'alert':
+        alert_kind, body = payload
+        return f'<div class="alert alert-{alert_kind}">{html.escape(body)}</div>'
+    if kind == 'metric':
+        label, value, delta = payload
+        delta_html = f'<div class="metric-delta">{html.escape(delta)}</div>' if delta else ''
+        return (f'<div class="metric-card"><div class="metric-label">{html.escape(label)}</div>'
+                f'<div class="metric-value">{html.escape(value)}</div>{delta_html}</div>')
+    if kind == 'figure':
+        return compact_figure(payload).to_html(full_html=False, include_plotlyjs=False, config={'displaylogo': False})
+    if kind == 'table':
+        data, show_index = payload
+        note = f'<p class="caption">共 {len(data):,} 行，仅显示前 {MAX_TABLE_ROWS} 行</p>' if len(data) > MAX_TABLE_ROWS else ''
+        return data.head(MAX_TABLE_ROWS).to_html(classes='data-table', index=show_index, border=0,
+                                                 float_format=lambda v: f'{v:,.2f}') + note
+    raise ValueError(f'未知的报告元素: {kind}')
+
+
+def section_html(recorder, anchor):
+    """一个模块的 HTML：连续的 KPI 排成一行，连续的图表排成网格"""
+    parts = [f'<section id="{anchor}">']
+    group_kind, group = None, []
+
+    def close_group():
+        if group:
+            css = 'kpi-row' if group_kind == 'metric' else 'figure-grid'
+            parts.append(f'<div class="{css}">' + '\n'.join(group) + '</div>')
+            group.clear()
+
+    for kind, payload in recorder.elements:
+        if kind in ('metric', 'figure'):
+            if kind != group_kind:
+                close_group()
+            group_kind = kind
+            group.append(_element_html(kind, payload))
+        else:
+            close_group()
+            group_kind = None
+            parts.append(_element_html(kind, payload))
+    close_group()
+    if recorder.error:
+        parts.append(f'<p class="section-error">⚠️ 本模块渲染失败：{html.escape(recorder.error)}</p>')
+    parts.append('</section>')
+    return '\n'.join(parts)
+
+
+def render_html(recorders, dataset_name, df, app_css='', build_seconds=None):
+    """组装自包含的 HTML（plotly.js 内嵌一次，离线可打开）"""
+    from plotly.offline import get_plotlyjs
+
+    generated = datetime.now().strftime('%Y-%m-%d %H:%M')
+    toc = ' '.join(f'<a href="#section-{i}">{html.escape(r.title)}</a>' for i, r in enumerate(recorders))
+    body = '\n'.join(section_html(r, f'section-{i}') for i, r in enumerate(recorders))
+    timings = '，'.join(f'{r.title} {r.seconds:.1f}s' for r in recorders)
+    total = f'，总耗时 {build_seconds:.1f}s' if build_seconds is not None else ''
+    return f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>电商数据分析报告 - {html.escape(dataset_name)} - {generated}</title>
+<script type="text/javascript">{get_plotlyjs()}</script>
+{app_css}
+{REPORT_CSS}
+</head>
+<body>
+<h1 class="main-header">🛒 电商数据分析报告</h1>
+<p class="caption">数据集 {html.escape(dataset_name)}（{len(df):,} 笔交易），生成于 {generated}</p>
+<nav class="toc">{toc}</nav>
+{body}
+<footer>各模块耗时：{html.escape(timings)}{total}</footer>
+</body>
+</html>
+"""
+
+
+def export_images(recorders, directory, image_format='png'):
+    """把每张图表另存为图片（需要 kaleido），返回写出的文件列表"""
+    try:
+        import kaleido  # noqa: F401
+    except ImportError:
+        raise RuntimeError('导出图片需要安装 kaleido：pip install kaleido')
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for i, recorder in enumerate(recorders):
+        figures = [payload for kind, payload in recorder.elements if kind == 'figure']
+        for j, figure in enumerate(figures):
+            path = os.path.join(directory, f'{i + 1:02d}_{j + 1:02d}.{image_format}')
+            figure.write_image(path)
+            written.append(path)
+    return written
+
+
+def generate_report(dataset_name=None, output='report.html', images=None, workers=None):
+    """加载数据集、并行渲染各模块并写出报告，返回各模块记录器"""
+    import app
+    import streamlit.logger
+    # 裸模式下 Streamlit 对每个组件调用都会打印警告
+    streamlit.logger.set_log_level('error')
+
+    registry = app.discover_datasets()
+    if not registry:
+        raise FileNotFoundError('找不到数据文件')
+    dataset_name = dataset_name or next(iter(registry))
+    if dataset_name not in registry:
+        raise KeyError(f'未知的数据集: {dataset_name}，可选: {", ".join(registry)}')
+
+    start = time.perf_counter()
+    df = app.load_data(dataset_name, registry[dataset_name])
+    load_seconds = time.perf_counter() - start
+    recorders = build_sections(app, df, workers=workers)
+    build_seconds = time.perf_counter() - start
+
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(render_html(recorders, dataset_name, df, app.APP_CSS, build_seconds))
+    if images:
+        export_images(recorders, images)
+
+    print(f'数据加载 {load_seconds:.1f}s，报告生成 {build_seconds:.1f}s -> {output}')
+    for recorder in recorders:
+        status = f'失败 ({recorder.error})' if recorder.error else f'{len(recorder.elements)} 个元素'
+        print(f'  {recorder.title}: {recorder.seconds:.2f}s，{status}')
+    return recorders
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成电商数据分析离线报告')
+    parser.add_argument('--dataset', help='数据集名称（默认第一个）')
+    parser.add_argument('--output', default='report.html', help='输出的 HTML 文件')
+    parser.add_argument('--images', help='另存图表图片的目录（需要 kaleido）')
+    parser.add_argument('--workers', type=int, help='并行线程数（默认取模块数与 CPU 核数的较小值）')
+    args = parser.parse_args()
+
+    recorders = generate_report(args.dataset, args.output, args.images, args.workers)
+    return 1 if any(r.error for r in recorders) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
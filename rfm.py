@@ -0,0 +1,57 @@
+"""RFM 用户价值模型（仪表板各模块共用）"""
+import numpy as np
+import pandas as pd
+
+from seq_kernels import user_sequence_metrics
+
+# 用户分层规则，按顺序匹配，第一个满足的规则生效
+SEGMENT_NAMES = ['Champions', 'Loyal Customers', 'New Customers', 'Potential Loyalists', 'At Risk', 'Lost Customers']
+
+
+def score_rfm(rfm_data):
+    """为 Recency/Frequency/Monetary 打 1-5 分"""
+    # RFM分位数划分 - 修复标签错误
+    try:
+        rfm_data['R_Score'] = pd.qcut(rfm_data['Recency'], q=5, duplicates='drop', labels=False) + 1
+        rfm_data['R_Score'] = 6 - rfm_data['R_Score']  # 反转分数，越近期分数越高
+
+        rfm_data['F_Score'] = pd.qcut(rfm_data['Frequency'].rank(method='first'), q=5, duplicates='drop', labels=False) + 1
+        rfm_data['M_Score'] = pd.qcut(rfm_data['Monetary'], q=5, duplicates='drop', labels=False) + 1
+    except ValueError:
+        # 如果分位数划分失败，使用简单的分段方法
+        rfm_data['R_Score'] = pd.cut(rfm_data['Recency'], bins=5, labels=[5,4,3,2,1]).astype(int)
+        rfm_data['F_Score'] = pd.cut(rfm_data['Frequency'], bins=5, labels=[1,2,3,4,5]).astype(int)
+        rfm_data['M_Score'] = pd.cut(rfm_data['Monetary'], bins=5, labels=[1,2,3,4,5]).astype(int)
+
+    # 组合RFM分数
+    rfm_data['RFM_Score'] = rfm_data['R_Score'].astype(str) + rfm_data['F_Score'].astype(str) + rfm_data['M_Score'].astype(str)
+    return rfm_data
+
+
+def segment_rfm(rfm_data):
+    """按RFM分数做详细的用户细分（向量化，规则与原逐行判断一致）"""
+    r = rfm_data['R_Score'].to_numpy()
+    f = rfm_data['F_Score'].to_numpy()
+    m = rfm_data['M_Score'].to_numpy()
+    conditions = [
+        (r >= 4) & (f >= 4) & (m >= 4),
+        (r >= 3) & (f >= 3) & (m >= 3),
+        (r >= 4) & (f <= 2),
+        (r >= 3) & (f >= 3) & (m <= 2),
+        (r <= 2) & (f >= 4) & (m >= 4),
+        (r <= 2) & (f <= 2),
+    ]
+    return np.select(conditions, SEGMENT_NAMES, default='Others')
+
+
+def compute_rfm(df, user_metrics=None):
+    """计算每个用户的RFM指标、分数和细分（可传入已算好的 user_sequence_metrics 结果）"""
+    # Recency / Frequency / Monetary 由顺序指标内核一次遍历得到
+    if user_metrics is None:
+        user_metrics = user_sequence_metrics(df)
+    rfm_data = user_metrics[['User_Name', 'Recency', 'Orders', 'Monetary']].copy()
+    rfm_data.columns = ['User_Name', 'Recency', 'Frequency', 'Monetary']
+
+    rfm_data = score_rfm(rfm_data)
+    rfm_data['Segment'] = segment_rfm(rfm_data)
+    return rfm_data
@@ -0,0 +1,115 @@
+"""渐进式渲染用的抽样与 KPI 区间估计
+
+大数据集先用样本渲染各分析模块，全量精确结果在后台计算。两种样本：
+
+- 交易样本：按 国家×品类 分层抽样，各层按相同比例分配（每层至少
+  min_per_stratum 行），用于按交易汇总的模块。销售额用分层估计量，方差按
+  各层样本方差加有限总体校正计算。
+- 用户样本：随机抽取一部分用户并保留他们的全部交易，用于按用户汇总的模块
+  （复购率、RFM 等逐用户指标在样本中是精确的）。复购率按二项比例估计。
+"""
+import numpy as np
+import pandas as pd
+
+STRATA = ['Country', 'Product_Category']
+
+# 95% 置信区间
+Z_95 = 1.959964
+
+
+def _strata_codes(df):
+    """国家×品类 的分层编号"""
+    codes = np.zeros(len(df), dtype=np.int64)
+    for column in STRATA:
+        column_codes, uniques = pd.factorize(df[column])
+        codes = codes * len(uniques) + column_codes
+    return codes
+
+
+def stratified_indices(codes, n_target, min_per_stratum=30, seed=0):
+    """按层等比例分配的抽样，返回 (行号, 各层总体行数)
+
+    每行以所在层的抽样比例独立入样，只需一次遍历、不需要排序；给定各层实际
+    入样行数时，层内样本仍是简单随机样本。
+    """
+    sizes = np.bincount(codes)
+    fraction = min(1.0, n_target / max(len(codes), 1))
+    alloc = np.minimum(sizes, np.maximum(sizes * fraction, min_per_stratum))
+    rates = np.divide(alloc, sizes, out=np.zeros(len(sizes)), where=sizes > 0)
+    rng = np.random.default_rng(seed)
+    return np.flatnonzero(rng.random(len(codes)) < rates[codes]), sizes
+
+
+def build_progressive_sample(df, n_target=200_000, min_per_stratum=30, seed=0):
+    """建立交易样本、用户样本和估计 KPI 所需的分层统计"""
+    name = df.attrs.get('dataset_name')
+    codes = _strata_codes(df)
+    chosen, sizes = stratified_indices(codes, n_target, min_per_stratum, seed)
+    transactions = df.iloc[chosen]
+    # sample_of：样本的派生结果记在原数据集的缓存条目下，随原数据集一起计入预算和淘汰
+    transactions.attrs = dict(df.attrs, dataset_name=f'{name}~sample', sample_of=name)
+
+    # 各层的样本均值和方差（销售额分层估计）
+    amounts = transactions['Purchase_Amount'].to_numpy(np.float64)
+    sample_codes = codes[chosen]
+    n_h = np.bincount(sample_codes, minlength=len(sizes)).astype(np.float64)
+    sums = np.bincount(sample_codes, weights=amounts, minlength=len(sizes))
+    squares = np.bincount(sample_codes, weights=amounts * amounts, minlength=len(sizes))
+    present = n_h > 0
+    mean = np.divide(sums, n_h, out=np.zeros_like(sums), where=present)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = np.where(n_h > 1, (squares - n_h * mean * mean) / (n_h - 1), 0.0)
+
+    # 用户样本：按用户整体抽取，用户比例与交易样本相同
+    user_codes, users = pd.factorize(df['User_Name'])
+    user_fraction = min(1.0, n_target / max(len(df), 1))
+    picked = np.random.default_rng(seed + 1).random(len(users)) < user_fraction
+    user_rows = df[picked[user_codes]]
+    user_rows.attrs = dict(df.attrs, dataset_name=f'{name}~users', sample_of=name)
+
+    return {
+        'rows': len(df),
+        'n_users': len(users),
+        'fraction': len(chosen) / max(len(df), 1),
+        'transactions': transactions,
+        'strata': pd.DataFrame({'N': sizes, 'n': n_h, 'mean': mean, 'var': np.clip(var, 0, None)}),
+        'user_fraction': user_fraction,
+        'users': user_rows,
+    }
+
+
+def _interval(estimate, se):
+    estimate, se = float(estimate), float(se)
+    return {'estimate': estimate, 'low': estimate - Z_95 * se, 'high': estimate + Z_95 * se, 'se': se}
+
+
+def estimate_kpis(sample):
+    """由样本估计销售额、客单价和复购率及其 95% 置信区间（订单数为全量精确值）"""
+    strata = sample['strata']
+    strata = strata[strata['n'] > 0]
+    N, n = strata['N'].to_numpy(np.float64), strata['n'].to_numpy(np.float64)
+    revenue = float((N * strata['mean']).sum())
+    revenue_var = float((N * N * (1 - n / N) * strata['var'] / n).sum())
+    revenue_kpi = _interval(revenue, np.sqrt(max(revenue_var, 0.0)))
+
+    rows = sample['rows']
+    aov = _interval(revenue / rows, revenue_kpi['se'] / rows) if rows else _interval(np.nan, np.nan)
+
+    # 复购率：样本用户中交易数大于 1 的比例，按抽样比例做有限总体校正
+    counts = sample['users']['User_Name'].value_counts()
+    m = len(counts)
+    if m:
+        p = float((counts > 1).mean())
+        fpc = max(1 - m / max(sample['n_users'], 1), 0.0)
+        repurchase = _interval(p, np.sqrt(p * (1 - p) / m * fpc))
+        repurchase['low'] = max(repurchase['low'], 0.0)
+        repurchase['high'] = min(repurchase['high'], 1.0)
+    else:
+        repurchase = _interval(np.nan, np.nan)
+
+    return {
+        'Revenue': revenue_kpi,
+        'AOV': aov,
+        'Repurchase_Rate': repurchase,
+        'Orders': {'estimate': rows, 'low': rows, 'high': rows, 'se': 0.0},
+    }
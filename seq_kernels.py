@@ -0,0 +1,204 @@
+"""按用户排序数组上的顺序指标内核
+
+一次遍历 (用户, 日期) 排序后的数组，同时得到：订单序号、复购间隔、
+首购/第二次购买日期、最近购买日期、订单数、消费总额和中位复购间隔。
+安装了 Numba 时使用 JIT 编译的循环内核，否则回退到纯 NumPy 向量化实现。
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def _sequential_loop(codes, days, amounts):
+    """逐行扫描的内核（被 Numba 编译后使用）"""
+    n = len(codes)
+    n_users = 0
+    for i in range(n):
+        if i == 0 or codes[i] != codes[i - 1]:
+            n_users += 1
+
+    order_idx = np.empty(n, np.int64)
+    gaps = np.empty(n, np.float64)
+    first_day = np.empty(n_users, np.int64)
+    second_day = np.full(n_users, -1, np.int64)
+    last_day = np.empty(n_users, np.int64)
+    orders = np.zeros(n_users, np.int64)
+    monetary = np.zeros(n_users, np.float64)
+    median_gap = np.full(n_users, np.nan)
+
+    u = -1
+    start = 0
+    for i in range(n + 1):
+        new_user = i == n or i == 0 or codes[i] != codes[i - 1]
+        if new_user and u >= 0 and i - start > 1:
+            # 用户结束时计算该用户的中位复购间隔
+            median_gap[u] = np.median(gaps[start + 1:i])
+        if i == n:
+            break
+        if new_user:
+            u += 1
+            start = i
+            first_day[u] = days[i]
+            gaps[i] = np.nan
+        else:
+            gaps[i] = days[i] - days[i - 1]
+            if i == start + 1:
+                second_day[u] = days[i]
+        order_idx[i] = i - start + 1
+        orders[u] += 1
+        monetary[u] += amounts[i]
+        last_day[u] = days[i]
+
+    return order_idx, gaps, first_day, second_day, last_day, orders, monetary, median_gap
+
+
+if HAS_NUMBA:
+    _sequential_jit = njit(cache=True, nogil=True)(_sequential_loop)
+
+
+def _empty_metrics():
+    """没有交易时的结果（筛选后为空），各数组的 dtype 与内核输出一致"""
+    return (np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.int64), np.empty(0, np.int64),
+            np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.float64))
+
+
+def _sequential_numpy(codes, days, amounts):
+    """NumPy 向量化实现，结果与 Numba 内核一致"""
+    n = len(codes)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = codes[1:] != codes[:-1]
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], n)
+    user_of_row = np.cumsum(is_start) - 1
+
+    order_idx = np.arange(n) - starts[user_of_row] + 1
+    gaps = np.empty(n, np.float64)
+    gaps[0:1] = np.nan
+    gaps[1:] = days[1:] - days[:-1]
+    gaps[starts] = np.nan
+
+    orders = ends - starts
+    first_day = days[starts]
+    last_day = days[ends - 1]
+    second_day = np.where(orders > 1, days[np.minimum(starts + 1, n - 1)], -1)
+    monetary = np.add.reduceat(amounts, starts) if n else np.zeros(0)
+
+    # 中位复购间隔：按 (用户, 间隔) 排序后取每个用户中间位置
+    valid = ~is_start
+    gap_users = user_of_row[valid]
+    gap_values = gaps[valid]
+    gap_sorted = gap_values[np.lexsort((gap_values, gap_users))]
+    n_gaps = orders - 1
+    gap_starts = np.cumsum(n_gaps) - n_gaps
+    has_gap = n_gaps > 0
+    lo = gap_starts[has_gap] + (n_gaps[has_gap] - 1) // 2
+    hi = gap_starts[has_gap] + n_gaps[has_gap] // 2
+    median_gap = np.full(len(starts), np.nan)
+    median_gap[has_gap] = (gap_sorted[lo] + gap_sorted[hi]) / 2
+
+    return order_idx, gaps, first_day, second_day, last_day, orders, monetary, median_gap
+
+
+def sequential_metrics(codes, days, amounts, use_numba=None):
+    """在按 (用户, 日期) 排序的数组上计算所有顺序指标
+
+    codes 为用户编码，days 为自纪元起的整数天数，amounts 为交易金额。
+    返回 (行级订单序号, 行级复购间隔, 首购日, 第二次购买日, 最近购买日,
+    订单数, 消费总额, 中位复购间隔)，没有第二次购买的用户第二次购买日为 -1。
+    """
+    if use_numba is None:
+        use_numba = HAS_NUMBA
+    codes = np.ascontiguousarray(codes, dtype=np.int64)
+    days = np.ascontiguousarray(days, dtype=np.int64)
+    amounts = np.ascontiguousarray(amounts, dtype=np.float64)
+    if len(codes) == 0:
+        return _empty_metrics()
+    if use_numba and HAS_NUMBA:
+        return _sequential_jit(codes, days, amounts)
+    return _sequential_numpy(codes, days, amounts)
+
+
+def to_days(dates):
+    """日期列转换为自1970-01-01起的整数天数"""
+    return np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+
+
+def sort_by_user(df):
+    """按 (User_Name, Transaction_Date) 排序，返回行顺序、排序后的用户编码/天数和用户名"""
+    codes, names = pd.factorize(df['User_Name'], sort=True)
+    days = to_days(df['Transaction_Date'])
+    order = np.lexsort((days, codes))
+    return order, codes[order], days[order], np.asarray(names)
+
+
+def user_sequence_metrics(df, as_of=None, use_numba=None, return_sorted=False):
+    """每个用户的顺序指标表
+
+    return_sorted=True 时额外返回附加了 Order_Idx / Interpurchase_Days 的排序交易表。
+    """
+    order, codes, days, names = sort_by_user(df)
+    amounts = df['Purchase_Amount'].to_numpy()[order]
+    (order_idx, gaps, first_day, second_day, last_day,
+     orders, monetary, median_gap) = sequential_metrics(codes, days, amounts, use_numba)
+
+    if as_of is None:
+        as_of_day = days.max() if len(days) else 0
+    else:
+        as_of_day = to_days([pd.Timestamp(as_of)])[0]
+
+    epoch = np.datetime64('1970-01-01', 'D')
+    has_second = second_day >= 0
+    second_dates = np.where(has_second, second_day, 0).astype('timedelta64[D]') + epoch
+    user_metrics = pd.DataFrame({
+        'User_Name': names,
+        'Orders': orders,
+        'Monetary': monetary,
+        'First_Purchase': pd.to_datetime(first_day.astype('timedelta64[D]') + epoch),
+        'Second_Purchase': pd.to_datetime(second_dates).where(has_second),
+        'Last_Purchase': pd.to_datetime(last_day.astype('timedelta64[D]') + epoch),
+        'Days_to_2nd': np.where(has_second, second_day - first_day, np.nan),
+        'Recency': as_of_day - last_day,
+        'Interpurchase_Median': median_gap,
+    })
+    if not return_sorted:
+        return user_metrics
+
+    df_sorted = df.iloc[order].reset_index(drop=True)
+    df_sorted['Order_Idx'] = order_idx
+    df_sorted['Interpurchase_Days'] = gaps
+    return user_metrics, df_sorted
+
+
+if __name__ == "__main__":
+    # 基准测试：python seq_kernels.py [行数] [用户数]
+    import sys
+    import time
+
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    n_users = int(sys.argv[2]) if len(sys.argv) > 2 else 500_000
+    rng = np.random.default_rng(0)
+    codes = np.sort(rng.integers(0, n_users, n_rows))
+    days = rng.integers(19000, 19730, n_rows)
+    days = days[np.lexsort((days, codes))]
+    amounts = rng.uniform(10, 1000, n_rows)
+
+    if HAS_NUMBA:
+        sequential_metrics(codes[:10], days[:10], amounts[:10], use_numba=True)  # 预热编译
+
+    paths = [False, True] if HAS_NUMBA else [False]
+    results = {}
+    for use_jit in paths:
+        start = time.perf_counter()
+        results[use_jit] = sequential_metrics(codes, days, amounts, use_numba=use_jit)
+        name = "Numba" if use_jit else "NumPy"
+        print(f"{name:>6}: {time.perf_counter() - start:.3f}s  ({n_rows:,} 行, {n_users:,} 用户)")
+    if not HAS_NUMBA:
+        print("未安装 Numba，仅测试 NumPy 路径")
+    else:
+        same = all(np.allclose(a, b, equal_nan=True) for a, b in zip(results[False], results[True]))
+        print(f"两条路径结果一致: {same}")
@@ -0,0 +1,265 @@
+"""多进程共享的数据集存储（内存映射，一台主机只保留一份数据）
+
+同一主机上运行多个 Streamlit 进程时，每个进程各自读取 CSV 会让内存随进程数
+成倍增长。发布进程（python shared_dataset.py）把预处理后的交易表写成
+Arrow IPC 文件，把较大的派生结果（用户排序、用户指标、RFM）一并预先算好写在
+同一目录；各工作进程以只读方式内存映射这些文件，列数据直接引用映射区，
+不复制（建议放在 /dev/shm 等 tmpfs 上，所有进程共用同一份页缓存）。
+
+目录结构：
+    <store>/<数据集>/<版本>/transactions.arrow   交易表（每列一个连续块）
+    <store>/<数据集>/<版本>/<派生结果>.arrow|npy  预计算的派生结果
+    <store>/<数据集>/<版本>/manifest.json
+    <store>/<数据集>/CURRENT.json                 当前版本
+新版本先写入临时目录，整体改名后再原子替换 CURRENT.json；已映射旧版本的进程
+不受影响，旧目录只保留最近 KEEP_VERSIONS 个。需要 pyarrow。
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from ingest import get_dataset_version
+from rfm import compute_rfm
+from seq_kernels import sort_by_user, user_sequence_metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+CURRENT_FILE = 'CURRENT.json'
+MANIFEST_FILE = 'manifest.json'
+TRANSACTIONS_FILE = 'transactions.arrow'
+KEEP_VERSIONS = 2
+
+# 本进程已映射的交易表（版本目录 -> DataFrame）。attrs 会随切片、抽样复制到新表上，
+# 只有映射出来的那张表本身才能使用共享的派生结果
+_ATTACHED = weakref.WeakValueDictionary()
+
+# 预先计算并共享的派生结果：键与 app.py 中 derived() 的键一致，按顺序计算
+ROLLUPS = {
+    'user_order': lambda df, done: sort_by_user(df),
+    'user_metrics': lambda df, done: user_sequence_metrics(df),
+    'rfm': lambda df, done: compute_rfm(df, done['user_metrics']),
+}
+
+
+def dataset_dir(store, name):
+    return os.path.join(store, name)
+
+
+def _write_json(path, value):
+    """先写临时文件再改名，读取方不会看到写了一半的文件"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_frame(path, frame):
+    """DataFrame 写成 Arrow IPC 文件；Period 列存为整数序号，每列合并为一个连续块"""
+    periods = {}
+    columns = {}
+    for column in frame.columns:
+        series = frame[column]
+        if isinstance(series.dtype, pd.PeriodDtype):
+            periods[column] = str(series.dtype)
+            series = pd.Series(series.array.asi8, index=series.index)
+        columns[column] = series
+    table = pa.Table.from_pandas(pd.DataFrame(columns), preserve_index=False).combine_chunks()
+    # 多个块的数值列转成 numpy 时必须拼接复制，写成单个记录批才能零拷贝映射
+    with pa.OSFile(path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    return periods
+
+
+def _map_frame(path, periods):
+    """内存映射 Arrow IPC 文件为 DataFrame（数值、日期、字符串列均不复制）"""
+    table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    frame = table.to_pandas(split_blocks=True)
+    if not periods:
+        return frame
+    # 按列重新组装（列赋值会复制数据）
+    columns = {column: frame[column] for column in frame.columns}
+    for column, dtype in periods.items():
+        ordinals = frame[column].to_numpy()
+        columns[column] = pd.Series(pd.arrays.PeriodArray(ordinals, dtype=pd.api.types.pandas_dtype(dtype)), copy=False)
+    return pd.DataFrame(columns, copy=False)
+
+
+def _write_value(directory, key, value):
+    """派生结果写入目录，返回 manifest 中的描述"""
+    if isinstance(value, pd.DataFrame):
+        periods = _write_frame(os.path.join(directory, f'{key}.arrow'), value)
+        return {'kind': 'frame', 'periods': periods}
+    if isinstance(value, tuple) and all(isinstance(v, np.ndarray) for v in value):
+        for i, array in enumerate(value):
+            if array.dtype == object:
+                # 字符串数组存为定长 Unicode，才能内存映射
+                array = array.astype(str)
+            np.save(os.path.join(directory, f'{key}.{i}.npy'), array)
+        return {'kind': 'arrays', 'count': len(value)}
+    raise TypeError(f'不支持共享的派生结果类型: {type(value).__name__}')
+
+
+def _map_value(directory, key, spec):
+    if spec['kind'] == 'frame':
+        return _map_frame(os.path.join(directory, f'{key}.arrow'), spec['periods'])
+    return tuple(np.load(os.path.join(directory, f'{key}.{i}.npy'), mmap_mode='r')
+                 for i in range(spec['count']))
+
+
+def publish(store, name, df, rollups=ROLLUPS):
+    """把已加载的数据集和派生结果发布为新版本，并原子切换 CURRENT.json"""
+    if not HAS_PYARROW:
+        raise ImportError('共享数据集需要安装 pyarrow')
+    version = df.attrs['dataset_version']
+    root = dataset_dir(store, name)
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, version)
+    if not os.path.isdir(target):
+        tmp = os.path.join(root, f'.{version}.tmp-{os.getpid()}')
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        manifest = {
+            'name': name,
+            'version': version,
+            'rows': len(df),
+            'periods': _write_frame(os.path.join(tmp, TRANSACTIONS_FILE), df),
+            'rollups': {},
+        }
+        done = {}
+        for key, builder in rollups.items():
+            done[key] = builder(df, done)
+            manifest['rollups'][key] = _write_value(tmp, key, done[key])
+        _write_json(os.path.join(tmp, MANIFEST_FILE), manifest)
+        os.rename(tmp, target)
+    _write_json(os.path.join(root, CURRENT_FILE), {'version': version, 'published_at': time.time()})
+    _remove_old_versions(root, version)
+    return target
+
+
+def _remove_old_versions(root, current, keep=KEEP_VERSIONS):
+    """只保留最近的 keep 个版本；已被映射的文件删除后仍可读，直到进程解除映射"""
+    versions = [entry for entry in os.scandir(root) if entry.is_dir() and not entry.name.startswith('.')]
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    kept = 1
+    for entry in versions:
+        if entry.name == current:
+            continue
+        if kept < keep:
+            kept += 1
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def current_version(store, name):
+    """CURRENT.json 中的当前版本，未发布时返回 None"""
+    current = _read_json(os.path.join(dataset_dir(store, name), CURRENT_FILE))
+    return current['version'] if current else None
+
+
+def attach(store, name, version):
+    """以只读内存映射方式打开指定版本，版本不存在时返回 None"""
+    if not HAS_PYARROW:
+        return None
+    directory = os.path.join(dataset_dir(store, name), version)
+    manifest = _read_json(os.path.join(directory, MANIFEST_FILE))
+    if manifest is None:
+        return None
+    df = _map_frame(os.path.join(directory, TRANSACTIONS_FILE), manifest['periods'])
+    df.attrs['dataset_version'] = version
+    df.attrs['shared_dir'] = directory
+    _ATTACHED[directory] = df
+    return df
+
+
+def attach_when_ready(store, path, timeout=30.0, poll=0.5):
+    """等待发布进程发布与数据文件当前版本一致的数据集并映射
+
+    数据集名称取文件名（与 datasets.discover_datasets 一致）。超时仍未发布时
+    返回 None，由调用方自行读取 CSV。
+    """
+    if not HAS_PYARROW:
+        return None
+    name = os.path.splitext(os.path.basename(path))[0]
+    version = get_dataset_version(path)
+    deadline = time.monotonic() + timeout
+    while True:
+        if current_version(store, name) == version:
+            df = attach(store, name, version)
+            if df is not None:
+                return df
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(poll)
+
+
+def attach_rollup(df, key, builder):
+    """共享存储中有预计算的派生结果时直接映射，否则（包括版本目录已被清理）调用 builder() 计算"""
+    directory = df.attrs.get('shared_dir')
+    if directory and _ATTACHED.get(directory) is df:
+        manifest = _read_json(os.path.join(directory, MANIFEST_FILE))
+        spec = manifest['rollups'].get(key) if manifest else None
+        if spec is not None:
+            try:
+                return _map_value(directory, key, spec)
+            except OSError:
+                pass
+    return builder()
+
+
+def publish_all(store):
+    """发布所有数据文件已变化（或尚未发布）的数据集，返回本轮发布的名称"""
+    from data_profile import ensure_profile
+    from datasets import discover_datasets
+    from ingest import load_transactions
+
+    published = []
+    for name, path in discover_datasets().items():
+        if current_version(store, name) == get_dataset_version(path):
+            continue
+        df = load_transactions(path)
+        # 画像边车文件一并生成，工作进程加载时直接读取
+        ensure_profile(df, path)
+        publish(store, name, df)
+        published.append(name)
+    return published
+
+
+def main():
+    parser = argparse.ArgumentParser(description='发布进程：把数据集发布到共享存储，数据文件变化时发布新版本')
+    parser.add_argument('--store', default=os.environ.get('SHARED_DATASET_DIR', '/dev/shm/ecommerce_datasets'))
+    parser.add_argument('--interval', type=float, default=30.0, help='检查数据文件变化的间隔 (秒)')
+    parser.add_argument('--once', action='store_true', help='只发布一轮后退出')
+    args = parser.parse_args()
+
+    while True:
+        started = time.perf_counter()
+        published = publish_all(args.store)
+        if published:
+            versions = ', '.join(f"{name}@{current_version(args.store, name)}" for name in published)
+            print(f"已发布 {versions} ({time.perf_counter() - started:.1f}s)")
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
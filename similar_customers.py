@@ -0,0 +1,185 @@
+"""相似客户检索（“和这位客户相似的客户”）
+
+每个用户嵌入为一个向量：Recency、log(1+订单数)、log(1+消费额) 和各品类消费
+占比（与聚类共用 clustering.customer_features 的特征表），各列标准化后再按行
+做 L2 归一化，两个用户的相似度即向量内积（余弦相似度）。
+
+索引每个数据版本建立一次：
+- 客户数较少时用球树 (sklearn BallTree) 精确检索，单位向量上的欧氏距离与
+  余弦相似度单调对应；未安装 scikit-learn 时直接做一次矩阵-向量乘。
+- 客户数达到 ann_min_customers 时用随机投影哈希 (SimHash) 近似检索：多张
+  哈希表各取若干个超平面的符号作为桶号，查询时取各表同桶（不够时再探测只差
+  一位的相邻桶）的用户作为候选，在候选上按内积精确排序。
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from clustering import ID_COLUMN, feature_columns
+
+try:
+    from sklearn.neighbors import BallTree
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+
+def embed_customers(features):
+    """特征表 → (用户名, 单位向量矩阵, 特征列)"""
+    columns = feature_columns(features)
+    x = features[columns].to_numpy(np.float64)
+    # 整表已在内存中，直接按列标准化（常数列不缩放）
+    std = x.std(axis=0)
+    z = (x - x.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    norms = np.linalg.norm(z, axis=1, keepdims=True)
+    z = np.divide(z, norms, out=np.zeros_like(z), where=norms > 0)
+    return features[ID_COLUMN].to_numpy(), z.astype(np.float32), columns
+
+
+class RandomProjectionIndex:
+    """多表随机超平面哈希 (SimHash) 近似最近邻"""
+
+    def __init__(self, vectors, n_tables=16, n_bits=None, bucket_size=64, seed=0):
+        n, dim = vectors.shape
+        if n_bits is None:
+            n_bits = int(np.clip(np.round(np.log2(max(n, 1) / bucket_size)), 4, 30))
+        self.vectors = vectors
+        self.n_bits = n_bits
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, dim, n_bits)).astype(np.float32)
+        self.weights = (1 << np.arange(n_bits)).astype(np.int64)
+        self.tables = []
+        for planes in self.planes:
+            codes = ((vectors @ planes) > 0).astype(np.int64) @ self.weights
+            order = np.argsort(codes, kind='stable')
+            self.tables.append((codes[order], order))
+
+    def candidates(self, vector, min_candidates):
+        """各表同桶的用户；候选不足 min_candidates 时加上只差一位的相邻桶"""
+        codes = [int(((vector @ planes) > 0).astype(np.int64) @ self.weights) for planes in self.planes]
+        found = []
+        for code, (sorted_codes, order) in zip(codes, self.tables):
+            lo, hi = np.searchsorted(sorted_codes, [code, code + 1])
+            found.append(order[lo:hi])
+        # 候选可能在多张表中重复出现，返回前不去重，由调用方排序后再去重
+        if sum(len(f) for f in found) >= min_candidates:
+            return np.concatenate(found)
+        for code, (sorted_codes, order) in zip(codes, self.tables):
+            probes = code ^ self.weights
+            lo = np.searchsorted(sorted_codes, probes)
+            hi = np.searchsorted(sorted_codes, probes + 1)
+            found.extend(order[a:b] for a, b in zip(lo, hi))
+        return np.concatenate(found)
+
+
+class SimilarCustomerIndex:
+    """按用户名查询最相似客户的索引
+
+    method 为 'auto'、'balltree'、'brute' 或 'lsh'；auto 时客户数不少于
+    ann_min_customers 用随机投影哈希，否则有 sklearn 用球树、没有则暴力内积。
+    """
+
+    def __init__(self, features, method='auto', ann_min_customers=200_000, seed=0):
+        names, vectors, columns = embed_customers(features)
+        order = np.argsort(names, kind='stable')
+        self.names = names[order]
+        self.vectors = vectors[order]
+        self.columns = columns
+        self.features = features.iloc[order].reset_index(drop=True)
+
+        if method == 'auto':
+            if len(names) >= ann_min_customers:
+                method = 'lsh'
+            else:
+                method = 'balltree' if HAS_SKLEARN else 'brute'
+        if method == 'balltree' and not HAS_SKLEARN:
+            method = 'brute'
+        self.method = method
+
+        started = time.perf_counter()
+        if method == 'balltree':
+            self.tree = BallTree(self.vectors)
+        elif method == 'lsh':
+            self.tree = RandomProjectionIndex(self.vectors, seed=seed)
+        self.build_seconds = time.perf_counter() - started
+
+    def _position(self, user_name):
+        pos = int(np.searchsorted(self.names, user_name))
+        if pos < len(self.names) and self.names[pos] == user_name:
+            return pos
+        return None
+
+    def neighbors(self, pos, k=10):
+        """第 pos 个用户的 k 个最相似用户（不含自己），返回 (位置, 相似度)"""
+        vector = self.vectors[pos]
+        k = min(k, len(self.names) - 1)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.method == 'balltree':
+            _, idx = self.tree.query(vector[None, :], k=k + 1)
+            candidates = idx[0]
+        elif self.method == 'lsh':
+            candidates = self.tree.candidates(vector, min_candidates=20 * (k + 1))
+        else:
+            candidates = np.arange(len(self.names))
+        candidates = candidates[candidates != pos]
+        similarity = self.vectors[candidates] @ vector
+        if self.method == 'lsh':
+            # 同一用户最多在每张表中各出现一次，先取足够多的高分候选再去重
+            keep = min(len(candidates), k * len(self.tree.tables))
+            head = np.argpartition(-similarity, keep - 1)[:keep] if keep < len(candidates) else np.arange(keep)
+            candidates, first = np.unique(candidates[head], return_index=True)
+            similarity = similarity[head][first]
+        top = np.argsort(-similarity, kind='stable')[:k]
+        return candidates[top], similarity[top]
+
+    def query(self, user_name, k=10):
+        """与 user_name 最相似的 k 个客户及其特征；用户不存在时返回 None"""
+        pos = self._position(user_name)
+        if pos is None:
+            return None
+        idx, similarity = self.neighbors(pos, k)
+        result = self.features.iloc[idx].reset_index(drop=True)
+        result.insert(1, 'Similarity', similarity.astype(np.float64))
+        return result
+
+
+if __name__ == '__main__':
+    # 性能测试：100 万客户、8 个品类；近似检索的 recall@10 以暴力检索为准
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(0)
+    categories = [f'Share_C{i}' for i in range(8)]
+    # 品类偏好按 20 个原型生成，使相似客户确实存在
+    prototypes = rng.dirichlet(np.ones(8) * 0.5, 20)
+    group = rng.integers(0, 20, n)
+    features = pd.DataFrame({
+        ID_COLUMN: np.char.add('U', np.arange(n).astype(str)),
+        'Recency': rng.exponential(120, n),
+        'Log_Frequency': np.log1p(rng.poisson(6, n)),
+        'Log_Monetary': rng.normal(7, 1, n),
+    })
+    shares = rng.gamma(prototypes[group] * 30 + 0.1)
+    features[categories] = shares / shares.sum(axis=1, keepdims=True)
+
+    for method in ['lsh', 'balltree'] if HAS_SKLEARN else ['lsh']:
+        started = time.perf_counter()
+        index = SimilarCustomerIndex(features, method=method)
+        build = time.perf_counter() - started
+        queries = rng.integers(0, n, 200)
+        started = time.perf_counter()
+        results = [index.neighbors(q, 10)[0] for q in queries]
+        per_query = (time.perf_counter() - started) / len(queries) * 1000
+        recall = []
+        for q, found in zip(queries, results):
+            exact = np.argsort(-(index.vectors @ index.vectors[q]), kind='stable')
+            exact = exact[exact != q][:10]
+            recall.append(len(np.intersect1d(found, exact)) / 10)
+        print(f'{method:>8}: 建索引 {build:.2f}s, 查询 {per_query:.2f} ms/次, recall@10 {np.mean(recall):.3f}')
+
+    started = time.perf_counter()
+    for q in queries[:20]:
+        np.argsort(-(index.vectors @ index.vectors[q]))[:11]
+    print(f'   brute: 查询 {(time.perf_counter() - started) / 20 * 1000:.2f} ms/次')
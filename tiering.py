@@ -0,0 +1,156 @@
+"""声明式分层规则：阈值表或分位数规则编译为向量化分箱
+
+分层定义放在 tiers.json（可用环境变量 TIERS_FILE 指向其他文件），分析人员
+修改分层边界或标签不需要改代码。每条规则：
+
+    {
+        "column": "Total_Spend",          # 说明用途的源列名（可选）
+        "labels": ["Low", "Medium", "High"],
+        "edges": [0, 25, 40, 60, 100],    # 阈值表：len(labels) + 1 个边界，"-inf"/"inf" 表示无界
+        "quantiles": [0.33, 0.66],        # 或分位数规则：len(labels) - 1 个内部分位点，两端无界
+        "closed": "right",                # right: (a, b]；left: [a, b)
+        "missing": "Insufficient Data"    # 缺失值的标签（可选，不给则为 NaN）
+    }
+
+分箱用一次 np.searchsorted 得到每个值所在区间，结果是有序的 pd.Categorical；
+超出边界的值与 pd.cut 一样为 NaN。分位数规则在传入的数据上计算分位点（忽略
+缺失值，线性插值，与 Series.quantile 一致）。
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+TIERS_FILE = os.environ.get('TIERS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiers.json'))
+
+
+def _edge(value):
+    """JSON 中的边界：数值或 "-inf"/"inf" 字符串"""
+    return float(value)
+
+
+class TierRule:
+    """一条分层规则"""
+
+    def __init__(self, name, labels, edges=None, quantiles=None, closed='right', missing=None, column=None):
+        if (edges is None) == (quantiles is None):
+            raise ValueError(f'分层 {name}: edges 和 quantiles 必须且只能给出一个')
+        if closed not in ('right', 'left'):
+            raise ValueError(f'分层 {name}: closed 只能是 right 或 left')
+        self.name = name
+        self.column = column
+        self.labels = list(labels)
+        self.closed = closed
+        self.missing = missing
+        self.edges = None if edges is None else np.array([_edge(e) for e in edges], dtype=np.float64)
+        self.quantiles = None if quantiles is None else np.array(quantiles, dtype=np.float64)
+        expected = len(self.labels) + 1 if edges is not None else len(self.labels) - 1
+        given = len(self.edges) if edges is not None else len(self.quantiles)
+        if given != expected:
+            raise ValueError(f'分层 {name}: {len(self.labels)} 个标签需要 {expected} 个'
+                             f'{"边界" if edges is not None else "分位点"}，实际 {given} 个')
+        if self.edges is not None and np.any(np.diff(self.edges) <= 0):
+            raise ValueError(f'分层 {name}: 边界必须严格递增')
+
+    @classmethod
+    def from_dict(cls, name, spec):
+        return cls(name, spec['labels'], spec.get('edges'), spec.get('quantiles'),
+                   spec.get('closed', 'right'), spec.get('missing'), spec.get('column'))
+
+    def resolve_edges(self, values):
+        """实际使用的边界；分位数规则在 values 上计算"""
+        if self.edges is not None:
+            return self.edges
+        x = np.asarray(values, dtype=np.float64)
+        x = x[~np.isnan(x)]
+        inner = np.quantile(x, self.quantiles) if len(x) else np.full(len(self.quantiles), np.nan)
+        return np.concatenate(([-np.inf], inner, [np.inf]))
+
+    def codes(self, values, edges=None):
+        """每个值的分层编码：0..len(labels)-1，缺失为 len(labels)（有 missing 标签时）或 -1"""
+        x = np.asarray(values, dtype=np.float64)
+        if edges is None:
+            edges = self.resolve_edges(x)
+        # (a, b]：第一个 >= x 的边界位置减一；[a, b)：第一个 > x 的边界位置减一
+        side = 'left' if self.closed == 'right' else 'right'
+        idx = np.searchsorted(edges, x, side=side) - 1
+        n = len(self.labels)
+        nan = np.isnan(x)
+        codes = np.where((idx >= 0) & (idx < n) & ~nan, idx, -1)
+        if self.missing is not None:
+            codes[nan] = n
+        return codes.astype(np.int8 if n < 127 else np.int32)
+
+    def categories(self):
+        return self.labels + ([self.missing] if self.missing is not None else [])
+
+    def assign(self, values, edges=None):
+        """分层结果：有序 Categorical；传入 Series 时返回带相同索引的 Series"""
+        result = pd.Categorical.from_codes(self.codes(values, edges), categories=self.categories(), ordered=True)
+        if isinstance(values, pd.Series):
+            return pd.Series(result, index=values.index, name=values.name)
+        return result
+
+
+def load_tiers(path=None):
+    """读取分层定义文件，返回 {名称: TierRule}"""
+    with open(path or TIERS_FILE, encoding='utf-8') as f:
+        specs = json.load(f)
+    return {name: TierRule.from_dict(name, spec) for name, spec in specs.items()}
+
+
+if __name__ == '__main__':
+    # 性能测试：500 万用户，逐行 apply/map 与向量化分层对比（结果逐一核对）
+    import time
+
+    n = 5_000_000
+    rng = np.random.default_rng(0)
+    users = pd.DataFrame({
+        'Total_Spend': rng.lognormal(7, 1, n),
+        'Total_Orders': rng.poisson(3, n) + 1,
+        'Interpurchase_Median': np.where(rng.random(n) < 0.3, np.nan, rng.exponential(60, n)),
+        'Age': rng.integers(18, 80, n),
+    })
+    tiers = load_tiers()
+
+    # 电商分析.py 原来的逐行实现
+    quantiles = users['Total_Spend'].quantile([0.33, 0.66])
+    def spending_level(x):
+        if x <= quantiles.iloc[0]:
+            return "Low Value"
+        elif x <= quantiles.iloc[1]:
+            return "Medium Value"
+        else:
+            return "High Value"
+
+    def freq_tier(n):
+        if n == 1: return "1 (No Repeat)"
+        elif 2 <= n <= 3: return "2-3"
+        elif 4 <= n <= 6: return "4-6"
+        else: return "7+"
+
+    q1, q2 = users['Interpurchase_Median'].dropna().quantile([0.33, 0.66])
+    def ipd_tier(x):
+        if pd.isna(x): return "Insufficient Data"
+        elif x <= q1: return "Fast"
+        elif x <= q2: return "Medium"
+        else: return "Slow"
+
+    cases = [
+        ('spending_level', 'Total_Spend', lambda s: s.apply(spending_level)),
+        ('freq_tier', 'Total_Orders', lambda s: s.map(freq_tier)),
+        ('ipd_tier', 'Interpurchase_Median', lambda s: s.map(ipd_tier)),
+        ('age_group', 'Age', lambda s: pd.cut(s, bins=[0, 25, 40, 60, 100], right=False,
+                                              labels=tiers['age_group'].labels)),
+    ]
+    print(f'{n:,} 用户')
+    for name, column, baseline in cases:
+        started = time.perf_counter()
+        expected = baseline(users[column])
+        t_base = time.perf_counter() - started
+        started = time.perf_counter()
+        result = tiers[name].assign(users[column])
+        t_rule = time.perf_counter() - started
+        same = (result.astype(str) == expected.astype(str)).all()
+        print(f'{name:>15}: 原实现 {t_base:6.2f}s, 分层规则 {t_rule:6.3f}s ({t_base / t_rule:5.0f}x), 结果一致: {same}')
@@ -116,16 +116,10 @@ bins = [0, 25, 40, 60, 100]
 labels = ["Youth (<=25)", "Young Adult (26-40)", "Middle-aged (41-60)", "Senior (60+)"]
 user_summary["Age_Group"] = pd.cut(user_summary["Age"], bins=bins, labels=labels)
 
-# 消费金额分层（基于总消费的分位数）
-quantiles = user_summary["Total_Spend"].quantile([0.33, 0.66])
-def spending_level(x):
-    if x <= quantiles.iloc[0]:
-        return "Low Value"
-    elif x <= quantiles.iloc[1]:
-        return "Medium Value"
-    else:
-        return "High Value"
-user_summary["Spending_Level"] = user_summary["Total_Spend"].apply(spending_level)
+# 消费金额分层（基于总消费的分位数，分层定义见 tiers.json）
+from tiering import load_tiers
+tiers = load_tiers()
+user_summary["Spending_Level"] = tiers["spending_level"].assign(user_summary["Total_Spend"])
 
 print(user_summary.head())
 
@@ -149,9 +143,11 @@ print(f"复购率: {repurchase_rate:.2%}")
 # 确保 Transaction_Date 是日期格式
 df["Transaction_Date"] = pd.to_datetime(df["Transaction_Date"])
 
-# 为每个用户的订单添加序号 (Order_Idx)
-df_sorted = df.sort_values(["User_Name", "Transaction_Date"]).reset_index(drop=True)
-df_sorted["Order_Idx"] = df_sorted.groupby("User_Name").cumcount() + 1
+# 为每个用户的订单添加序号 (Order_Idx) 并计算顺序指标
+# 首购/第二购日期、购买间隔、中位购买间隔由 seq_kernels 一次遍历排序数组得到
+# (安装了 Numba 时走 JIT 内核，否则回退到 NumPy 向量化实现)
+from seq_kernels import user_sequence_metrics
+user_seq_metrics, df_sorted = user_sequence_metrics(df, return_sorted=True)
 
 # --- 2. 计算用户级别的核心指标 ---
 # 聚合用户数据
@@ -159,45 +155,27 @@ user_grouped = df_sorted.groupby("User_Name")
 user_summary_advanced = user_grouped.agg({
     "Age": "first",
     "Country": "first",
-    "Purchase_Amount": ["sum", "mean", "count"],
-    "Transaction_Date": ["min", lambda x: x.iloc[1] if len(x) > 1 else pd.NaT] # 首购和第二购日期
+    "Purchase_Amount": ["sum", "mean", "count"]
 }).copy()
 
 # 展平多级列索引并重命名
 user_summary_advanced.columns = [
-    "Age", "Country", "Total_Spend", "Avg_Spend", "Total_Orders",
-    "First_Purchase", "Second_Purchase"
+    "Age", "Country", "Total_Spend", "Avg_Spend", "Total_Orders"
 ]
 user_summary_advanced.reset_index(inplace=True)
 
-# 计算购买间隔 (Days_to_2nd)
-user_summary_advanced["Days_to_2nd"] = (
-    user_summary_advanced["Second_Purchase"] - user_summary_advanced["First_Purchase"]
-).dt.days
-
-# 计算用户中位购买间隔 (Interpurchase_Median)
-df_sorted["Prev_Date"] = df_sorted.groupby("User_Name")["Transaction_Date"].shift(1)
-df_sorted["Interpurchase_Days"] = (df_sorted["Transaction_Date"] - df_sorted["Prev_Date"]).dt.days
-user_ipd_median = df_sorted.dropna(subset=["Interpurchase_Days"]).groupby("User_Name")["Interpurchase_Days"].median()
-user_summary_advanced = user_summary_advanced.merge(user_ipd_median.rename("Interpurchase_Median"), on="User_Name", how="left")
+# 首购日期、第二购日期、购买间隔 (Days_to_2nd) 和用户中位购买间隔 (Interpurchase_Median)
+user_summary_advanced = user_summary_advanced.merge(
+    user_seq_metrics[["User_Name", "First_Purchase", "Second_Purchase", "Days_to_2nd", "Interpurchase_Median"]],
+    on="User_Name", how="left"
+)
 
 # --- 3. 用户分层 ---
-# 频次分层 (Frequency Tier)
-def freq_tier(n):
-    if n == 1: return "1 (No Repeat)"
-    elif 2 <= n <= 3: return "2-3"
-    elif 4 <= n <= 6: return "4-6"
-    else: return "7+"
-user_summary_advanced["Freq_Tier"] = user_summary_advanced["Total_Orders"].map(freq_tier)
-
-# 复购节奏分层 (Interpurchase Time Tier)
-q1, q2 = user_summary_advanced["Interpurchase_Median"].dropna().quantile([0.33, 0.66])
-def ipd_tier(x):
-    if pd.isna(x): return "Insufficient Data"
-    elif x <= q1: return "Fast"
-    elif x <= q2: return "Medium"
-    else: return "Slow"
-user_summary_advanced["IPD_Tier"] = user_summary_advanced["Interpurchase_Median"].map(ipd_tier)
+# 频次分层 (Frequency Tier)：1 / 2-3 / 4-6 / 7+
+user_summary_advanced["Freq_Tier"] = tiers["freq_tier"].assign(user_summary_advanced["Total_Orders"])
+
+# 复购节奏分层 (Interpurchase Time Tier)：按中位购买间隔的 33%/66% 分位数，只有一笔订单的用户为 Insufficient Data
+user_summary_advanced["IPD_Tier"] = tiers["ipd_tier"].assign(user_summary_advanced["Interpurchase_Median"])
 
 # --- 4. 计算并输出结果 ---
 # 整体复购率
@@ -379,16 +357,17 @@ print("\n[分析建议] '热销产品'是收入的主要来源，应保证库存
 
 
 # --- 2.2 销售集中度分析 ---
-# 计算总销售额
-total_revenue = df['Purchase_Amount'].sum()
-
-# 在之前聚合好的 product_summary 表中增加销售额占比和累计占比
-product_summary_sorted = hot_selling_by_sales.copy()
-product_summary_sorted['Sales_Percentage'] = (product_summary_sorted['Total_Sales'] / total_revenue) * 100
-product_summary_sorted['Cumulative_Percentage'] = product_summary_sorted['Sales_Percentage'].cumsum()
+# 销售额占比、累计占比、基尼系数和 HHI 由 concentration 引擎一次排序得到（仪表板共用同一实现）
+from concentration import concentration
+category_concentration = concentration(hot_selling_by_sales['Product_Category'], hot_selling_by_sales['Total_Sales'])
+product_summary_sorted = category_concentration['pareto'].rename(columns={
+    'Label': 'Product_Category', 'Value': 'Total_Sales',
+    'Share': 'Sales_Percentage', 'Cumulative_Share': 'Cumulative_Percentage'
+})
 
 print("\n--- 各产品类别的销售额贡献及累计贡献 ---")
 print(product_summary_sorted[['Product_Category', 'Total_Sales', 'Sales_Percentage', 'Cumulative_Percentage']])
+print(f"品类基尼系数: {category_concentration['gini']:.3f}, HHI: {category_concentration['hhi']:,.0f}")
 
 # 找出贡献了前80%销售额的产品类别 (帕累托分析/80-20法则)
 pareto_products = product_summary_sorted[product_summary_sorted['Cumulative_Percentage'] <= 80]